@@ -1,12 +1,27 @@
+import os
+import re
+import subprocess
 from collections import OrderedDict
-from typing import Generic, TypeVar
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
 from pathlib import Path
 
 import remote_runner
-from remote_runner.utility import ChangeDirectory
-
-from .executables import PmemdCommand, SanderCommand, TleapCommand
-from .inputs import AmberInput, TleapInput
+from remote_runner.errors import StopCalculationError
+from remote_runner.utility import ChangeDirectory, self_logger as _logger
+
+from .autotune import RankAutotuner
+from .command import ScopeArguments
+from .engines import EngineSelector
+from .executables import CpptrajCommand, MMPBSACommand, ParmedCommand, PmemdCommand, SanderCommand, TleapCommand
+from .health import ScopeNamelistValues, SegmentHealthCheck, SegmentHealthError
+from .inputs import AmberInput, CpptrajInput, MMPBSAInput, ParmedInput, TleapInput
+from .manifest import OutputManifest
+from .plan import ProtocolPlan
+from .registry import ProtocolRegistry
+from .retention import RetentionPolicy
+from .schedule import RestraintSchedule
+from .store import InputStore
+from .trajectory import FrameIndex, TrajectoryCompaction
 
 CommandType = TypeVar('CommandType')
 InputType = TypeVar("InputType")
@@ -14,6 +29,7 @@ InputType = TypeVar("InputType")
 
 class Step:
     step_dir: Path
+    engine: Optional[str] = None  # last engine picked by `MdProtocol.engine_selector`
 
     def __init__(self, name):
         self.name = name
@@ -22,16 +38,60 @@ class Step:
     def run(self, md: 'MdProtocol'):
         raise NotImplementedError()
 
+    def plan(self, md: 'MdProtocol', plan: 'ProtocolPlan'):
+        """ Dry run of `run()`, renders inputs and commands into `plan` (see `MdProtocol.plan()`) """
+        plan.unplanned(self)
+
+    def summary(self):
+        return dict(name=self.name, is_complete=self.is_complete, engine=self.engine)
+
+    def engine_scope(self, md: 'MdProtocol', inp: AmberInput) -> ScopeArguments:
+        """ Temporarily switches `md.sander` to the engine selected for `inp`, see `MdProtocol.engine_selector` """
+        selector: Optional[EngineSelector] = getattr(md, "engine_selector", None)
+        if selector is None:
+            return ScopeArguments(md.sander, {})
+        spec = selector.select(inp)
+        if self.engine != spec.name:
+            _logger(self).info(f"{spec.name} selected")
+        self.engine = spec.name
+        return selector.scope(md.sander, spec)
+
+
+class StepReference:
+    """
+    Placeholder of a Step persisted in its own file (see `MdProtocol.lazy_steps`)
+    """
+
+    def __init__(self, filename: Path, digest: str, summary: dict):
+        self.filename = filename
+        self.digest = digest
+        self.summary = summary
+
+    @property
+    def is_complete(self):
+        return self.summary["is_complete"]
+
 
 class CommandWithInput(Generic[CommandType, InputType]):
-    def __init__(self, exe: CommandType, inp: InputType):
+    store: Optional[InputStore] = None
+
+    def __init__(self, exe: CommandType, inp: InputType, store: Optional[InputStore] = None):
         self.exe = exe
         self.input = inp
+        if store is not None:
+            self.store = store
 
     def run(self, **kwargs):
         input_filename = Path(self.exe.input)
-        with input_filename.open("w") as inp:
-            self.input.write(inp)
+        if self.store is not None:
+            self.store.write(self.input, input_filename)
+        else:
+            try:
+                os.unlink(input_filename)  # may be a read-only link to `InputStore`
+            except FileNotFoundError:
+                pass
+            with input_filename.open("w") as inp:
+                self.input.write(inp)
         return self.exe.run(**kwargs)
 
 
@@ -39,7 +99,6 @@ class Build(Step):
     def __init__(self, name):
         super().__init__(name)
         self.tleap = CommandWithInput(exe=TleapCommand(), inp=TleapInput())
-        # self.parmed = CommandWithInput(exe=ParmedCommand(), inp=ParmedInput())
 
     def run(self, md: 'MdProtocol'):
         self.tleap.input.output_dir = self.step_dir
@@ -54,19 +113,232 @@ class Build(Step):
         assert frame_incrd.exists()
         md.sander.inpcrd = frame_incrd
 
+    def plan(self, md: 'MdProtocol', plan: 'ProtocolPlan'):
+        self.tleap.input.output_dir = self.step_dir
+        self.tleap.exe.input = self.step_dir / 'tleap.in'
+        plan.render(self, self.tleap.exe, self.tleap.input)
+        md.sander.prmtop = self.step_dir / f"{self.tleap.input.frame}.prmtop"
+        md.sander.inpcrd = self.step_dir / f"{self.tleap.input.frame}.rst7"
+        plan.produce([md.sander.prmtop, md.sander.inpcrd])
+
+
+class BoxOptimization(Step):
+    """
+    Chooses periodic box with the smallest predicted atom count and adds solvation commands to `Build` step
+
+    Must precede the `build` step; `solute` is a PDB file with solute coordinates.
+    Commands are inserted after the last assignment of the frame (e.g. ``loadpdb``), so later commands such as
+    ``addions`` act on the solvated system; the build input must not solvate on its own.
+    Rectangular box is considered only if `rotation_safe` is False. Options are reported to `box.json`
+    """
+
+    def __init__(self, name, solute: Path, min_image_distance: float = 24.0, water_model: str = "TIP3PBOX",
+                 rotation_safe: bool = True, build: str = "build"):
+        super().__init__(name)
+        self.solute = Path(solute)
+        self.min_image_distance = min_image_distance
+        self.water_model = water_model
+        self.rotation_safe = rotation_safe
+        self.build = build
+        self.selected = None
+
+    def run(self, md: 'MdProtocol'):
+        import json
+        from .box import box_options, read_pdb_coordinates
+
+        options = box_options(read_pdb_coordinates(self.solute), self.min_image_distance, self.water_model)
+        with (self.step_dir / "box.json").open("w") as out:
+            json.dump([option.as_dict() for option in options], out, indent=1)
+        selected = next(option for option in options if option.rotation_safe or not self.rotation_safe)
+        tleap_input: TleapInput = getattr(md, self.build).tleap.input
+        commands = tleap_input.commands
+        if any(command.split()[:1] in (["solvatebox"], ["solvateoct"]) for command in commands):
+            raise RuntimeError(f"{self.build} step already contains solvation commands")
+        loads = [i for i, command in enumerate(commands) if re.match(rf"{re.escape(tleap_input.frame)}\s*=", command)]
+        if not loads:
+            raise RuntimeError(f"{self.build} step doesn't create `{tleap_input.frame}` to solvate")
+        # solvate right after the solute is assembled, before e.g. `addions`
+        commands[loads[-1] + 1:loads[-1] + 1] = selected.commands(tleap_input.frame, self.water_model)
+        self.selected = selected.as_dict()
+        _logger(self).info(f"{selected.shape} box selected, {selected.predicted_atoms} atoms predicted")
+
+
+class HydrogenMassRepartition(Step):
+    """
+    Runs parmed `HMassRepartition` on `md.sander.prmtop` and replaces it with the repartitioned topology
+
+    Commands added to `parmed.input` are executed before repartitioning.
+    Use `rescale_timestep()` to adjust downstream inputs
+    """
+    rescaled_keys = ["nstlim", "ntpr", "ntwx", "ntwv", "ntwe", "ntwr"]
+
+    def __init__(self, name, hydrogen_mass: float = 3.024, dowater: bool = False):
+        super().__init__(name)
+        self.hydrogen_mass = hydrogen_mass
+        self.dowater = dowater
+        self.parmed = CommandWithInput(exe=ParmedCommand(), inp=ParmedInput())
+        self.parmed.exe.no_splash = True
+        self.parmed.exe.override = True
+
+    def run(self, md: 'MdProtocol'):
+        call, prmtop = self.repartition(md)
+        call.run()
+        assert prmtop.exists()
+        md.sander.prmtop = prmtop
+
+    def plan(self, md: 'MdProtocol', plan: 'ProtocolPlan'):
+        call, prmtop = self.repartition(md)
+        plan.render(self, call.exe, call.input, inputs=[md.sander.prmtop])
+        plan.produce([prmtop])
+        md.sander.prmtop = prmtop
+
+    def repartition(self, md: 'MdProtocol') -> Tuple[CommandWithInput[ParmedCommand, ParmedInput], Path]:
+        """ parmed call repartitioning `md.sander.prmtop` and the resulting topology """
+        output_name = self.step_dir / f"{Path(md.sander.prmtop).stem}.hmr"
+        inp = ParmedInput()
+        for command in self.parmed.input.commands:
+            inp.add_command(command)
+        inp.hmass_repartition(self.hydrogen_mass, self.dowater)
+        inp.save(output_name)
+
+        self.parmed.exe.prmtop = md.sander.prmtop
+        self.parmed.exe.input = self.step_dir / "parmed.in"
+        return CommandWithInput(self.parmed.exe, inp), Path(f"{output_name}.prmtop")
+
+    @classmethod
+    def rescale_timestep(cls, *inputs: AmberInput, factor: int = 2, max_dt: float = 0.004):
+        """
+        Multiplies `dt` by `factor` and divides step counts (`nstlim`, output frequencies,
+        `&wt` istep ranges) to keep simulated time and output times unchanged.
+        Minimization inputs are left intact. Inputs are validated before any modification
+        """
+        dynamics = [inp for inp in inputs if inp.cntrl.get("imin", 0) == 0]
+        for inp in dynamics:
+            cntrl = inp.cntrl
+            if cntrl.get("ntc", 1) < 2:
+                raise RuntimeError("cntrl.ntc>=2 (SHAKE) is required to increase time step")
+            if cntrl.get("dt", 0.001) * factor > max_dt + 1e-9:
+                raise RuntimeError(f"cntrl.dt={cntrl.get('dt', 0.001)} * {factor} exceeds {max_dt}")
+            for key in cls.rescaled_keys:
+                if cntrl.get(key, 0) > 0 and cntrl[key] % factor != 0:
+                    raise RuntimeError(f"cntrl.{key}={cntrl[key]} is not divisible by {factor}")
+        for inp in dynamics:
+            cntrl = inp.cntrl
+            cntrl["dt"] = cntrl.get("dt", 0.001) * factor
+            for key in cls.rescaled_keys:
+                if cntrl.get(key, 0) > 0:
+                    cntrl[key] = cntrl[key] // factor
+            for wt in inp.varying_conditions.wts:
+                if "istep1" in wt:
+                    wt["istep1"] = -(-wt["istep1"] // factor)
+                if "istep2" in wt:
+                    wt["istep2"] = wt["istep2"] // factor
+
 
 class SingleSanderCall(Step):
+    convergence = None  # `amber_runner.convergence.ConvergenceMonitor` allowing to stop before `nstlim`
+    convergence_chunks = 10  # number of pieces `nstlim` is split into when `convergence` is set
+    current_chunk = 0  # chunks already run and checkpointed by `run_until_converged`
+
     def __init__(self, name):
         super().__init__(name)
         self.input = AmberInput()
 
     def run(self, md: 'MdProtocol'):
-        with md.sander.scope_args(output_prefix=str(self.step_dir / self.name)) as exe:
-            CommandWithInput(exe, self.input).run()
+        if self.convergence is not None:
+            self.run_until_converged(md)
+            return
+        with self.engine_scope(md, self.input), \
+                md.sander.scope_args(output_prefix=str(self.step_dir / self.name)) as exe:
+            CommandWithInput(exe, self.input, md.input_store).run()
             md.sander.inpcrd = md.sander.restrt
 
+    def plan(self, md: 'MdProtocol', plan: 'ProtocolPlan'):
+        with self.engine_scope(md, self.input), \
+                md.sander.scope_args(output_prefix=str(self.step_dir / self.name)) as exe:
+            plan.sander_call(self, exe, self.input)
+            md.sander.inpcrd = md.sander.restrt
+
+    def run_until_converged(self, md: 'MdProtocol'):
+        """
+        Runs `input` as `convergence_chunks` consecutive restarts, stops as soon as criteria are met.
+        Protocol is checkpointed after every chunk, interrupted run resumes from the next chunk
+        """
+        cntrl = self.input.namelist.get("cntrl", {})
+        if cntrl.get("imin", 0) != 0 or self.input.varying_conditions.wts:
+            raise ValueError(f"{self.name}: early termination requires MD input without &wt schedule")
+        nstlim = cntrl.get("nstlim", 1)
+        if nstlim % self.convergence_chunks != 0:
+            raise ValueError(f"{self.name}: nstlim={nstlim} is not divisible into {self.convergence_chunks} chunks")
+        chunk = dict(nstlim=nstlim // self.convergence_chunks)
+        while self.current_chunk < self.convergence_chunks and not self.convergence.converged:
+            i = self.current_chunk
+            settings = {"cntrl": dict(chunk, irest=1, ntx=5) if i > 0 else chunk}
+            with self.engine_scope(md, self.input), ScopeNamelistValues(self.input, settings), \
+                    md.sander.scope_args(output_prefix=str(self.step_dir / f"{self.name}.{i:03d}")) as exe:
+                CommandWithInput(exe, self.input, md.input_store).run()
+                md.sander.inpcrd = md.sander.restrt
+                self.convergence.update(exe.mdout)
+            self.current_chunk += 1
+            if self.convergence.converged:
+                _logger(self).info(f"{self.name} converged after {i + 1} of {self.convergence_chunks} chunks")
+            md.checkpoint()
+
+
+class ScheduledSanderCall(Step):
+    """
+    MD of `nstlim` steps with time-dependent restraints described by `schedule`
+
+    Schedule is compiled into as few engine runs as Amber allows (see `amber_runner.schedule`),
+    every run continues from the previous restart and is checkpointed
+    """
+
+    def __init__(self, name, nstlim: int):
+        super().__init__(name)
+        self.input = AmberInput()
+        self.schedule = RestraintSchedule(nstlim)
+        self.current_run = 0
+
+    def run(self, md: 'MdProtocol'):
+        runs = self.compile()
+        while self.current_run < len(runs):
+            inp = runs[self.current_run].input(self.input, continuation=self.current_run > 0)
+            with self.engine_scope(md, inp), \
+                    md.sander.scope_args(output_prefix=str(self.segment_prefix(self.current_run))) as exe:
+                CommandWithInput(exe, inp, md.input_store).run()
+                md.sander.inpcrd = md.sander.restrt
+            self.current_run += 1
+            md.checkpoint()
+
+    def plan(self, md: 'MdProtocol', plan: 'ProtocolPlan'):
+        runs = self.compile()
+        for i in range(self.current_run, len(runs)):
+            inp = runs[i].input(self.input, continuation=i > 0)
+            with self.engine_scope(md, inp), md.sander.scope_args(output_prefix=str(self.segment_prefix(i))) as exe:
+                plan.sander_call(self, exe, inp, segment=i)
+                md.sander.inpcrd = md.sander.restrt
+
+    def compile(self):
+        runs = self.schedule.compile()
+        if len(runs) > 1 and self.input.varying_conditions.wts:
+            raise ValueError(f"{self.name}: &wt conditions of input can't be split into {len(runs)} runs")
+        return runs
+
+    def segment_prefix(self, i: int) -> Path:
+        return self.step_dir / f"{self.name}.{i:03d}"
+
 
 class RepeatedSanderCall(Step):
+    compaction: Optional[TrajectoryCompaction] = None
+    health_check: Optional[SegmentHealthCheck] = None
+    retention: Optional[RetentionPolicy] = None
+    retention_position = 0  # segments before it are already processed by retention policy
+    compaction_position = 0  # segments before it are already submitted to `compaction`
+    autotune: Optional[RankAutotuner] = None
+    tuned_executable: Optional[List[str]] = None  # `md.sander.executable` picked by `autotune`
+    autotuned = False  # `autotune` was applied, `tuned_executable` stays None if selected engine is not MPI
+    convergence = None  # `amber_runner.convergence.ConvergenceMonitor` allowing to end before `number_of_steps`
+
     def __init__(self, name: str, number_of_steps: int):
         self.current_step = 0
         self.number_of_steps = number_of_steps
@@ -75,13 +347,134 @@ class RepeatedSanderCall(Step):
 
     def run(self, md: 'MdProtocol'):
         while self.current_step < self.number_of_steps:
-            self.before_call(md)
-            with md.sander.scope_args(output_prefix=str(self.step_dir / f"{self.name}{self.current_step:05d}")) as exe:
-                CommandWithInput(exe, self.input).run()
-                md.sander.inpcrd = md.sander.restrt
-            self.after_call(md)
-            self.current_step += 1
+            self.run_next_segment(md)
+        self.finish(md)
+
+    def run_next_segment(self, md: 'MdProtocol'):
+        """ Runs and checkpoints a single segment """
+        if self.autotune is not None and not self.autotuned:
+            self.tuned_executable = self.autotune.tune(md, self)
+            self.autotuned = True
             md.checkpoint()
+        self.before_call(md)
+        self.run_segment(md)
+        self.after_call(md)
+        md.record_outputs(self, segment=self.current_step)
+        self.current_step += 1
+        self.check_convergence()
+        md.checkpoint()
+        self.compact_trajectories(md)
+        self.apply_retention(md)
+
+    def check_convergence(self):
+        """ Ends the step early if `convergence` criteria are met by the segments run so far """
+        if self.convergence is None:
+            return
+        self.convergence.update(Path(f"{self.segment_prefix(self.current_step - 1)}.out"))
+        if self.current_step < self.number_of_steps and self.convergence.converged:
+            _logger(self).info(f"{self.name} converged after {self.current_step} of {self.number_of_steps} segments")
+            self.number_of_steps = self.current_step
+
+    def wait_background(self):
+        """ Waits for background compaction and retention jobs """
+        if self.compaction is not None:
+            self.compaction.wait()
+        if self.retention is not None:
+            self.retention.wait()
+
+    def finish(self, md: 'MdProtocol'):
+        self.compact_trajectories(md, flush=True)
+        self.wait_background()
+
+    def run_segment(self, md: 'MdProtocol'):
+        arguments = self.segment_arguments(self.current_step)
+        with self.engine_scope(md, self.input), md.sander.scope_args(**arguments) as exe:
+            if self.health_check is None:
+                CommandWithInput(exe, self.input, md.input_store).run()
+                md.sander.inpcrd = md.sander.restrt
+                return
+
+            last_good_restrt = exe.inpcrd
+            for settings in [{}] + self.health_check.retry_settings:
+                with ScopeNamelistValues(self.input, settings):
+                    try:
+                        CommandWithInput(exe, self.input, md.input_store).run()
+                        problems = self.health_check.check(exe.mdout, exe.restrt, last_good_restrt)
+                    except subprocess.CalledProcessError as e:
+                        problems = [str(e)]
+                if not problems:
+                    md.sander.inpcrd = md.sander.restrt
+                    return
+                _logger(self).warning(f"Segment {exe.output_prefix} failed: {'; '.join(problems)}")
+            raise SegmentHealthError(f"Segment {exe.output_prefix} failed: {'; '.join(problems)}")
+
+    def plan(self, md: 'MdProtocol', plan: 'ProtocolPlan'):
+        """ Plans remaining segments, `before_call()` and `after_call()` hooks are not called """
+        for i in range(self.current_step, self.number_of_steps):
+            with self.engine_scope(md, self.input), md.sander.scope_args(**self.segment_arguments(i)) as exe:
+                plan.sander_call(self, exe, self.input, segment=i)
+                md.sander.inpcrd = md.sander.restrt
+
+    def segment_arguments(self, i: int) -> dict:
+        arguments = dict(output_prefix=str(self.segment_prefix(i)))
+        if self.tuned_executable is not None:
+            arguments.update(executable=self.tuned_executable)
+        return arguments
+
+    def segment_prefix(self, i: int) -> Path:
+        return self.step_dir / f"{self.name}{i:05d}"
+
+    @property
+    def segment_ns(self) -> float:
+        cntrl = self.input.namelist.get("cntrl", {})
+        return cntrl.get("nstlim", 1) * cntrl.get("dt", 0.001) / 1000.0
+
+    def ns_per_day(self, wd: Path, window: int = 10) -> Optional[float]:
+        """ Recent throughput estimated from modification times of segment outputs """
+        last = self.current_step - 1
+        first = max(0, last - window)
+        if last <= first:
+            return None
+        try:
+            start, end = [self._mdout_mtime(wd, i) for i in (first, last)]
+        except FileNotFoundError:
+            return None
+        if end <= start:
+            return None
+        return (last - first) * self.segment_ns / (end - start) * 86400
+
+    def _mdout_mtime(self, wd: Path, i: int) -> float:
+        mdout = wd / f"{self.segment_prefix(i)}.out"
+        if not mdout.exists():
+            mdout = wd / f"{self.segment_prefix(i)}.out.gz"  # compressed by retention policy
+        return mdout.stat().st_mtime
+
+    @property
+    def frame_index_path(self) -> Path:
+        return self.step_dir / f"{self.name}.frames.json"
+
+    def compact_trajectories(self, md: 'MdProtocol', flush=False):
+        if self.compaction is not None:
+            self.compaction.submit(self.frame_index_path,
+                                   [(i, Path(f"{self.segment_prefix(i)}.nc"))
+                                    for i in range(self.compaction_position, self.current_step)],
+                                   archive_prefix=self.name,
+                                   flush=flush,
+                                   on_change=md.output_recorder(self))
+            self.compaction_position = self.current_step
+
+    def apply_retention(self, md: 'MdProtocol'):
+        if self.retention is None:
+            return
+        end = self.current_step - self.retention.keep_last
+        if end <= self.retention_position:
+            return
+        protected = {Path(path) for path in (md.sander.inpcrd, md.sander.refc) if path is not None}
+        index = FrameIndex(self.frame_index_path)
+        protected.update(self.frame_index_path.parent / filename for filename in index.files())
+        self.retention.submit([(i, self.segment_prefix(i)) for i in range(self.retention_position, end)], protected,
+                              md.output_recorder(self))
+        self.retention_position = end
 
     def before_call(self, md: 'MdProtocol'):
         pass
@@ -97,15 +490,33 @@ class RepeatedSanderCall(Step):
     def is_complete(self, value: bool):
         assert (self.current_step >= self.number_of_steps) == value
 
+    def summary(self):
+        return dict(super().summary(), segment=self.current_step, n_segments=self.number_of_steps,
+                    segment_ns=self.segment_ns)
+
 
 class MdProtocol(remote_runner.Task):
     _protected_methods = remote_runner.Task._protected_methods + ["checkpoint"]
     sander: SanderCommand = PmemdCommand()
+    registry: Optional[ProtocolRegistry] = None
+    engine_selector: Optional[EngineSelector] = None
+
+    # Persist each step in `step_dir/step.dill`, protocol state keeps only references.
+    # Steps are unpickled on first access, checkpoint rewrites only modified steps
+    lazy_steps = False
+    step_state_filename = "step.dill"
+
+    # Append-only log of produced files (relative to protocol directory), see `OutputManifest`
+    manifest_filename: Optional[str] = None
+
+    # Content-addressed store of rendered sander inputs, usually shared by a campaign, see `InputStore`
+    input_store: Optional[InputStore] = None
 
     def __init__(self, name: str, wd: Path):
         super().__init__(wd=wd)
         self.name = name
         self.__steps = OrderedDict()
+        self.__persisted = {}
 
     @staticmethod
     def mkdir(path: Path, mode=0o755):
@@ -118,16 +529,404 @@ class MdProtocol(remote_runner.Task):
             value.step_dir = Path(f"{len(self.__steps) - 1}_{value.name}")
         super().__setattr__(key, value)
 
+    def __getattr__(self, key):
+        # called only for attributes missing in __dict__, i.e. steps which are not loaded yet
+        steps = self.__dict__.get("_MdProtocol__steps", {})
+        if isinstance(steps.get(key), StepReference):
+            return self.__load_step(key)
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{key}'")
+
+    def __steps_root(self) -> Path:
+        # Inside run() cwd is the actual protocol directory, which differs from `wd` on remote workers
+        return self.__dict__.get("_MdProtocol__running_in") or Path(self.wd)
+
+    def __load_step(self, key) -> Step:
+        import dill
+        reference = self.__steps[key]
+        with (self.__steps_root() / reference.filename).open("rb") as f:
+            step = dill.load(f)
+        self.__steps[key] = step
+        self.__dict__[key] = step
+        self.__dict__.setdefault("_MdProtocol__persisted", {})[key] = reference
+        return step
+
+    def __step_summary(self, key):
+        step = self.__steps[key]
+        return step.summary if isinstance(step, StepReference) else step.summary()
+
+    def save(self, filename: Path):
+        if not self.lazy_steps:
+            return super().save(filename)
+        # step files are placed next to the protocol state
+        self.__clean = self.__persist_steps(Path(filename).absolute().parent)
+        try:
+            super().save(filename)
+        finally:
+            del self.__clean
+
+    def __persist_steps(self, root: Path):
+        import dill
+        import hashlib
+        persisted = self.__dict__.setdefault("_MdProtocol__persisted", {})
+        for key, step in self.__steps.items():
+            if isinstance(step, StepReference):
+                continue
+            data = dill.dumps(step)
+            digest = hashlib.sha1(data).hexdigest()
+            if key in persisted and persisted[key].digest == digest:
+                continue
+            filename = step.step_dir / self.step_state_filename
+            self.mkdir(root / step.step_dir)
+            tmp = root / f"{filename}.bak"
+            with tmp.open("wb") as out:
+                out.write(data)
+            tmp.rename(root / filename)
+            persisted[key] = StepReference(filename, digest, step.summary())
+        return set(persisted)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_MdProtocol__running_in", None)
+        state.pop("_MdProtocol__manifest", None)
+        # outside of save() loaded steps are pickled inline
+        clean = state.pop("_MdProtocol__clean", set())
+        if not self.lazy_steps:
+            return state
+        steps = OrderedDict()
+        for key, step in self.__steps.items():
+            if key in clean:
+                step = self.__persisted[key]
+            if isinstance(step, StepReference):
+                state.pop(key, None)
+            steps[key] = step
+        state["_MdProtocol__steps"] = steps
+        state["_MdProtocol__persisted"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
     # @final
     def run(self):
-        for i, step in enumerate(self.__steps.values()):
-            if step.is_complete:
+        self.__execute(self.__run_steps)
+
+    def run_unit(self):
+        """
+        Runs the next unit of work (see `next_unit()`) and checkpoints, used by segment-level scheduler.
+        Background jobs are finished before return
+        """
+        self.__execute(self.__run_unit)
+
+    def next_unit(self) -> Optional[dict]:
+        """
+        Next runnable unit as dict(step, segment, remaining) or None if protocol is complete.
+        `segment` is None for non-repeated steps, `remaining` counts units left in the whole protocol
+        """
+        result = None
+        remaining = 0
+        for key in self.__steps:
+            if self.__steps[key].is_complete:
+                continue
+            step = getattr(self, key)
+            repeated = isinstance(step, RepeatedSanderCall)
+            if result is None:
+                result = dict(step=key, segment=step.current_step if repeated else None)
+            remaining += step.number_of_steps - step.current_step if repeated else 1
+        if result is not None:
+            result["remaining"] = remaining
+        return result
+
+    def plan(self, scratch: Optional[Path] = None, atoms: Optional[int] = None) -> ProtocolPlan:
+        """
+        Dry run of remaining steps: renders inputs and commands of every step and segment in a temporary
+        directory under `scratch` (system default if None) and checks them, engines are not started.
+        Protocol itself is not modified, errors are collected per step instead of being raised
+
+        :param atoms: number of atoms for output size estimate, read from existing topology if None
+        """
+        import dill
+        import tempfile
+
+        # pickled copy keeps argument lambdas bound to copied commands, `sander` may be a class attribute
+        md, sander = dill.loads(dill.dumps((self, self.sander)))
+        md.sander = sander
+        result = ProtocolPlan(self.name, self.wd, atoms)
+        with tempfile.TemporaryDirectory(dir=scratch) as tmp, ChangeDirectory(Path(tmp)):
+            for key in list(md.__steps):
+                if md.__steps[key].is_complete:
+                    continue
+                step = getattr(md, key)
+                md.mkdir(step.step_dir)
+                try:
+                    step.plan(md, result)
+                except Exception as e:
+                    result.error(step, None, f"{e.__class__.__name__}: {e}")
+        return result
+
+    def __execute(self, action):
+        self.__running_in = Path.cwd()
+        try:
+            action()
+        except StopCalculationError:
+            self.update_registry(status="interrupted")
+            raise
+        except Exception:
+            self.update_registry(status="failed")
+            raise
+        finally:
+            del self.__running_in
+
+    def __run_steps(self):
+        for key in list(self.__steps):
+            if self.__steps[key].is_complete:
                 continue
+            step = getattr(self, key)
             with ChangeDirectory():
                 self.mkdir(step.step_dir)
                 step.run(self)
-                step.is_complete = True
-                self.checkpoint()
+                self.__complete(step)
+
+    def __run_unit(self):
+        unit = self.next_unit()
+        if unit is None:
+            return
+        step = getattr(self, unit["step"])
+        with ChangeDirectory():
+            self.mkdir(step.step_dir)
+            if unit["segment"] is None:
+                step.run(self)
+                self.__complete(step)
+                return
+            step.run_next_segment(self)
+            if step.is_complete:
+                step.finish(self)
+                self.__complete(step)
+            else:
+                step.wait_background()
+
+    def __complete(self, step: Step):
+        step.is_complete = True
+        self.record_outputs(step)
+        self.checkpoint()
+
+    @property
+    def output_manifest(self) -> Optional[OutputManifest]:
+        if self.manifest_filename is None:
+            return None
+        if "_MdProtocol__manifest" not in self.__dict__:
+            self.__manifest = OutputManifest(self.__steps_root() / self.manifest_filename)
+        return self.__manifest
+
+    def record_outputs(self, step: Step, segment: Optional[int] = None):
+        """ Records segment files or, if `segment` is None, all files of completed step to manifest """
+        manifest = self.output_manifest
+        if manifest is None:
+            return
+        root = self.__steps_root()
+        if segment is None:
+            manifest.scan(root, step.step_dir, step.name,
+                          exclude=[self.step_state_filename, f"{self.step_state_filename}.bak"])
+        else:
+            prefix = root / step.segment_prefix(segment)
+            paths = sorted(path.relative_to(root) for path in prefix.parent.glob(f"{prefix.name}.*"))
+            manifest.record(root, paths, step.name, segment)
+
+    def output_recorder(self, step: Step) -> Optional[Callable[[Optional[int], List[Path], List[Path]], None]]:
+        """
+        Callback recording files removed and created by background jobs of `step` (retention, compaction)
+        to manifest as soon as they happen, None if protocol has no manifest
+        """
+        manifest = self.output_manifest
+        if manifest is None:
+            return None
+        root = self.__steps_root().absolute()
+
+        def record(segment: Optional[int], removed: List[Path], created: List[Path]):
+            manifest.remove([Path(path).relative_to(root) for path in removed], step.name, segment)
+            manifest.record(root, [Path(path).relative_to(root) for path in created], step.name, segment)
+
+        return record
 
     def checkpoint(self):
         self.save(self.state_filename)
+        self.update_registry()
+
+    def update_registry(self, **overrides):
+        if self.registry is not None:
+            try:
+                self.registry.upsert(dict(self.summary(), **overrides))
+            except Exception as e:
+                _logger(self).error(f"Registry update failed: {e}")
+
+    def summary(self):
+        """ Lightweight protocol status, see `ProtocolRegistry` """
+        keys = list(self.__steps)
+        steps = [self.__step_summary(key) for key in keys]
+        current = next((i for i, step in enumerate(steps) if not step["is_complete"]), None)
+        repeated = [step for step in steps if "segment" in step]
+        result = dict(name=self.name, wd=str(self.wd), n_steps=len(steps),
+                      status="complete" if current is None else "running",
+                      step=None, step_index=current, segment=None, n_segments=None, ns_per_day=None,
+                      simulated_ns=sum(step["segment"] * step["segment_ns"] for step in repeated),
+                      total_ns=sum(step["n_segments"] * step["segment_ns"] for step in repeated))
+        if current is not None:
+            result["step"] = steps[current]["name"]
+            step = getattr(self, keys[current])
+            if isinstance(step, RepeatedSanderCall):
+                result["segment"] = step.current_step
+                result["n_segments"] = step.number_of_steps
+                result["ns_per_day"] = step.ns_per_day(Path(self.wd))
+        return result
+
+
+class ParallelMMPBSA(Step):
+    """
+    Runs MMPBSA.py over frames of `trajectories` step in concurrent chunks of `chunk_frames`
+
+    Prmtop paths are set on `mmpbsa.exe` (relative to protocol directory), methods and their settings in
+    `mmpbsa.input` (`gb`, `pb` namelists). Per-frame `DELTA TOTAL` energies are stored in `deltas.npy`
+    (frames x methods), averages with block-averaged standard errors in `mmpbsa.json`.
+    Finished chunks are marked with `done` file in their directory and are skipped on restart.
+    """
+
+    def __init__(self, name, trajectories: str, chunk_frames: int = 100, max_concurrency: int = 4,
+                 n_blocks: int = 5):
+        super().__init__(name)
+        self.trajectories = trajectories
+        self.chunk_frames = chunk_frames
+        self.max_concurrency = max_concurrency
+        self.n_blocks = n_blocks
+        self.mmpbsa = CommandWithInput(exe=MMPBSACommand(), inp=MMPBSAInput())
+        self.results = None
+
+    @property
+    def methods(self) -> List[str]:
+        return [method for method in ("gb", "pb") if method in self.mmpbsa.input.namelist]
+
+    def chunks(self, md: 'MdProtocol'):
+        from .mmpbsa import split_frames
+        from .trajectory import segment_frame_ranges
+        step: RepeatedSanderCall = getattr(md, self.trajectories)
+        segments = [Path(f"{step.segment_prefix(i)}.nc") for i in range(step.current_step)]
+        return split_frames(segment_frame_ranges(step.frame_index_path, segments), self.chunk_frames)
+
+    def run(self, md: 'MdProtocol'):
+        import copy
+        import json
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        import numpy as np
+        from .statistics import block_average
+
+        chunks = self.chunks(md)
+        methods = self.methods
+        n_frames = sum(chunk.frames for chunk in chunks)
+        store_path = self.step_dir / "deltas.npy"
+        if store_path.exists():
+            store = np.load(str(store_path), mmap_mode="r+")
+            if store.shape != (n_frames, len(methods)):
+                raise RuntimeError(f"{store_path} shape {store.shape} doesn't match frames/methods, remove it")
+        else:
+            store = np.lib.format.open_memmap(str(store_path), mode="w+", dtype=np.float64,
+                                              shape=(n_frames, len(methods)))
+            store[:] = np.nan
+
+        def chunk_dir(chunk):
+            return self.step_dir / f"chunk{chunk.index:05d}"
+
+        def run_chunk(chunk):
+            from .mmpbsa import read_energy_output
+            directory = chunk_dir(chunk).absolute()
+            inp = copy.deepcopy(self.mmpbsa.input)
+            inp.general(startframe=chunk.start + 1, endframe=chunk.start + chunk.frames, interval=1)
+            with (directory / "mmpbsa.in").open("w") as out:
+                inp.write(out)
+            exe = copy.deepcopy(self.mmpbsa.exe)
+            for key in ["solvated_prmtop", "complex_prmtop", "receptor_prmtop", "ligand_prmtop"]:
+                if getattr(exe, key) is not None:
+                    setattr(exe, key, str(Path(getattr(exe, key)).absolute()))
+            exe.input = "mmpbsa.in"
+            exe.output = "FINAL_RESULTS_MMPBSA.dat"
+            exe.energy_output = "per_frame.csv"
+            exe.trajectory = str(chunk.trajectory)
+            exe.run(cwd=str(directory), stdout=subprocess.DEVNULL)
+            return read_energy_output(directory / "per_frame.csv")
+
+        pending = [chunk for chunk in chunks if not (chunk_dir(chunk) / "done").exists()]
+        for chunk in pending:
+            md.mkdir(chunk_dir(chunk))
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {pool.submit(run_chunk, chunk): chunk for chunk in pending}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    values = future.result()
+                except Exception as e:
+                    _logger(self).error(f"Chunk {chunk.index} failed: {e}")
+                    errors.append(e)
+                    continue
+                for j, method in enumerate(methods):
+                    store[chunk.offset:chunk.offset + chunk.frames, j] = values[method]
+                store.flush()
+                (chunk_dir(chunk) / "done").touch()
+        if errors:
+            raise errors[0]
+
+        self.results = {}
+        for j, method in enumerate(methods):
+            mean, sem = block_average(store[:, j], self.n_blocks)
+            self.results[method] = dict(mean=mean, sem=sem, std=float(np.std(store[:, j])), frames=n_frames)
+        with (self.step_dir / "mmpbsa.json").open("w") as out:
+            json.dump(self.results, out, indent=1)
+
+
+class CpptrajAnalysis(Step):
+    """
+    Applies `cpptraj.input` script to every segment of `trajectories` step concurrently
+
+    The script must not contain `trajin`, it is prepended per segment. Data files named by `out`
+    are merged in segment order into step directory. Finished segments are marked with `done` file
+    and are skipped on restart.
+    """
+
+    def __init__(self, name, trajectories: str, max_concurrency: int = 4):
+        super().__init__(name)
+        self.trajectories = trajectories
+        self.max_concurrency = max_concurrency
+        self.cpptraj = CommandWithInput(exe=CpptrajCommand(), inp=CpptrajInput())
+
+    def run(self, md: 'MdProtocol'):
+        import copy
+        from concurrent.futures import ThreadPoolExecutor
+        from .cpptraj import merge_data_files
+        from .trajectory import segment_frame_ranges
+
+        step: RepeatedSanderCall = getattr(md, self.trajectories)
+        segments = [Path(f"{step.segment_prefix(i)}.nc") for i in range(step.current_step)]
+        ranges = segment_frame_ranges(step.frame_index_path, segments)
+        directories = [self.step_dir / f"segment{i:05d}" for i in range(len(ranges))]
+        prmtop = self.cpptraj.exe.prmtop or md.sander.prmtop
+
+        def run_segment(i):
+            trajectory, start, frames = ranges[i]
+            inp = CpptrajInput()
+            inp.trajin(Path(trajectory).absolute(), start + 1, start + frames)
+            for command in self.cpptraj.input.commands:
+                inp.add_command(command)
+            exe = copy.deepcopy(self.cpptraj.exe)
+            exe.prmtop = str(Path(prmtop).absolute())
+            exe.input = "cpptraj.in"
+            exe.log_file = "cpptraj.log"
+            with (directories[i] / "cpptraj.in").open("w") as out:
+                inp.write(out)
+            exe.run(cwd=str(directories[i].absolute()))
+            (directories[i] / "done").touch()
+
+        pending = [i for i, directory in enumerate(directories) if not (directory / "done").exists()]
+        for i in pending:
+            md.mkdir(directories[i])
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            list(pool.map(run_segment, pending))
+
+        for filename in self.cpptraj.input.data_files:
+            merge_data_files([directory / filename for directory in directories], self.step_dir / filename)
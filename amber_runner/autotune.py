@@ -0,0 +1,143 @@
+import json
+import os
+import platform
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from .health import ScopeNamelistValues
+from .utility import self_logger as _logger
+
+NS_PER_DAY = re.compile(r"ns/day\s*=\s*([0-9.]+)")
+
+
+def read_ns_per_day(mdout: Path) -> Optional[float]:
+    """ Last `ns/day` value reported in mdout timings ("all steps" average) """
+    try:
+        values = NS_PER_DAY.findall(Path(mdout).read_text())
+    except FileNotFoundError:
+        return None
+    return float(values[-1]) if values else None
+
+
+def read_atom_count(prmtop: Path) -> int:
+    """ NATOM, the first value of prmtop POINTERS section """
+    with open(prmtop) as f:
+        for line in f:
+            if line.startswith("%FLAG POINTERS"):
+                next(f)  # %FORMAT
+                return int(next(f).split()[0])
+    raise ValueError(f"No POINTERS section in {prmtop}")
+
+
+def node_type() -> str:
+    """ `AMBER_RUNNER_NODE_TYPE` environment variable, or CPU model and number of cores """
+    if "AMBER_RUNNER_NODE_TYPE" in os.environ:
+        return os.environ["AMBER_RUNNER_NODE_TYPE"]
+    model = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo") as f:
+            model = next(line.split(":", 1)[1].strip() for line in f if line.startswith("model name"))
+    except (OSError, StopIteration):
+        pass
+    return f"{model} x{os.cpu_count()}"
+
+
+def default_cache_path() -> Path:
+    root = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return Path(root) / "amber-runner" / "mpi_ranks.json"
+
+
+class RankAutotuner:
+    """
+    Picks the number of MPI ranks by running short benchmark segments
+
+    Each candidate runs `benchmark_steps` MD steps of the step input (no trajectory, no restart reuse),
+    best configuration by reported ns/day is cached per (node type, engine, atom count, cutoff) in a JSON file
+    shared between protocols.
+    With `MdProtocol.engine_selector` the engine it selects for the step input is tuned, `executable` is used
+    otherwise. Tuning is skipped if the selected engine is not MPI-capable
+    """
+
+    def __init__(self,
+                 ranks: Sequence[int] = (1, 2, 4, 8, 16),
+                 executable: Sequence[str] = ("pmemd.MPI",),
+                 mpirun: Sequence[str] = ("mpirun",),
+                 benchmark_steps: int = 1000,
+                 cache_path: Optional[Path] = None):
+        self.ranks = list(ranks)
+        self.executable = list(executable)
+        self.mpirun = list(mpirun)
+        self.benchmark_steps = benchmark_steps
+        self.cache_path = Path(cache_path) if cache_path is not None else default_cache_path()
+
+    def launcher(self, ranks: int, executable: Sequence[str]) -> List[str]:
+        return self.mpirun + ["-np", str(ranks)] + list(executable)
+
+    def engine(self, md, step) -> Optional[List[str]]:
+        """ MPI engine executable `step` runs with, None if the engine selected for `step.input` is not MPI-capable """
+        selector = getattr(md, "engine_selector", None)
+        if selector is None:
+            return self.executable
+        spec = selector.select(step.input)
+        if not spec.mpi:
+            return None
+        return [selector.which(spec.name)]
+
+    @staticmethod
+    def key(engine: str, atoms: int, cutoff: float) -> str:
+        return f"{node_type()}|{engine}|{atoms}|{cutoff:g}"
+
+    def load_cache(self) -> Dict[str, Dict]:
+        try:
+            with self.cache_path.open() as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def store(self, key: str, entry: Dict):
+        cache = self.load_cache()  # re-read to keep entries stored by other protocols meanwhile
+        cache[key] = entry
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(f"{self.cache_path}.{os.getpid()}.bak")
+        with tmp.open("w") as out:
+            json.dump(cache, out, indent=1)
+        tmp.replace(self.cache_path)
+
+    def tune(self, md, step) -> Optional[List[str]]:
+        """
+        Returns `md.sander.executable` with best number of ranks for `step.input`,
+        None if the engine is not MPI-capable
+        """
+        from .MD import CommandWithInput
+
+        executable = self.engine(md, step)
+        if executable is None:
+            _logger(self).info(f"{step.name}: selected engine is not MPI-capable, number of ranks is not tuned")
+            return None
+        cutoff = step.input.namelist.get("cntrl", {}).get("cut", 8.0)
+        key = self.key(Path(executable[0]).name, read_atom_count(md.sander.prmtop), cutoff)
+        cached = self.load_cache().get(key)
+        if cached is not None:
+            return self.launcher(cached["ranks"], executable)
+
+        results = {}
+        settings = {"cntrl": dict(nstlim=self.benchmark_steps, ntpr=self.benchmark_steps, ntwx=0)}
+        for ranks in self.ranks:
+            prefix = str(step.step_dir / f"{step.name}.autotune.np{ranks}")
+            with step.engine_scope(md, step.input), \
+                    md.sander.scope_args(executable=self.launcher(ranks, executable), output_prefix=prefix) as exe, \
+                    ScopeNamelistValues(step.input, settings):
+                try:
+                    CommandWithInput(exe, step.input).run()
+                except Exception as e:
+                    _logger(self).warning(f"Benchmark with {ranks} ranks failed: {e}")
+                    continue
+                results[ranks] = read_ns_per_day(exe.mdout)
+        results = {ranks: value for ranks, value in results.items() if value is not None}
+        if not results:
+            raise RuntimeError("All MPI rank benchmarks failed")
+        best = max(results, key=lambda ranks: (results[ranks], -ranks))
+        _logger(self).info(f"{key}: {best} ranks selected, ns/day by ranks: {results}")
+        self.store(key, dict(ranks=best, ns_per_day=results[best], results={str(k): v for k, v in results.items()}))
+        return self.launcher(best, executable)
@@ -0,0 +1,87 @@
+"""
+Periodic box selection for solvation
+
+Requires optional `numpy` package
+"""
+import math
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+WATER_DENSITY = 0.0334  # molecules / A^3 at 300K
+ATOMS_PER_WATER = {"TIP3PBOX": 3, "SPCBOX": 3, "OPCBOX": 4, "TIP4PEWBOX": 4, "TIP5PBOX": 5}
+
+
+def read_pdb_coordinates(filename: Path) -> np.ndarray:
+    with open(filename) as f:
+        return np.array([[float(line[30:38]), float(line[38:46]), float(line[46:54])]
+                         for line in f if line.startswith(("ATOM", "HETATM"))])
+
+
+class BoxOption:
+    """ Box shape with its predicted size and cost """
+
+    def __init__(self, shape: str, rotation_safe: bool, dimensions: List[float], volume: float, buffer,
+                 iso: bool):
+        self.shape = shape
+        self.rotation_safe = rotation_safe
+        self.dimensions = dimensions
+        self.volume = volume
+        self.buffer = buffer
+        self.iso = iso
+        self.predicted_atoms = 0
+        self.relative_cost = 1.0
+
+    def commands(self, frame: str, water_model: str) -> List[str]:
+        """ tleap commands producing this box """
+        buffer = (f"{{ {' '.join(f'{b:.3f}' for b in self.buffer)} }}" if isinstance(self.buffer, list)
+                  else f"{self.buffer:.3f}")
+        command = "solvateoct" if self.shape == "octahedron" else "solvatebox"
+        return [f"alignaxes {frame}", f"{command} {frame} {water_model} {buffer}" + (" iso" if self.iso else "")]
+
+    def as_dict(self) -> Dict:
+        return dict(shape=self.shape, rotation_safe=self.rotation_safe, dimensions=self.dimensions,
+                    volume=self.volume, predicted_atoms=self.predicted_atoms, relative_cost=self.relative_cost)
+
+
+def box_options(coordinates: np.ndarray, min_image_distance: float, water_model: str = "TIP3PBOX",
+                atom_volume: float = 10.0) -> List[BoxOption]:
+    """
+    Boxes keeping solute images at least `min_image_distance` apart, sorted by predicted atom count
+
+    Solute is aligned by principal axes (tleap `alignaxes`). Rectangular box fitted to the aligned extents
+    is the smallest one but stays valid only while solute doesn't rotate, cube and truncated octahedron
+    are sized by the bounding sphere and remain valid for any orientation.
+
+    :param coordinates: solute coordinates, (N, 3)
+    :param atom_volume: volume excluded from solvent per solute atom, A^3
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    centered = coordinates - coordinates.mean(axis=0)
+    _, axes = np.linalg.eigh(centered.T @ centered)
+    aligned = centered @ axes[:, ::-1]  # largest extent first, as tleap alignaxes
+    extents = aligned.max(axis=0) - aligned.min(axis=0)
+    radius = float(np.sqrt((centered ** 2).sum(axis=1)).max())
+    d = min_image_distance
+
+    rectangular = [float(e + d) for e in extents]
+    cube_edge = 2 * radius + d
+    # truncated octahedron cut from cube of edge `a` has images at a*sqrt(3)/2 and volume a^3/2
+    oct_edge = 2 * (2 * radius + d) / math.sqrt(3)
+    # tleap measures buffer from solute to the box faces, for the octahedron the nearest (hexagonal) faces
+    # are a*sqrt(3)/4 from the center
+    oct_buffer = oct_edge * math.sqrt(3) / 4 - extents[0] / 2
+    options = [
+        BoxOption("rectangular", False, rectangular, float(np.prod(rectangular)), [d / 2] * 3, iso=False),
+        BoxOption("cube", True, [cube_edge] * 3, cube_edge ** 3, (cube_edge - extents[0]) / 2, iso=True),
+        BoxOption("octahedron", True, [oct_edge] * 3, oct_edge ** 3 / 2, oct_buffer, iso=True),
+    ]
+    n_solute = len(coordinates)
+    for option in options:
+        waters = max(0.0, option.volume - n_solute * atom_volume) * WATER_DENSITY
+        option.predicted_atoms = int(n_solute + waters * ATOMS_PER_WATER.get(water_model, 3))
+    cheapest = min(option.predicted_atoms for option in options)
+    for option in options:
+        option.relative_cost = option.predicted_atoms / cheapest
+    return sorted(options, key=lambda option: option.predicted_atoms)
@@ -0,0 +1,54 @@
+"""
+Bulk creation of protocols for parameter sweeps:
+
+    protocols = create_protocols(MyProtocol, [dict(name=f"P{i}", temp0=t) for i, t in enumerate(temps)])
+    runner.run(protocols)
+
+Only saving is parallel: protocols are constructed sequentially by `factory` and own all their inputs,
+their states are dumped by a pool of forked processes
+"""
+import multiprocessing
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Mapping
+
+from .MD import MdProtocol
+
+# Protocols inherited by forked pool workers, avoids pickling every protocol twice
+_pending: List[MdProtocol] = []
+
+
+def create_protocols(factory: Callable[..., MdProtocol], table: Iterable[Mapping[str, Any]],
+                     jobs: int = 0, chunksize: int = 64) -> List[MdProtocol]:
+    """
+    Creates ``factory(**row)`` for every row of `table` and saves their states to ``wd/state_filename``
+
+    :param factory: protocol class or function, responsible for creation of protocol working directory
+    :param table: parameters of protocols
+    :param jobs: number of writer processes, 0 means all cores, 1 disables the pool
+    :return: protocols in order of `table`
+    """
+    protocols = [factory(**row) for row in table]
+    indices = list(range(len(protocols)))
+    chunks = [indices[i:i + chunksize] for i in range(0, len(indices), chunksize)]
+    if jobs == 1 or len(chunks) < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        for chunk in chunks:
+            _save(protocols, chunk)
+        return protocols
+
+    _pending[:] = protocols
+    try:
+        with multiprocessing.get_context("fork").Pool(jobs or None) as pool:
+            pool.map(_save_pending, chunks)
+    finally:
+        _pending.clear()
+    return protocols
+
+
+def _save(protocols: List[MdProtocol], chunk: List[int]):
+    for i in chunk:
+        md = protocols[i]
+        md.save(Path(md.wd) / md.state_filename)
+
+
+def _save_pending(chunk: List[int]):
+    _save(_pending, chunk)
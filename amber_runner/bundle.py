@@ -0,0 +1,73 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List
+
+import remote_runner
+from remote_runner.errors import StopCalculationError
+
+from .utility import self_logger as _logger
+
+
+def _run_member(state: str) -> Dict:
+    """ Runs member task in its directory (pool worker) """
+    os.chdir(os.path.dirname(state))
+    try:
+        task = remote_runner.Task.load(Path(state))
+        task.run()
+    except StopCalculationError as e:
+        return dict(status="interrupted", error=str(e))
+    except Exception as e:
+        return dict(status="failed", error=f"{e.__class__.__name__}: {e}")
+    return dict(status="complete", error=None)
+
+
+class TaskBundle(remote_runner.Task):
+    """
+    Runs many tasks within single worker allocation, `slots` of them concurrently
+
+    Members reside in subdirectories of the bundle, each one is run in a separate process
+    from its own state file and checkpoints independently. Per-member exit status is kept in
+    `statuses` and `bundle_status.json`; completed members are skipped on restart.
+    Member state files (relative to bundle) are listed in `bundle_members.json` for tools which don't unpickle
+    the bundle (see `amber_runner.cli.find_states()`)
+    """
+    status_filename = "bundle_status.json"
+    members_filename = "bundle_members.json"
+
+    def __init__(self, wd: Path, members: List[remote_runner.Task], slots: int = 1):
+        super().__init__(wd=wd)
+        self.slots = slots
+        self.members: List[Path] = []
+        self.statuses: Dict[str, Dict] = {}
+        for task in members:
+            state = Path(task.wd) / task.state_filename
+            task.save(state)
+            self.members.append(state.relative_to(self.wd))
+        with (Path(self.wd) / self.members_filename).open("w") as out:
+            json.dump([str(member) for member in self.members], out, indent=1)
+
+    def run(self):
+        root = Path.cwd()  # bundle directory on the worker
+        pending = [str(member) for member in self.members
+                   if self.statuses.get(str(member), {}).get("status") != "complete"]
+        with ProcessPoolExecutor(max_workers=self.slots) as pool:
+            futures = {pool.submit(_run_member, str(root / member)): member for member in pending}
+            for future in as_completed(futures):
+                member = futures[future]
+                try:
+                    self.statuses[member] = future.result()
+                except Exception as e:  # worker process died
+                    self.statuses[member] = dict(status="failed", error=f"{e.__class__.__name__}: {e}")
+                _logger(self).info(f"{member}: {self.statuses[member]['status']}")
+                self.checkpoint(root)
+
+        failed = [member for member in pending if self.statuses[member]["status"] != "complete"]
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(self.members)} members did not complete: {', '.join(failed)}")
+
+    def checkpoint(self, root: Path):
+        with (root / self.status_filename).open("w") as out:
+            json.dump(self.statuses, out, indent=1)
+        self.save(root / self.state_filename)
@@ -0,0 +1,212 @@
+"""
+Command line interface:
+
+    amber-runner status [DIR...]      # status of every protocol found under DIRs
+    amber-runner progress [DIR...]    # simulated/planned nanoseconds
+    amber-runner throughput [DIR...]  # recent ns/day and ETA
+    amber-runner plan [DIR...]        # dry run: validation errors, planned ns and output size
+
+Protocol summaries are cached by state file mtime/size, only changed states are unpickled.
+Heavy dependencies (dill, f90nml, remote_runner) are imported by pool workers only
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, TextIO
+
+
+def default_cache_path() -> Path:
+    root = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return Path(root) / "amber-runner" / "summaries.json"
+
+
+BUNDLE_MEMBERS_FILENAME = "bundle_members.json"  # `TaskBundle.members_filename`
+
+
+def find_states(roots: Iterable[Path], state_filename: str = "state.dill") -> List[Path]:
+    """ State files under `roots`, members of `TaskBundle` included """
+    result = set()
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            if state_filename in filenames:
+                result.add(Path(dirpath).absolute() / state_filename)
+                dirnames[:] = []  # step dirs don't hold nested protocols
+                if BUNDLE_MEMBERS_FILENAME in filenames:
+                    with open(os.path.join(dirpath, BUNDLE_MEMBERS_FILENAME)) as f:
+                        members = [Path(dirpath).absolute() / member for member in json.load(f)]
+                    for member in members:
+                        result.update(find_states([member.parent], member.name))  # members may be bundles too
+    return sorted(result)
+
+
+def load_summary(state: str) -> Dict:
+    from remote_runner import Task
+
+    task = Task.load(Path(state))
+    if hasattr(task, "summary"):
+        return task.summary()
+    return dict(name=task.name_or_wd, wd=str(task.wd), status="unknown")
+
+
+class SummaryCache:
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if path is not None and path.is_file():
+            try:
+                with path.open() as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    @staticmethod
+    def key(state: Path):
+        stat = state.stat()
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def get(self, state: Path) -> Optional[Dict]:
+        entry = self.entries.get(str(state))
+        if entry is not None and entry["key"] == self.key(state):
+            return entry["summary"]
+        return None
+
+    def put(self, state: Path, summary: Dict):
+        self.entries[str(state)] = dict(key=self.key(state), summary=summary)
+
+    def save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(f"{self.path}.{os.getpid()}.bak")
+        with tmp.open("w") as out:
+            json.dump(self.entries, out)
+        tmp.replace(self.path)
+
+
+def collect(states: List[Path], cache: SummaryCache, jobs: int) -> List[Dict]:
+    stale = [state for state in states if cache.get(state) is None]
+    if len(stale) > 1 and jobs != 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs or None) as pool:
+            loaded = list(pool.map(_safe_load_summary, map(str, stale), chunksize=16))
+    else:
+        loaded = [_safe_load_summary(str(state)) for state in stale]
+    for state, summary in zip(stale, loaded):
+        cache.put(state, summary)
+    if stale:
+        cache.save()
+    return [cache.get(state) for state in states]
+
+
+def _safe_load_summary(state: str) -> Dict:
+    try:
+        return load_summary(state)
+    except Exception as e:
+        return dict(name=Path(state).parent.name, wd=str(Path(state).parent), status="unreadable", error=str(e))
+
+
+def _format_ns(value) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def _format_eta(days) -> str:
+    if days is None:
+        return "-"
+    return f"{days:.1f}d" if days >= 2 else f"{days * 24:.1f}h"
+
+
+def eta_days(summary: Dict) -> Optional[float]:
+    rate = summary.get("ns_per_day")
+    total, done = summary.get("total_ns"), summary.get("simulated_ns")
+    if summary.get("status") == "complete":
+        return 0.0
+    if not rate or total is None or done is None:
+        return None
+    return (total - done) / rate
+
+
+def print_status(summaries: List[Dict], out: TextIO):
+    for s in summaries:
+        segment = "" if s.get("segment") is None else f" {s['segment']}/{s['n_segments']}"
+        out.write(f"{s['status']:<12} {s['name']:<24} {s.get('step') or '-'}{segment}  {s['wd']}\n")
+    counts: Dict[str, int] = {}
+    for s in summaries:
+        counts[s["status"]] = counts.get(s["status"], 0) + 1
+    out.write("total: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())) + f" ({len(summaries)})\n")
+
+
+def print_progress(summaries: List[Dict], out: TextIO):
+    done = total = 0.0
+    for s in summaries:
+        done += s.get("simulated_ns") or 0.0
+        total += s.get("total_ns") or 0.0
+        fraction = (s["simulated_ns"] / s["total_ns"] * 100) if s.get("total_ns") else None
+        out.write(f"{s['name']:<24} {_format_ns(s.get('simulated_ns')):>10} / {_format_ns(s.get('total_ns')):>10} ns"
+                  f"  {'-' if fraction is None else f'{fraction:.1f}%'}\n")
+    out.write(f"total: {done:.1f} / {total:.1f} ns" + (f" ({done / total * 100:.1f}%)" if total else "") + "\n")
+
+
+def print_throughput(summaries: List[Dict], out: TextIO):
+    aggregate = 0.0
+    etas = []
+    for s in summaries:
+        eta = eta_days(s)
+        if s.get("status") == "running" and s.get("ns_per_day"):
+            aggregate += s["ns_per_day"]
+        if eta is not None:
+            etas.append(eta)
+        out.write(f"{s['name']:<24} {_format_ns(s.get('ns_per_day')):>10} ns/day  ETA {_format_eta(eta)}\n")
+    out.write(f"total: {aggregate:.1f} ns/day, ETA {_format_eta(max(etas) if etas else None)}\n")
+
+
+def print_plan(plans: List, out: TextIO):
+    for plan in plans:
+        out.write(f"{'error' if plan.errors else 'ok':<6} {plan.name:<24} {len(plan.calls):>6} calls "
+                  f"{plan.simulated_ns:>10.1f} ns {plan.output_bytes / 1e9:>8.2f} GB  {plan.wd}\n")
+        for error in plan.errors:
+            out.write(f"    {error}\n")
+    failed = sum(1 for plan in plans if plan.errors)
+    out.write(f"total: {sum(plan.simulated_ns for plan in plans):.1f} ns, "
+              f"{sum(plan.output_bytes for plan in plans) / 1e9:.2f} GB, {failed} of {len(plans)} with errors\n")
+
+
+COMMANDS = {
+    "status": print_status,
+    "progress": print_progress,
+    "throughput": print_throughput,
+}
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog="amber-runner", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=sorted(list(COMMANDS) + ["plan"]))
+    parser.add_argument("dirs", nargs="*", type=Path, default=[Path(".")],
+                        help="directories to scan for protocol working dirs")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="number of loader processes, 0 means all cores")
+    parser.add_argument("--cache", type=Path, default=default_cache_path(), help="summary cache file")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--state-filename", default="state.dill")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == "plan":
+        from .plan import plan_campaign
+
+        plans = plan_campaign(find_states(args.dirs, args.state_filename), args.jobs)
+        print_plan(plans, sys.stdout)
+        sys.stderr.write(f"{len(plans)} protocols planned in {time.perf_counter() - start:.2f}s\n")
+        return 1 if any(plan.errors for plan in plans) else 0
+
+    cache = SummaryCache(None if args.no_cache else args.cache)
+    summaries = collect(find_states(args.dirs, args.state_filename), cache, args.jobs)
+    COMMANDS[args.command](summaries, sys.stdout)
+    sys.stderr.write(f"{len(summaries)} protocols in {time.perf_counter() - start:.2f}s\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,7 @@ import subprocess
 import typing
 from collections import OrderedDict
 from typing import Any, List
-from remote_runner.utility import self_logger as _logger
+from .utility import self_logger as _logger
 
 
 class Argument:
@@ -0,0 +1,140 @@
+"""
+Convergence criteria evaluated on energies streamed from mdout
+
+Requires optional `numpy` package
+"""
+import gzip
+import math
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .statistics import block_average, detect_equilibration, statistical_inefficiency
+from .utility import self_logger as _logger
+
+MDOUT_VALUE = re.compile(r"(\S[^=]*?)\s*=\s*(\S+)")
+AVERAGES_MARKERS = ("A V E R A G E S", "F L U C T U A T I O N S")
+
+
+def read_mdout_records(mdout: Path) -> Iterator[Dict[str, float]]:
+    """
+    Yields energy records (``NSTEP = ...`` blocks) of mdout line by line
+
+    Running averages and fluctuations blocks are skipped, non-numeric values (e.g. ``*****``) are NaN
+    """
+    mdout = Path(mdout)
+    opener = gzip.open if mdout.suffix == ".gz" else open
+    record: Optional[Dict[str, float]] = None
+    skip = False
+    with opener(mdout, "rt") as f:
+        for line in f:
+            if any(marker in line for marker in AVERAGES_MARKERS):
+                skip = True
+            elif line.lstrip().startswith("NSTEP"):
+                record = {}
+            if record is None:
+                continue
+            if line.strip().startswith("----"):
+                if not skip:
+                    yield record
+                record, skip = None, False
+                continue
+            for key, value in MDOUT_VALUE.findall(line):
+                try:
+                    record[key] = float(value)
+                except ValueError:
+                    record[key] = float("nan")
+
+
+class EquilibrationCriterion:
+    """
+    Met when detected equilibration time leaves at least `min_samples` uncorrelated samples
+    and no more than `max_fraction` of the series is discarded
+    """
+
+    def __init__(self, observable: str = "Density", min_samples: float = 50, max_fraction: float = 0.5):
+        self.observable = observable
+        self.min_samples = min_samples
+        self.max_fraction = max_fraction
+
+    def evaluate(self, values: np.ndarray) -> Dict:
+        t0, g, n_effective = detect_equilibration(values)
+        met = bool(len(values) > 1 and n_effective >= self.min_samples and t0 <= self.max_fraction * len(values))
+        return dict(observable=self.observable, criterion="equilibration", met=met,
+                    t0=t0, g=g, n_effective=n_effective)
+
+
+class StandardErrorCriterion:
+    """
+    Met when standard error of `observable` mean drops to `target`
+
+    Error is estimated from statistical inefficiency (``method="autocorrelation"``) or from block
+    averages (``method="block"``), samples before detected equilibration time are discarded
+    if `discard_equilibration` is set
+    """
+
+    def __init__(self, observable: str, target: float, method: str = "autocorrelation", n_blocks: int = 5,
+                 discard_equilibration: bool = True, min_samples: int = 20):
+        if method not in ("autocorrelation", "block"):
+            raise ValueError(f"Unknown standard error method `{method}`")
+        self.observable = observable
+        self.target = target
+        self.method = method
+        self.n_blocks = n_blocks
+        self.discard_equilibration = discard_equilibration
+        self.min_samples = min_samples
+
+    def evaluate(self, values: np.ndarray) -> Dict:
+        t0 = detect_equilibration(values)[0] if self.discard_equilibration else 0
+        production = values[t0:]
+        if len(production) < max(self.min_samples, 2):
+            mean, error = float(production.mean()) if len(production) else math.nan, math.nan
+        elif self.method == "block":
+            mean, error = block_average(production, self.n_blocks)
+        else:
+            g = statistical_inefficiency(production)
+            mean = float(production.mean())
+            error = float(production.std(ddof=1) * math.sqrt(g / len(production)))
+        return dict(observable=self.observable, criterion="standard_error", met=bool(error <= self.target),
+                    t0=t0, mean=mean, error=error, target=self.target)
+
+
+class ConvergenceMonitor:
+    """
+    Accumulates observables of consecutive segments and tells when all criteria are met
+
+    Each mdout is read once by `update()`, accumulated series are kept in the step state
+    """
+
+    def __init__(self, criteria: Sequence, min_segments: int = 1):
+        self.criteria = list(criteria)
+        self.min_segments = min_segments
+        self.series: Dict[str, List[float]] = {criterion.observable: [] for criterion in self.criteria}
+        self.segments = 0
+        self.last_report: List[Dict] = []
+
+    def update(self, mdout: Path):
+        for record in read_mdout_records(mdout):
+            for observable, values in self.series.items():
+                if observable in record:
+                    values.append(record[observable])
+        self.segments += 1
+
+    def evaluate(self) -> List[Dict]:
+        self.last_report = []
+        for criterion in self.criteria:
+            values = np.asarray(self.series[criterion.observable], dtype=float)
+            if not len(values) or not np.isfinite(values).all():
+                result = dict(observable=criterion.observable, met=False, error="no finite samples")
+            else:
+                result = criterion.evaluate(values)
+            self.last_report.append(result)
+        return self.last_report
+
+    @property
+    def converged(self) -> bool:
+        report = self.evaluate()
+        _logger(self).debug(f"Convergence after {self.segments} segments: {report}")
+        return self.segments >= self.min_segments and all(result["met"] for result in report)
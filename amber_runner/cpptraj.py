@@ -0,0 +1,31 @@
+from pathlib import Path
+from typing import List
+
+
+def merge_data_files(parts: List[Path], target: Path):
+    """
+    Concatenates cpptraj data files in order, keeps the first header
+
+    If the first column is `#Frame`, frames are renumbered consecutively across parts
+    """
+    frame = 0
+    with open(target, "w") as out:
+        for i, part in enumerate(parts):
+            with open(part) as f:
+                lines = f.read().splitlines()
+            if not lines:
+                continue
+            header, rows = (lines[0], lines[1:]) if lines[0].startswith("#") else (None, lines)
+            if header is not None and i == 0:
+                out.write(header + "\n")
+            renumber = header is not None and header.split()[0] == "#Frame"
+            for row in rows:
+                if not row.strip():
+                    continue
+                if renumber:
+                    frame += 1
+                    number = row.split()[0]
+                    # keep cpptraj fixed-width layout: replace number right-aligned in the same width
+                    width = len(row) - len(row.lstrip()) + len(number)
+                    row = f"{frame:{width}d}" + row[width:]
+                out.write(row + "\n")
@@ -0,0 +1,50 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .utility import self_logger as _logger
+
+
+class SqliteTable:
+    """
+    Single table of a shared SQLite database, created on first connection
+
+    WAL journal allows concurrent readers, writes retry with exponential backoff while database is locked.
+    Database should reside on a local (non-NFS) filesystem
+    """
+    table: str
+    columns: List[Tuple[str, str]]
+
+    def __init__(self, path: Path, timeout: float = 30.0, retries: int = 5):
+        self.path = Path(path).absolute()
+        self.timeout = timeout
+        self.retries = retries
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(str(self.path), timeout=self.timeout)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} "
+                           f"({', '.join(f'{name} {kind}' for name, kind in self.columns)})")
+        return connection
+
+    def _retry(self, action):
+        delay = 0.1
+        for attempt in range(self.retries):
+            try:
+                connection = self.connect()
+                try:
+                    with connection:
+                        return action(connection)
+                finally:
+                    connection.close()
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or attempt + 1 == self.retries:
+                    raise
+                _logger(self).warning(f"{self.path} is locked, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay *= 2
+
+    def _execute(self, sql: str, params: Sequence = ()) -> List[Dict[str, Any]]:
+        return self._retry(lambda connection: [dict(row) for row in connection.execute(sql, params)])
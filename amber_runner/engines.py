@@ -0,0 +1,119 @@
+import shutil
+from typing import Callable, FrozenSet, List, Optional, Sequence
+
+from .command import ScopeArguments
+from .executables import SanderCommand
+from .inputs import AmberInput
+
+
+class EngineSpec:
+    """
+    Capabilities of an MD engine executable
+
+    `None` means any value is supported
+    """
+
+    def __init__(self, name: str,
+                 mpi: bool = False,
+                 pmemd: bool = True,
+                 imin: Optional[Sequence[int]] = (0, 1),
+                 igb: Optional[Sequence[int]] = (0, 1, 2, 5, 7, 8),
+                 qmmm: bool = False,
+                 nmropt: bool = True,
+                 wt_types: Optional[Sequence[str]] = ("TEMP0", "TAUTP", "REST", "RESTS", "RESTL", "DUMPFREQ")):
+        self.name = name
+        self.mpi = mpi
+        self.pmemd = pmemd
+        self.imin: Optional[FrozenSet[int]] = None if imin is None else frozenset(imin)
+        self.igb: Optional[FrozenSet[int]] = None if igb is None else frozenset(igb)
+        self.qmmm = qmmm
+        self.nmropt = nmropt
+        self.wt_types: Optional[FrozenSet[str]] = None if wt_types is None else frozenset(wt_types)
+
+    def unsupported(self, inp: AmberInput) -> List[str]:
+        """ Features of `inp` which are not supported by engine """
+        cntrl = inp.namelist.get("cntrl", {})
+        result = []
+        if self.imin is not None and cntrl.get("imin", 0) not in self.imin:
+            result.append(f"imin={cntrl['imin']}")
+        if self.igb is not None and cntrl.get("igb", 0) not in self.igb:
+            result.append(f"igb={cntrl['igb']}")
+        if not self.qmmm and (cntrl.get("ifqnt", 0) != 0 or "qmmm" in inp.namelist):
+            result.append("qmmm")
+        if not self.nmropt and cntrl.get("nmropt", 0) != 0:
+            result.append(f"nmropt={cntrl['nmropt']}")
+        if self.wt_types is not None:
+            result.extend(f"&wt type={wt['type']}" for wt in inp.varying_conditions.wts
+                          if wt["type"].upper() not in self.wt_types)
+        return result
+
+    def __repr__(self):
+        return f"EngineSpec({self.name!r})"
+
+
+# Ordered from fastest to slowest
+DEFAULT_ENGINES = [
+    EngineSpec("pmemd.cuda"),
+    EngineSpec("pmemd.MPI", mpi=True),
+    EngineSpec("pmemd"),
+    EngineSpec("sander.MPI", mpi=True, pmemd=False, imin=None, igb=None, qmmm=True, wt_types=None),
+    EngineSpec("sander", pmemd=False, imin=None, igb=None, qmmm=True, wt_types=None),
+]
+
+
+class NoCompatibleEngineError(RuntimeError):
+    pass
+
+
+class EngineSelector:
+    """
+    Picks the fastest engine found on PATH which supports given `AmberInput`
+
+    MPI engines are launched as ``mpirun -np {mpi_ranks}`` and are skipped if `mpi_ranks` is None
+    """
+    # Arguments accepted by pmemd only, dropped when sander is selected
+    pmemd_only_arguments = ["logfile", "process_map_file", "allow_small_box"]
+
+    def __init__(self, engines: Sequence[EngineSpec] = DEFAULT_ENGINES,
+                 mpi_ranks: Optional[int] = None,
+                 mpirun: Sequence[str] = ("mpirun",),
+                 which: Callable[[str], Optional[str]] = shutil.which):
+        self.engines = list(engines)
+        self.mpi_ranks = mpi_ranks
+        self.mpirun = list(mpirun)
+        self.which = which
+        self._available: Optional[List[EngineSpec]] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_available"] = None  # PATH of other host may differ
+        return state
+
+    def available(self) -> List[EngineSpec]:
+        if self._available is None:
+            mpi_ok = self.mpi_ranks is not None and self.which(self.mpirun[0]) is not None
+            self._available = [spec for spec in self.engines
+                               if self.which(spec.name) is not None and (mpi_ok or not spec.mpi)]
+        return self._available
+
+    def select(self, inp: AmberInput) -> EngineSpec:
+        rejected = []
+        for spec in self.available():
+            unsupported = spec.unsupported(inp)
+            if not unsupported:
+                return spec
+            rejected.append(f"{spec.name} ({', '.join(unsupported)})")
+        raise NoCompatibleEngineError(f"No compatible engine among available: {'; '.join(rejected) or 'none'}")
+
+    def executable(self, spec: EngineSpec) -> List[str]:
+        path = self.which(spec.name)
+        if spec.mpi:
+            return self.mpirun + ["-np", str(self.mpi_ranks), path]
+        return [path]
+
+    def scope(self, command: SanderCommand, spec: EngineSpec) -> ScopeArguments:
+        """ Temporarily switches `command` to `spec` engine """
+        kwargs = dict(executable=self.executable(spec))
+        if not spec.pmemd:
+            kwargs.update({name: None for name in self.pmemd_only_arguments if hasattr(command, name)})
+        return ScopeArguments(command, kwargs)
@@ -44,10 +44,10 @@ class SanderCommand(Command):
         if Path(self.input).is_file():
             try:
                 with open(self.input) as file:
-                    inp = f90nml.reads(file)
-                    if inp.cntrl["ioutfm"] == 0:
+                    inp = f90nml.read(file)
+                    if inp["cntrl"]["ioutfm"] == 0:
                         return "rst7"  # plain ascii restart
-            except AttributeError:
+            except KeyError:
                 pass
         return "ncrst"  # binary restart
 
@@ -79,7 +79,37 @@ class ParmedCommand(Command):
     def __init__(self):
         super().__init__()
 
+        self.prmtop = OptionalStringArgument("-p")
         self.no_splash = OptionalBooleanArgument("--no-splash")
-        self.override = OptionalBooleanArgument("--override")
+        self.override = OptionalBooleanArgument("-O")  # --overwrite
         self.input = OptionalStringArgument("--input")
         self.log_file = OptionalStringArgument("--logfile")
+
+
+class CpptrajCommand(Command):
+    executable = ["cpptraj"]
+
+    def __init__(self):
+        super().__init__()
+
+        self.prmtop = OptionalStringArgument("-p")
+        self.input = OptionalStringArgument("-i")
+        self.trajectory = OptionalStringArgument("-y")
+        self.log_file = OptionalStringArgument("-o")
+
+
+class MMPBSACommand(Command):
+    executable = ["MMPBSA.py"]
+
+    def __init__(self):
+        super().__init__()
+
+        self.override = OptionalBooleanArgument("-O", True)
+        self.input = OptionalStringArgument("-i")
+        self.output = OptionalStringArgument("-o")
+        self.solvated_prmtop = OptionalStringArgument("-sp")
+        self.complex_prmtop = OptionalStringArgument("-cp")
+        self.receptor_prmtop = OptionalStringArgument("-rp")
+        self.ligand_prmtop = OptionalStringArgument("-lp")
+        self.trajectory = OptionalStringArgument("-y")
+        self.energy_output = OptionalStringArgument("-eo")
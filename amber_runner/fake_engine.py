@@ -0,0 +1,365 @@
+"""
+Stand-in for Amber executables (sander/pmemd/tleap/parmed/cpptraj/MMPBSA.py)
+producing realistically sized outputs without Amber installation
+
+Intended for tests and runner overhead benchmarks:
+
+    md.sander.executable = fake_executable("pmemd", runtime=0.5, failure_rate=0.01)
+    md.build.tleap.exe.executable = fake_executable("tleap", atoms=30000)
+
+Requires optional `numpy` package
+"""
+import hashlib
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+FAILURES = ["exit", "vlimit", "nan", "truncate"]
+
+
+def fake_executable(engine: str = "pmemd",
+                    runtime: float = 0.0,
+                    atoms: int = 3000,
+                    failure: Optional[str] = None,
+                    failure_rate: float = 0.0,
+                    seed: int = 0,
+                    timeline: Path = None) -> List[str]:
+    """
+    Builds `Command.executable` value which runs fake engine
+
+    :param engine: one of "sander", "pmemd", "tleap", "parmed", "cpptraj", "mmpbsa"
+    :param runtime: wall time of single engine call, seconds
+    :param atoms: number of atoms in systems built by fake tleap
+    :param failure: injected failure kind, one of `FAILURES`
+    :param failure_rate: probability of injected failure per call, decided by seed and output name
+    :param timeline: file to append engine start/end timestamps to
+    """
+    assert engine in ("sander", "pmemd", "tleap", "parmed", "cpptraj", "mmpbsa")
+    assert failure is None or failure in FAILURES
+    result = [sys.executable, "-m", "amber_runner.fake_engine", engine,
+              f"--runtime={runtime}", f"--atoms={atoms}", f"--failure-rate={failure_rate}", f"--seed={seed}"]
+    if failure is not None:
+        result.append(f"--failure={failure}")
+    if timeline is not None:
+        result.append(f"--timeline={Path(timeline).absolute()}")
+    return result + ["--"]
+
+
+class FakeEngine:
+    boolean_flags = {"-O", "-A", "-AllowSmallBox", "-s", "--no-splash"}
+
+    def __init__(self, engine: str, runtime=0.0, atoms=3000, failure=None, failure_rate=0.0, seed=0,
+                 timeline=None):
+        self.engine = engine
+        self.runtime = runtime
+        self.atoms = atoms
+        self.failure = failure
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.timeline = timeline
+
+    @classmethod
+    def from_argv(cls, argv: List[str]):
+        engine, options = argv[0], {}
+        for option in argv[1:]:
+            key, value = option[2:].split("=", 1)
+            options[key.replace("-", "_")] = value
+        return cls(engine,
+                   runtime=float(options.get("runtime", 0.0)),
+                   atoms=int(options.get("atoms", 3000)),
+                   failure=options.get("failure"),
+                   failure_rate=float(options.get("failure_rate", 0.0)),
+                   seed=int(options.get("seed", 0)),
+                   timeline=options.get("timeline"))
+
+    def parse_args(self, argv: List[str]) -> Dict[str, str]:
+        args = {}
+        i = 0
+        while i < len(argv):
+            if argv[i] in self.boolean_flags:
+                args[argv[i]] = True
+                i += 1
+            else:
+                args[argv[i]] = argv[i + 1]
+                i += 2
+        return args
+
+    def log_time(self, event: str):
+        if self.timeline is not None:
+            with open(self.timeline, "a") as f:
+                f.write(f"{event} {time.time():.6f}\n")
+
+    def run(self, argv: List[str]) -> int:
+        self.log_time("start")
+        try:
+            args = self.parse_args(argv)
+            time.sleep(self.runtime)
+            if self.engine == "tleap":
+                return self.run_tleap(args)
+            if self.engine == "parmed":
+                return self.run_parmed(args)
+            if self.engine == "mmpbsa":
+                return self.run_mmpbsa(args)
+            if self.engine == "cpptraj":
+                return self.run_cpptraj(args)
+            return self.run_sander(args)
+        finally:
+            self.log_time("end")
+
+    def injected_failure(self, key: str) -> Optional[str]:
+        if self.failure_rate <= 0:
+            return None
+        digest = hashlib.md5(f"{self.seed}:{key}".encode()).hexdigest()
+        rng = random.Random(int(digest, 16))
+        if rng.random() >= self.failure_rate:
+            return None
+        return self.failure if self.failure is not None else rng.choice(FAILURES)
+
+    def run_tleap(self, args) -> int:
+        with open(args["-f"]) as f:
+            commands = [line.split() for line in f]
+        atoms = self.atoms // 3 * 3
+        box = any(command[:1] in (["solvateoct"], ["solvatebox"]) for command in commands)
+        for command in commands:
+            if command[:1] == ["saveamberparm"]:
+                write_prmtop(Path(command[2]), atoms, box=box)
+                write_initial_restart(Path(command[3]), atoms, box=box)
+            if command[:1] == ["savepdb"]:
+                Path(command[2]).write_text("".join(
+                    f"ATOM  {i + 1:5d}  O   WAT {i // 3 + 1:5d}       0.000   0.000   0.000  1.00  0.00\n"
+                    for i in range(atoms)) + "END\n")
+        with open("leap.log", "a") as log:
+            log.write("\n".join(" ".join(c) for c in commands) + "\n")
+        return 0
+
+    def run_parmed(self, args) -> int:
+        """ Copies input topology to every `outparm` target, other commands are only logged """
+        prmtop = Path(args["-p"]).read_text()
+        with open(args["--input"]) as f:
+            commands = [line.split() for line in f]
+        for command in commands:
+            if command[:1] == ["outparm"]:
+                if Path(command[1]).exists() and not args.get("-O"):
+                    sys.stderr.write(f"{command[1]} exists; not overwriting\n")
+                    return 1
+                Path(command[1]).write_text(prmtop)
+        with open(args.get("--logfile", "parmed.log"), "a") as log:
+            log.write("\n".join(" ".join(c) for c in commands) + "\n")
+        return 0
+
+    def run_cpptraj(self, args) -> int:
+        """ Writes `out` data files with values determined by trajectory name, frame number and data set """
+        from .trajectory import count_frames
+
+        with open(args["-i"]) as f:
+            commands = [line.split() for line in f if line.strip()]
+        frames: List[Tuple[str, int]] = []
+        outputs: Dict[str, List[str]] = {}
+        for command in commands:
+            if command[0] == "trajin":
+                total = count_frames(Path(command[1]))
+                start = int(command[2]) if len(command) > 2 else 1
+                stop = total if len(command) < 4 or command[3] == "last" else int(command[3])
+                frames += [(Path(command[1]).name, frame) for frame in range(start, stop + 1)]
+            elif "out" in command[:-1]:
+                outputs.setdefault(command[command.index("out") + 1], []).append(command[1])
+        for filename, datasets in outputs.items():
+            lines = ["#Frame " + " ".join(f"{name:>12}" for name in datasets)]
+            for i, (trajectory, frame) in enumerate(frames):
+                values = [random.Random(f"{name}:{trajectory}:{frame}").uniform(0, 10) for name in datasets]
+                lines.append(f"{i + 1:8d}" + "".join(f" {value:12.4f}" for value in values))
+            Path(filename).write_text("\n".join(lines) + "\n")
+        Path(args.get("-o", "cpptraj.log")).write_text(f"CPPTRAJ: fake engine, {len(frames)} frames\n")
+        return 0
+
+    def run_mmpbsa(self, args) -> int:
+        """ Writes `-eo` CSV with DELTA TOTAL determined by trajectory name and frame number """
+        import f90nml
+        from .trajectory import count_frames
+
+        mdin = f90nml.read(args["-i"])
+        general = mdin["general"] if "general" in mdin else {}
+        frames = count_frames(Path(args["-y"]))
+        first, last = general.get("startframe", 1), min(general.get("endframe", frames), frames)
+        name = Path(args["-y"]).name
+        lines = []
+        for method, title in [("gb", "GENERALIZED BORN:"), ("pb", "POISSON BOLTZMANN:")]:
+            if method not in mdin:
+                continue
+            lines += [title, "Complex Energy Terms", "Frame #,BOND,TOTAL", "1,0.0,0.0", "",
+                      "DELTA Energy Terms", "Frame #,VDWAALS,EEL,DELTA TOTAL"]
+            for frame in range(first, last + 1):
+                key = hashlib.md5(f"{method}:{name}:{frame}".encode()).hexdigest()
+                value = -30.0 + random.Random(int(key, 16)).gauss(0.0, 3.0)
+                lines.append(f"{frame - first + 1},{value / 2:.4f},{value / 2:.4f},{value:.4f}")
+            lines.append("")
+        Path(args["-eo"]).write_text("\n".join(lines) + "\n")
+        Path(args["-o"]).write_text(f"| Run on fake engine\n| Frames {first}-{last} of {name}\n")
+        return 0
+
+    def run_sander(self, args) -> int:
+        import f90nml
+        import numpy as np
+        from .restart import Restart, write_nctraj
+
+        mdin = f90nml.read(args["-i"])
+        cntrl = mdin["cntrl"] if "cntrl" in mdin else {}
+        imin = cntrl.get("imin", 0)
+        n_steps = cntrl.get("maxcyc", 1) if imin == 1 else cntrl.get("nstlim", 1)
+        ntpr = max(1, cntrl.get("ntpr", 50))
+        ntwx = cntrl.get("ntwx", 0) if imin == 0 else 0
+        dt = cntrl.get("dt", 0.001)
+
+        failure = self.injected_failure(args["-o"])
+
+        initial = Restart.read(args["-c"])
+        rng = np.random.RandomState(int(hashlib.md5(args["-o"].encode()).hexdigest()[:8], 16))
+        coordinates = initial.coordinates + rng.normal(scale=0.1, size=initial.coordinates.shape)
+        elapsed = 0.0 if imin == 1 else n_steps * dt
+
+        with open(args["-o"], "w") as out:
+            out.write(mdout_header(self.engine, args, mdin))
+            for step in range(ntpr, n_steps + 1, ntpr):
+                if failure == "exit" and step > n_steps // 2:
+                    return 1
+                out.write(mdout_record(step, initial.time + step * dt, rng))
+            if failure == "vlimit":
+                out.write(f"vlimit exceeded for step{n_steps:9d}; vmax =    21.3456\n")
+            if failure != "truncate":
+                ns_per_day = elapsed * 1e-3 / max(self.runtime, 1e-3) * 86400
+                out.write(mdout_footer(self.engine, ns_per_day, self.runtime))
+
+        if "-inf" in args:
+            Path(args["-inf"]).write_text(mdout_record(n_steps, initial.time + elapsed, rng))
+
+        if failure == "nan":
+            coordinates[0, 0] = np.nan
+        velocities = None if imin == 1 else rng.normal(size=coordinates.shape)
+        Restart(coordinates, velocities, initial.box, time=initial.time + elapsed).write(
+            args["-r"], "rst7" if cntrl.get("ioutfm", 1) == 0 else "ncrst")
+
+        if ntwx > 0 and "-x" in args:
+            n_frames = n_steps // ntwx
+            frames = (coordinates[np.newaxis, :, :] +
+                      rng.normal(scale=0.1, size=(n_frames,) + coordinates.shape)).astype(np.float32)
+            box = None if initial.box is None else np.tile(initial.box, (n_frames, 1))
+            write_nctraj(args["-x"], frames, initial.time + dt * ntwx * np.arange(1, n_frames + 1), box)
+        return 0
+
+
+def mdout_header(engine: str, args: Dict[str, str], mdin) -> str:
+    files = "\n".join(f"|  {key:>6}: {value}" for key, value in args.items() if value is not True)
+    return f"""
+          -------------------------------------------------------
+          Amber 20 {engine.upper()}                              2020
+          -------------------------------------------------------
+
+| Run on fake engine
+
+File Assignments:
+{files}
+
+ Here is the input file:
+
+{mdin}
+
+--------------------------------------------------------------------------------
+   4.  RESULTS
+--------------------------------------------------------------------------------
+
+"""
+
+
+def mdout_record(step: int, time_ps: float, rng) -> str:
+    e = rng.normal(size=12)
+    return f"""
+ NSTEP = {step:8d}   TIME(PS) = {time_ps:11.3f}  TEMP(K) = {300 + e[0]:8.2f}  PRESS = {e[1] * 10:8.1f}
+ Etot   = {-12345 + e[2] * 10:14.4f}  EKtot   = {2345 + e[3] * 10:14.4f}  EPtot      = {-14690 + e[4] * 10:14.4f}
+ BOND   = {120 + e[5]:14.4f}  ANGLE   = {340 + e[6]:14.4f}  DIHED      = {560 + e[7]:14.4f}
+ 1-4 NB = {110 + e[8]:14.4f}  1-4 EEL = {2220 + e[9]:14.4f}  VDWAALS    = {3330 + e[10]:14.4f}
+ EELEC  = {-22220 + e[11] * 10:14.4f}  EHBOND  = {0.0:14.4f}  RESTRAINT  = {0.0:14.4f}
+ EKCMT  = {1111.1111:14.4f}  VIRIAL  = {1111.1111:14.4f}  VOLUME     = {27000.0:14.4f}
+                                                    Density    = {1.0 + e[1] * 0.001:14.4f}
+ ------------------------------------------------------------------------------
+"""
+
+
+def mdout_footer(engine: str, ns_per_day: float, runtime: float) -> str:
+    master = "Master " if engine == "pmemd" else ""
+    return f"""
+--------------------------------------------------------------------------------
+   5.  TIMINGS
+--------------------------------------------------------------------------------
+
+|  Average timings for all steps:
+|     Elapsed(s) = {runtime:14.2f} Per Step(ms) = {0.0:12.2f}
+|         ns/day = {ns_per_day:11.2f}   seconds/ns = {86400 / max(ns_per_day, 1e-9):11.2f}
+|  {master}Total wall time: {int(runtime):12d}    seconds     0.00 hours
+"""
+
+
+def initial_box(atoms: int):
+    side = (atoms / 0.1) ** (1 / 3)  # ~0.1 atoms per cubic angstrom
+    return side, [side, side, side, 109.4712190, 109.4712190, 109.4712190]
+
+
+def write_initial_restart(filename: Path, atoms: int, box: bool):
+    import numpy as np
+    from .restart import Restart
+
+    side, dimensions = initial_box(atoms)
+    rng = np.random.RandomState(atoms)
+    Restart(rng.uniform(0, side, size=(atoms, 3)), box=np.array(dimensions) if box else None,
+            title="default_name").write(filename, "rst7")
+
+
+def write_prmtop(filename: Path, atoms: int, box: bool):
+    """ Writes topology of `atoms // 3` TIP3P-like waters, only per-atom and per-residue sections are populated """
+    n_res = atoms // 3
+
+    def section(flag, fmt, values, width, per_line, render):
+        lines = [f"%FLAG {flag}", f"%FORMAT({fmt})"]
+        for i in range(0, len(values), per_line):
+            lines.append("".join(render(v).rjust(width) if not isinstance(v, str) else render(v).ljust(width)
+                                 for v in values[i:i + per_line]))
+        if not values:
+            lines.append("")
+        return "\n".join(lines) + "\n"
+
+    def integers(flag, values):
+        return section(flag, "10I8", values, 8, 10, str)
+
+    def reals(flag, values):
+        return section(flag, "5E16.8", values, 16, 5, lambda v: f"{v:.8E}")
+
+    def strings(flag, values):
+        return section(flag, "20a4", values, 4, 20, str)
+
+    pointers = [atoms, 2, 2 * n_res, 0, n_res, 0, 0, 0, 0, 0, 3 * n_res, n_res, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0,
+                0, 0, 0, 0, 1 if box else 0, 3, 0, 0]
+    text = "%VERSION  VERSION_STAMP = V0001.000  DATE = 01/01/20  00:00:00\n"
+    text += strings("TITLE", ["default_name"])
+    text += integers("POINTERS", pointers)
+    text += strings("ATOM_NAME", ["O", "H1", "H2"] * n_res)
+    text += reals("CHARGE", [-0.834 * 18.2223, 0.417 * 18.2223, 0.417 * 18.2223] * n_res)
+    text += integers("ATOMIC_NUMBER", [8, 1, 1] * n_res)
+    text += reals("MASS", [16.0, 1.008, 1.008] * n_res)
+    text += integers("ATOM_TYPE_INDEX", [1, 2, 2] * n_res)
+    text += strings("RESIDUE_LABEL", ["WAT"] * n_res)
+    text += integers("RESIDUE_POINTER", list(range(1, atoms + 1, 3)))
+    text += strings("AMBER_ATOM_TYPE", ["OW", "HW", "HW"] * n_res)
+    if box:
+        _, dimensions = initial_box(atoms)
+        text += reals("BOX_DIMENSIONS", [dimensions[3]] + dimensions[:3])
+    filename.write_text(text)
+
+
+def main(argv: List[str]):
+    separator = argv.index("--")
+    return FakeEngine.from_argv(argv[:separator]).run(argv[separator + 1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,122 @@
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .inputs import AmberInput
+
+
+class SegmentHealthError(RuntimeError):
+    pass
+
+
+class ScopeNamelistValues:
+    """
+    Allows to temporary alter AmberInput namelist values, e.g. {"cntrl": {"dt": 0.001}}
+    Restores original values on exit
+    """
+
+    def __init__(self, amber_input: AmberInput, settings: Dict[str, Dict[str, Any]]):
+        self.amber_input = amber_input
+        self.settings = settings
+        self.backup = []
+
+    def __enter__(self):
+        for group, values in self.settings.items():
+            namelist = self.amber_input._get(group)
+            for k, v in values.items():
+                self.backup.append((namelist, k, k in namelist, namelist.get(k)))
+                namelist[k] = v
+        return self.amber_input
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for namelist, k, existed, v in reversed(self.backup):
+            if existed:
+                namelist[k] = v
+            else:
+                del namelist[k]
+        self.backup = []
+
+
+class SegmentHealthCheck:
+    """
+    Cheap sanity check of engine outputs performed after each segment
+
+    Only the tail of mdout is read; restart is checked for non-finite values and box explosion
+    relative to the last good restart
+    """
+    error_markers = [
+        "vlimit exceeded",
+        "Coordinate resetting",  # SHAKE failure
+        "NaN",
+        "*****",
+        "Terminated Abnormally",
+        "ERROR",
+    ]
+    completion_marker = "Total wall time"
+
+    def __init__(self,
+                 tail_size: int = 16 * 1024,
+                 error_markers: List[str] = None,
+                 check_restart: bool = True,
+                 max_box_change: float = 1.1,
+                 max_retries: int = 1,
+                 retry_settings: List[Dict[str, Dict[str, Any]]] = None):
+        """
+        :param tail_size: number of trailing mdout bytes to scan
+        :param max_box_change: maximal allowed ratio of box lengths between consecutive restarts
+        :param max_retries: number of retries of failed segment
+        :param retry_settings: namelist values for consecutive retries, e.g. [{"cntrl": {"dt": 0.001}}],
+                               overrides `max_retries`
+        """
+        if error_markers is not None:
+            self.error_markers = error_markers
+        self.tail_size = tail_size
+        self.check_restart = check_restart
+        self.max_box_change = max_box_change
+        self.retry_settings = retry_settings if retry_settings is not None else [{}] * max_retries
+
+    def check(self, mdout: Path, restrt: Path, last_good_restrt: Optional[Path] = None) -> List[str]:
+        """ Returns list of found problems, empty list means segment is healthy """
+        problems = self.check_mdout(Path(mdout))
+        if self.check_restart and not problems:
+            problems += self.check_restrt(Path(restrt), last_good_restrt)
+        return problems
+
+    def check_mdout(self, mdout: Path) -> List[str]:
+        if not mdout.is_file():
+            return [f"{mdout} is missing"]
+        with mdout.open("rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - self.tail_size))
+            tail = f.read().decode(errors="replace")
+        problems = [f"{mdout}: `{marker}` found" for marker in self.error_markers if marker in tail]
+        if self.completion_marker and self.completion_marker not in tail:
+            problems.append(f"{mdout}: `{self.completion_marker}` not found")
+        return problems
+
+    def check_restrt(self, restrt: Path, last_good_restrt: Optional[Path] = None) -> List[str]:
+        import numpy as np
+        from .restart import Restart
+
+        if not restrt.is_file():
+            return [f"{restrt} is missing"]
+        try:
+            restart = Restart.read(restrt)
+        except (ValueError, RuntimeError, AssertionError) as e:
+            return [f"{restrt}: unreadable ({e})"]
+
+        for name in ["coordinates", "velocities", "box"]:
+            values = getattr(restart, name)
+            if values is not None and not np.isfinite(values).all():
+                return [f"{restrt}: non-finite {name}"]
+
+        if restart.box is not None and last_good_restrt is not None and Path(last_good_restrt).is_file():
+            try:
+                reference = Restart.read(last_good_restrt)
+            except (ValueError, RuntimeError, AssertionError):
+                return []
+            if reference.box is not None:
+                ratio = np.asarray(restart.box[:3]) / np.asarray(reference.box[:3])
+                if (ratio > self.max_box_change).any() or (ratio < 1 / self.max_box_change).any():
+                    return [f"{restrt}: box changed from {list(reference.box[:3])} to {list(restart.box[:3])}"]
+        return []
@@ -1,3 +1,4 @@
+import io
 import os
 from typing import List, Tuple, Union, TextIO, Dict, TypeVar  # , Literal
 
@@ -18,6 +19,12 @@ class InputWriter:
     def write(self, output: TextIO):
         raise NotImplementedError()
 
+    def render(self, filename: str) -> Tuple[str, Dict[str, str]]:
+        """ Content of input file `filename` and of auxiliary files it refers to (by file name) """
+        with io.StringIO() as out:
+            self.write(out)
+            return out.getvalue(), {}
+
 
 class Namelist(f90nml.namelist.Namelist):
 
@@ -98,6 +105,9 @@ class ParmedInput(InputWriter):
     def delete_dihedral(self, mask1, mask2, mask3, mask4):
         self.add_command(f"deleteDihedral {mask1} {mask2} {mask3} {mask4}")
 
+    def hmass_repartition(self, hydrogen_mass: float = 3.024, dowater: bool = False):
+        self.add_command(f"HMassRepartition {hydrogen_mass:f}" + (" dowater" if dowater else ""))
+
     def save(self, output_name):
         self.add_command(f"outparm {output_name}.prmtop")
 
@@ -109,6 +119,79 @@ class ParmedInput(InputWriter):
         output.write("\n".join(self.commands))
 
 
+class CpptrajInput(InputWriter):
+    def __init__(self):
+        self._commands = []
+
+    def add_command(self, command):
+        self._commands.append(command)
+
+    def trajin(self, filename, start: int = 1, stop="last", offset: int = 1):
+        self.add_command(f"trajin {filename} {start} {stop} {offset}")
+
+    def reference(self, filename, name=None):
+        self.add_command(f"reference {filename}" + (f" [{name}]" if name else ""))
+
+    def rms(self, name, mask, reference="first", out=None):
+        self.add_command(f"rms {name} {mask} {reference}" + (f" out {out}" if out else ""))
+
+    def distance(self, name, mask1, mask2, out=None):
+        self.add_command(f"distance {name} {mask1} {mask2}" + (f" out {out}" if out else ""))
+
+    def radgyr(self, name, mask, out=None):
+        self.add_command(f"radgyr {name} {mask}" + (f" out {out}" if out else ""))
+
+    def trajout(self, filename, *args):
+        self.add_command(" ".join(["trajout", str(filename)] + [str(a) for a in args]))
+
+    def run(self):
+        self.add_command("run")
+
+    @property
+    def commands(self):
+        return self._commands
+
+    @property
+    def data_files(self) -> List[str]:
+        """ Files named by `out` keyword, in order of appearance """
+        result = []
+        for command in self.commands:
+            tokens = command.split()
+            for keyword, value in zip(tokens, tokens[1:]):
+                if keyword == "out" and value not in result:
+                    result.append(value)
+        return result
+
+    def write(self, output: TextIO):
+        output.write("\n".join(self.commands))
+
+
+class MMPBSAInput(InputWriter):
+    def __init__(self):
+        self.namelist = Namelist()
+
+    @property
+    def general(self) -> Namelist:
+        return self._get("general")
+
+    @property
+    def gb(self) -> Namelist:
+        return self._get("gb")
+
+    @property
+    def pb(self) -> Namelist:
+        return self._get("pb")
+
+    def _get(self, name):
+        if name not in self.namelist:
+            self.namelist[name] = Namelist()
+        return self.namelist[name]
+
+    def write(self, output: TextIO):
+        output.write("Generated by amber_runner\n")
+        self.namelist.write(output)
+
+
 class FlatWelledParabola:
 
     def __init__(self, r1: float, r2: float, r3: float, r4: float, k2: float, k3: float):
@@ -120,6 +203,22 @@ class FlatWelledParabola:
         self.k3 = k3
 
 
+class RampedFlatWelledParabola(FlatWelledParabola):
+    """
+    Penalty active from step `nstep1` to `nstep2` of a run, Amber changes it linearly towards `end` values
+    """
+
+    def __init__(self, start: FlatWelledParabola, end: FlatWelledParabola, nstep1: int, nstep2: int):
+        super().__init__(start.r1, start.r2, start.r3, start.r4, start.k2, start.k3)
+        self.end = end
+        self.nstep1 = nstep1
+        self.nstep2 = nstep2
+
+    @property
+    def is_constant(self) -> bool:
+        return all(getattr(self, key) == getattr(self.end, key) for key in ("r1", "r2", "r3", "r4", "k2", "k3"))
+
+
 class AmberNMRRestraints(Dict[RestraintAtomIdTuple, List[FlatWelledParabola]], InputWriter):
 
     def add(self, atoms: RestraintAtomIdTuple, penalty: FlatWelledParabola):
@@ -158,10 +257,17 @@ class AmberNMRRestraints(Dict[RestraintAtomIdTuple, List[FlatWelledParabola]], I
         for ats, penalties in self.items():
             cs_ats = ','.join(map(str, ats))
             for penalty in penalties:
+                ramp = ""
+                if isinstance(penalty, RampedFlatWelledParabola):
+                    ramp = f",\n     nstep1={penalty.nstep1}, nstep2={penalty.nstep2}"
+                    if not penalty.is_constant:
+                        end = penalty.end
+                        ramp += f", ifvari=1,\n     r1a={end.r1}, r2a={end.r2}, r3a={end.r3}, r4a={end.r4}, " \
+                                f"rk2a={end.k2}, rk3a={end.k3}"
                 output.write(f"""
 &rst  !
      iat={cs_ats}, r1={penalty.r1}, r2={penalty.r2}, r3={penalty.r3}, r4={penalty.r4},
-     rk2={penalty.k2}, rk3={penalty.k3}
+     rk2={penalty.k2}, rk3={penalty.k3}{ramp}
 &end
 """)
 
@@ -230,6 +336,12 @@ class AmberInput(InputWriter):
 
             self.validate()
 
+        @classmethod
+        def from_atoms(cls, title: str, indices, weight: float = None) -> 'AmberInput.GroupSelection':
+            """ Group of 0-based atom `indices`, e.g. selected by `amber_runner.mask.AtomSelector` """
+            from .mask import index_ranges
+            return cls(title, weight=weight, atom_id_ranges=index_ranges(indices))
+
         def write(self, out: TextIO):
             self.validate()
             out.write(f"{self.title}\n")
@@ -335,19 +447,33 @@ class AmberInput(InputWriter):
             raise RuntimeError("cntrl.ntr>0 is required to be >0 in order to use `restraintmask`")
 
     def write(self, output: TextIO):
+        text, files = self.render(getattr(output, "name", None))
+        for filename, content in files.items():
+            if os.path.lexists(filename):
+                os.unlink(filename)  # may be a read-only link to `InputStore`
+            with open(filename, "w") as out:
+                out.write(content)
+        output.write(text)
+
+    def render(self, filename: str) -> Tuple[str, Dict[str, str]]:
+        """ Input text and DISANG file content, DISANG defaults to `{filename}.disang` """
         self.validate()
         title = "Generated by amber_runner"
+        files = {}
         if len(self.restraints) > 0:
             if "DISANG" not in self.file_redirections:
-                self.file_redirections["DISANG"] = f"{output.name}.disang"
-            with open(self.file_redirections["DISANG"], "w") as rout:
+                self.file_redirections["DISANG"] = f"{filename}.disang"
+            with io.StringIO() as rout:
                 self.restraints.write(rout)
-
-        output.write(f"{title}\n")
-        self.namelist.write(output)
-        self.varying_conditions.write(output)
-        self.file_redirections.write(output)
-        self.group_selections.write(output)
+                files[self.file_redirections["DISANG"]] = rout.getvalue()
+
+        with io.StringIO() as output:
+            output.write(f"{title}\n")
+            self.namelist.write(output)
+            self.varying_conditions.write(output)
+            self.file_redirections.write(output)
+            self.group_selections.write(output)
+            return output.getvalue(), files
 
     @property
     def cntrl(self) -> Namelist:
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+def file_digest(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OutputManifest:
+    """
+    Append-only JSON-lines log of files produced by protocol steps
+
+    Every record holds path (relative to protocol directory), step, segment, size, mtime_ns, sha1 and
+    `immutable` flag. Positions are byte offsets in the manifest file, a sync layer remembers the position it
+    has transferred up to and asks for `changed_since(position)`. Files recorded as immutable
+    (completed segments) are never stat'ed or hashed again, only their removal is recorded (``deleted: true``).
+    Records may be added from background threads (see `MdProtocol.output_recorder()`)
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._latest: Optional[Dict[str, Dict]] = None
+        self._lock = threading.RLock()
+
+    @property
+    def position(self) -> int:
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def read(self, position: int = 0) -> Tuple[List[Dict], int]:
+        """ Records appended after `position` and position of manifest end """
+        if not self.path.exists():
+            return [], 0
+        with self.path.open("rb") as f:
+            f.seek(position)
+            data = f.read()
+        end = position + data.rfind(b"\n") + 1  # ignore partially written record
+        return [json.loads(line) for line in data[:end - position].splitlines()], end
+
+    def changed_since(self, position: int = 0) -> Tuple[List[Dict], int]:
+        """ Latest record of every path changed after `position`, in order of change """
+        records, end = self.read(position)
+        positions = {record["path"]: i for i, record in enumerate(records)}
+        return [records[i] for i in sorted(positions.values())], end
+
+    def latest(self) -> Dict[str, Dict]:
+        with self._lock:
+            if self._latest is None:
+                self._latest = {record["path"]: record for record in self.read()[0]}
+            return self._latest
+
+    def append(self, records: List[Dict]):
+        if not records:
+            return
+        with self._lock:
+            with self.path.open("a") as out:
+                for record in records:
+                    out.write(json.dumps(record, sort_keys=True) + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+            latest = self.latest()
+            for record in records:
+                latest[record["path"]] = record
+
+    def remove(self, paths: Iterable[Path], step: str, segment: Optional[int] = None) -> List[Dict]:
+        """ Records removal of recorded `paths` (relative to protocol directory), returns appended records """
+        with self._lock:
+            latest = self.latest()
+            removed = [dict(path=str(path), step=step, segment=segment, deleted=True, immutable=True)
+                       for path in paths if str(path) in latest and not latest[str(path)].get("deleted")]
+            self.append(removed)
+            return removed
+
+    def record(self, root: Path, paths: Iterable[Path], step: str, segment: Optional[int] = None,
+               immutable: bool = True) -> List[Dict]:
+        """ Records new or changed `paths` (relative to `root`), returns appended records """
+        with self._lock:
+            return self._record(Path(root), paths, step, segment, immutable)
+
+    def _record(self, root: Path, paths: Iterable[Path], step: str, segment: Optional[int],
+                immutable: bool) -> List[Dict]:
+        latest = self.latest()
+        records = []
+        for path in paths:
+            key = str(path)
+            previous = latest.get(key)
+            if previous is not None and previous["immutable"] and not previous.get("deleted"):
+                continue
+            stat = (root / path).stat()
+            if previous is not None and not previous.get("deleted") and \
+                    (previous["size"], previous["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                if previous["immutable"] == immutable:
+                    continue
+            records.append(dict(path=key, step=step, segment=segment, size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                                sha1=file_digest(root / path), immutable=immutable))
+        self.append(records)
+        return records
+
+    def scan(self, root: Path, directory: Path, step: str, segment: Optional[int] = None,
+             immutable: bool = True, exclude: Iterable[str] = ()) -> List[Dict]:
+        """ Records new, changed and removed files under `directory` (relative to `root`) """
+        root = Path(root)
+        exclude = set(exclude)
+        present = []
+        for dirpath, _, filenames in os.walk(root / directory):
+            relative = Path(dirpath).relative_to(root)
+            present.extend(relative / name for name in sorted(filenames) if name not in exclude)
+        prefix = f"{directory}{os.sep}"
+        present_keys = {str(path) for path in present}
+        with self._lock:
+            removed = self.remove([key for key in self.latest() if key.startswith(prefix) and key not in present_keys],
+                                  step, segment)
+            return removed + self._record(root, present, step, segment, immutable)
@@ -0,0 +1,228 @@
+"""
+Amber mask selections evaluated on `Prmtop` arrays:
+
+    selector = AtomSelector(Prmtop("complex.prmtop"), Restart.read("complex.rst7").coordinates)
+    heavy = selector.indices(":1-50&!@H*")
+    inp.pin(AmberInput.GroupSelection.from_atoms("Backbone", selector.indices(":1-50@CA,C,N"), weight=5.0))
+    inp.restraints.distance(selector.atom_id(":5@CA"), selector.atom_id(":40@CA"), penalty)
+
+Supported syntax: ``:`` residue numbers/ranges/names, ``@`` atom numbers/ranges/names, ``@%`` atom types,
+``*`` and ``?`` wildcards, ``!``, ``&``, ``|``, parentheses and distance operators ``<@d``, ``>@d`` (atoms),
+``<:d``, ``>:d`` (whole residues) applied to the preceding selection. Distances ignore periodic images.
+
+Requires optional `numpy` package
+"""
+import fnmatch
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .prmtop import Prmtop
+
+_TOKEN = re.compile(r"\s*(?:(?P<distance>[<>][:@][0-9.]+)|(?P<op>[!&|()])|(?P<selector>[^\s!&|()<>]+))")
+
+
+class MaskSyntaxError(ValueError):
+    pass
+
+
+def within(coordinates: np.ndarray, reference: np.ndarray, cutoff: float, chunk_pairs: int = 1 << 22,
+           max_cells: int = 1 << 24) -> np.ndarray:
+    """
+    Boolean array of atoms closer than `cutoff` to any of `reference` atoms
+
+    Reference atoms are binned into a grid with cells of `cutoff` size, only atoms in cells next to an occupied
+    one are compared with reference atoms of their 27 neighbouring cells
+    """
+    result = np.zeros(len(coordinates), dtype=bool)
+    reference = np.asarray(reference, dtype=float).reshape(-1, 3)
+    if not len(reference):
+        return result
+    lo, hi = reference.min(axis=0) - cutoff, reference.max(axis=0) + cutoff
+    size = max(cutoff, float(np.prod(hi - lo) / max_cells) ** (1 / 3), 1e-3)
+    shape = np.floor((hi - lo) / size).astype(np.int64) + 3  # one empty cell on every side
+    strides = np.array([shape[1] * shape[2], shape[2], 1])
+
+    def cell_keys(points: np.ndarray) -> np.ndarray:
+        return (np.minimum(np.floor((points - lo) / size).astype(np.int64), shape - 3) + 1) @ strides
+
+    reference_keys = cell_keys(reference)
+    order = np.argsort(reference_keys, kind="stable")
+    reference, reference_keys = reference[order], reference_keys[order]
+    occupancy = np.bincount(reference_keys, minlength=int(np.prod(shape)))
+    cell_start = np.concatenate([[0], np.cumsum(occupancy)])
+    occupied = occupancy.reshape(shape) > 0
+    near = occupied.copy()  # cells with a reference atom in the 27 neighbours
+    for axis in range(3):
+        shifted = near.copy()
+        shifted[(slice(None),) * axis + (slice(1, None),)] |= near[(slice(None),) * axis + (slice(None, -1),)]
+        shifted[(slice(None),) * axis + (slice(None, -1),)] |= near[(slice(None),) * axis + (slice(1, None),)]
+        near = shifted
+    near = near.reshape(-1)
+
+    candidates = np.flatnonzero(((coordinates >= lo) & (coordinates <= hi)).all(axis=1))
+    keys = cell_keys(coordinates[candidates])
+    candidates, keys = candidates[near[keys]], keys[near[keys]]
+    points = coordinates[candidates]
+    found = np.zeros(len(candidates), dtype=bool)
+    offsets = sorted(np.ndindex(3, 3, 3), key=lambda offset: sum(abs(i - 1) for i in offset))  # own cell first
+    for offset in offsets:
+        pending = np.flatnonzero(~found)
+        neighbour = keys[pending] + (np.array(offset) - 1) @ strides
+        start, counts = cell_start[neighbour], occupancy[neighbour]
+        pending, start, counts = pending[counts > 0], start[counts > 0], counts[counts > 0]
+        ends = np.cumsum(counts)
+        bounds = np.searchsorted(ends, np.arange(chunk_pairs, ends[-1] if len(ends) else 0, chunk_pairs))
+        for first, last in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(pending)]])):
+            if first == last:
+                continue
+            n = counts[first:last]
+            atoms = np.repeat(pending[first:last], n)
+            pairs = np.arange(int(n.sum())) - np.repeat(np.cumsum(n) - n, n) + np.repeat(start[first:last], n)
+            delta = points[atoms] - reference[pairs]
+            found[atoms[np.einsum("ij,ij->i", delta, delta) <= cutoff * cutoff]] = True
+    result[candidates[found]] = True
+    return result
+
+
+def index_ranges(indices: np.ndarray) -> List[Tuple[int, int]]:
+    """ Inclusive 1-based ranges of consecutive atoms, e.g. [0, 1, 2, 5] -> [(1, 3), (6, 6)] """
+    indices = np.unique(np.asarray(indices, dtype=np.int64))
+    if not len(indices):
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1)
+    starts = np.concatenate([[indices[0]], indices[breaks + 1]]) + 1
+    ends = np.concatenate([indices[breaks], [indices[-1]]]) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def mask_string(indices: np.ndarray) -> str:
+    """ Compact Amber mask selecting `indices`, e.g. for `restraintmask` """
+    return "@" + ",".join(str(first) if first == last else f"{first}-{last}" for first, last in index_ranges(indices))
+
+
+class AtomSelector:
+    """
+    Evaluates Amber masks to atom indices, distance operators require `coordinates` (N, 3)
+    """
+
+    def __init__(self, topology: Prmtop, coordinates: Optional[np.ndarray] = None):
+        self.topology = topology
+        self.coordinates = None if coordinates is None else np.asarray(coordinates, dtype=float).reshape(-1, 3)
+
+    def select(self, mask: str) -> np.ndarray:
+        """ Boolean array of selected atoms """
+        self._tokens = [match for match in _TOKEN.finditer(mask) if match.group(0).strip()]
+        if "".join(match.group(0) for match in self._tokens).replace(" ", "") != mask.replace(" ", ""):
+            raise MaskSyntaxError(f"Can't parse mask `{mask}`")
+        self._position = 0
+        self._mask = mask
+        result = self._union()
+        if self._position != len(self._tokens):
+            raise MaskSyntaxError(f"Unexpected `{self._tokens[self._position].group(0).strip()}` in `{mask}`")
+        return result
+
+    def indices(self, mask: str) -> np.ndarray:
+        """ 0-based indices of selected atoms """
+        return np.flatnonzero(self.select(mask))
+
+    def atom_id(self, mask: str) -> int:
+        """ 1-based number of the single atom selected by `mask`, as used by NMR restraints """
+        indices = self.indices(mask)
+        if len(indices) != 1:
+            raise ValueError(f"Mask `{mask}` selects {len(indices)} atoms instead of one")
+        return int(indices[0]) + 1
+
+    def _peek(self) -> Optional[str]:
+        if self._position < len(self._tokens):
+            return self._tokens[self._position].group(0).strip()
+        return None
+
+    def _take(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise MaskSyntaxError(f"Unexpected end of `{self._mask}`")
+        self._position += 1
+        return token
+
+    def _union(self) -> np.ndarray:
+        result = self._intersection()
+        while self._peek() == "|":
+            self._take()
+            result = result | self._intersection()
+        return result
+
+    def _intersection(self) -> np.ndarray:
+        result = self._negation()
+        while self._peek() == "&":
+            self._take()
+            result = result & self._negation()
+        return result
+
+    def _negation(self) -> np.ndarray:
+        if self._peek() == "!":
+            self._take()
+            return ~self._negation()
+        result = self._primary()
+        while self._peek() is not None and self._peek()[0] in "<>":
+            result = self._distance(result, self._take())
+        return result
+
+    def _primary(self) -> np.ndarray:
+        token = self._take()
+        if token == "(":
+            result = self._union()
+            if self._take() != ")":
+                raise MaskSyntaxError(f"Unbalanced parentheses in `{self._mask}`")
+            return result
+        if token in "&|)" or token[0] in "<>":
+            raise MaskSyntaxError(f"Unexpected `{token}` in `{self._mask}`")
+        return self._selector(token)
+
+    def _selector(self, token: str) -> np.ndarray:
+        if token == "*":
+            return np.ones(self.topology.n_atoms, dtype=bool)
+        match = re.fullmatch(r"(?::([^@]*))?(?:@(.*))?", token)
+        if match is None or (match.group(1) is None and match.group(2) is None):
+            raise MaskSyntaxError(f"Unknown selector `{token}` in `{self._mask}`")
+        result = np.ones(self.topology.n_atoms, dtype=bool)
+        if match.group(1) is not None:
+            residues = self._match(match.group(1), "RESIDUE_LABEL", self.topology.n_residues)
+            result &= residues[self.topology.residue_index]
+        if match.group(2) is not None:
+            atoms = match.group(2)
+            if atoms.startswith("%"):
+                result &= self._match(atoms[1:], "AMBER_ATOM_TYPE", self.topology.n_atoms, numbers=False)
+            else:
+                result &= self._match(atoms, "ATOM_NAME", self.topology.n_atoms)
+        return result
+
+    def _match(self, items: str, flag: str, size: int, numbers: bool = True) -> np.ndarray:
+        result = np.zeros(size, dtype=bool)
+        patterns = []
+        for item in items.split(","):
+            if not item:
+                raise MaskSyntaxError(f"Empty list item in `{self._mask}`")
+            number = re.fullmatch(r"(\d+)(?:-(\d+))?", item) if numbers else None
+            if number is not None:
+                first = int(number.group(1))
+                last = int(number.group(2) or first)
+                result[max(first - 1, 0):last] = True
+            else:
+                patterns.append(item)
+        if patterns:
+            unique, inverse = self.topology.names(flag)
+            matched = np.array([any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns) for name in unique])
+            result |= matched[inverse] if len(unique) else np.zeros(size, dtype=bool)
+        return result
+
+    def _distance(self, selected: np.ndarray, operator: str) -> np.ndarray:
+        if self.coordinates is None:
+            raise ValueError(f"Distance operator `{operator}` requires coordinates")
+        close = within(self.coordinates, self.coordinates[selected], float(operator[2:]))
+        if operator[1] == ":":
+            residues = np.zeros(self.topology.n_residues, dtype=bool)
+            residues[self.topology.residue_index[close]] = True
+            close = residues[self.topology.residue_index]
+        return close if operator[0] == "<" else ~close
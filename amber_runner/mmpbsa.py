@@ -0,0 +1,59 @@
+import csv
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+METHODS = {"GENERALIZED BORN:": "gb", "POISSON BOLTZMANN:": "pb"}
+
+
+class FrameChunk(NamedTuple):
+    index: int
+    trajectory: Path  # absolute path
+    start: int  # first frame within trajectory, 0-based
+    frames: int
+    offset: int  # position of first frame in the whole frame range
+
+
+def split_frames(ranges: List[tuple], chunk_frames: int) -> List[FrameChunk]:
+    """ Splits frame ranges into chunks of at most `chunk_frames`, chunks don't cross trajectory files """
+    merged: List[list] = []
+    for trajectory, start, frames in ranges:
+        if merged and merged[-1][0] == trajectory and merged[-1][1] + merged[-1][2] == start:
+            merged[-1][2] += frames
+        else:
+            merged.append([trajectory, start, frames])
+    chunks = []
+    offset = 0
+    for trajectory, start, frames in merged:
+        for first in range(start, start + frames, chunk_frames):
+            n = min(chunk_frames, start + frames - first)
+            chunks.append(FrameChunk(len(chunks), Path(trajectory).absolute(), first, n, offset))
+            offset += n
+    return chunks
+
+
+def read_energy_output(filename: Path) -> Dict[str, np.ndarray]:
+    """ Per-frame `DELTA TOTAL` values by method ("gb", "pb") from MMPBSA.py `-eo` CSV """
+    result: Dict[str, list] = {}
+    method = None
+    in_delta = False
+    column = None
+    with open(filename) as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip():
+                in_delta = False
+                continue
+            head = row[0].strip()
+            if head in METHODS:
+                method, in_delta = METHODS[head], False
+            elif head.startswith("DELTA Energy Terms"):
+                in_delta, column = True, None
+            elif head.endswith("Energy Terms"):
+                in_delta = False
+            elif in_delta and head == "Frame #":
+                names = [name.strip() for name in row]
+                column = names.index("DELTA TOTAL" if "DELTA TOTAL" in names else "TOTAL")
+            elif in_delta and column is not None:
+                result.setdefault(method, []).append(float(row[column]))
+    return {key: np.array(values) for key, values in result.items()}
@@ -0,0 +1,168 @@
+"""
+Dry run of protocols before submission:
+
+    plans = plan_campaign(find_states([Path("campaign")]))
+    failed = [plan for plan in plans if plan.errors]
+
+Every remaining step and segment is rendered in a scratch directory, commands are kept in memory together
+with the rendered inputs (deduplicated by content), validation errors and estimated simulated time and output size.
+Engines are never started
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set
+
+MDOUT_HEADER_BYTES = 8 * 1024
+MDOUT_RECORD_BYTES = 720
+FRAME_OVERHEAD_BYTES = 64  # time and box of a trajectory frame
+
+
+class PlannedCall:
+    """ Single engine call, `cmd` is None for steps which can't be planned """
+
+    def __init__(self, step: str, segment: Optional[int], cmd: Optional[List[str]], files: Dict[str, str]):
+        self.step = step
+        self.segment = segment
+        self.cmd = cmd
+        self.files = files  # filename -> digest of rendered content, see `ProtocolPlan.files`
+        self.simulated_ns = 0.0
+        self.output_bytes = 0
+
+    def as_dict(self) -> Dict:
+        return dict(step=self.step, segment=self.segment, cmd=self.cmd, files=self.files,
+                    simulated_ns=self.simulated_ns, output_bytes=self.output_bytes)
+
+
+class ProtocolPlan:
+    """
+    Result of `MdProtocol.plan()`
+
+    Files referenced by commands must either exist in protocol working directory or be produced by
+    an earlier call, otherwise an error is recorded. Output size estimate needs atom count, which is read from
+    existing topology or given explicitly
+    """
+
+    def __init__(self, name: str, wd: Path, atoms: Optional[int] = None):
+        self.name = name
+        self.wd = Path(wd)
+        self.atoms = atoms
+        self.calls: List[PlannedCall] = []
+        self.files: Dict[str, str] = {}  # digest -> rendered content
+        self.errors: List[str] = []
+        self.produced: Set[str] = set()
+
+    @property
+    def simulated_ns(self) -> float:
+        return sum(call.simulated_ns for call in self.calls)
+
+    @property
+    def output_bytes(self) -> int:
+        return sum(call.output_bytes for call in self.calls)
+
+    def intern(self, text: str) -> str:
+        digest = hashlib.sha1(text.encode()).hexdigest()
+        self.files.setdefault(digest, text)
+        return digest
+
+    def error(self, step, segment: Optional[int], message: str):
+        where = step.name if segment is None else f"{step.name}[{segment}]"
+        self.errors.append(f"{where}: {message}")
+
+    def unplanned(self, step):
+        self.calls.append(PlannedCall(step.name, None, None, {}))
+
+    def produce(self, paths: Sequence):
+        self.produced.update(os.path.normpath(str(path)) for path in paths if path is not None)
+
+    def render(self, step, exe, inp, segment: Optional[int] = None, inputs: Sequence = ()) -> PlannedCall:
+        """ Writes `inp` to `exe.input` (relative to scratch directory) and records the command """
+        input_path = Path(exe.input)
+        if input_path.is_absolute():
+            raise ValueError(f"Absolute input path {input_path} can't be planned")
+        for path in inputs:
+            if path is None or os.path.normpath(str(path)) in self.produced or (self.wd / path).exists():
+                continue
+            self.error(step, segment, f"missing input file {path}")
+
+        input_path.parent.mkdir(parents=True, exist_ok=True)
+        redirections = getattr(inp, "file_redirections", {})
+        disang = redirections.get("DISANG")
+        if disang is not None and Path(disang).is_absolute():
+            redirections["DISANG"] = f"{input_path}.disang"  # keep dry run inside scratch directory
+        with input_path.open("w") as out:
+            inp.write(out)
+        files = {str(input_path): input_path.read_text()}
+        if redirections.get("DISANG") is not None and Path(redirections["DISANG"]).is_file():
+            files[str(redirections["DISANG"])] = Path(redirections["DISANG"]).read_text()
+        if disang is not None and Path(disang).is_absolute():
+            files = {(disang if name == redirections["DISANG"] else name): text.replace(redirections["DISANG"], disang)
+                     for name, text in files.items()}
+            redirections["DISANG"] = disang
+
+        call = PlannedCall(step.name, segment, [str(arg) for arg in exe.cmd],
+                           {name: self.intern(text) for name, text in files.items()})
+        self.calls.append(call)
+        return call
+
+    def sander_call(self, step, exe, inp, segment: Optional[int] = None) -> PlannedCall:
+        from .autotune import read_atom_count
+
+        call = self.render(step, exe, inp, segment, inputs=[exe.prmtop, exe.inpcrd, exe.refc])
+        if self.atoms is None and exe.prmtop is not None and (self.wd / exe.prmtop).is_file():
+            self.atoms = read_atom_count(self.wd / exe.prmtop)
+        atoms = self.atoms or 0
+        cntrl = inp.namelist.get("cntrl", {})
+        minimization = cntrl.get("imin", 0) != 0
+        ascii = cntrl.get("ioutfm", 1) == 0
+        n_steps = cntrl.get("maxcyc", 1) if minimization else cntrl.get("nstlim", 1)
+
+        call.output_bytes = MDOUT_HEADER_BYTES + n_steps // max(1, cntrl.get("ntpr", 50)) * MDOUT_RECORD_BYTES
+        call.output_bytes += atoms * 3 * (12 if ascii else 8) * (1 if minimization else 2)  # restart
+        outputs = [exe.mdout, exe.restrt]
+        if not minimization:
+            call.simulated_ns = n_steps * cntrl.get("dt", 0.001) / 1000.0
+            for key in ("ntwx", "ntwv"):
+                if cntrl.get(key, 0) > 0:
+                    frame_bytes = atoms * 3 * (8 if ascii else 4) + FRAME_OVERHEAD_BYTES
+                    call.output_bytes += n_steps // cntrl[key] * frame_bytes
+            if cntrl.get("ntwx", 0) > 0:
+                outputs.append(exe.mdcrd)
+        self.produce(outputs)
+        return call
+
+    def as_dict(self) -> Dict:
+        return dict(name=self.name, wd=str(self.wd), atoms=self.atoms, calls=len(self.calls),
+                    unplanned=sorted({call.step for call in self.calls if call.cmd is None}),
+                    simulated_ns=self.simulated_ns, output_bytes=self.output_bytes, errors=self.errors)
+
+
+def _plan_state(state: str) -> ProtocolPlan:
+    from remote_runner import Task
+
+    os.chdir(os.path.dirname(state))
+    try:
+        return Task.load(Path(state)).plan()
+    except Exception as e:
+        plan = ProtocolPlan(Path(state).parent.name, Path(state).parent)
+        plan.errors.append(f"{e.__class__.__name__}: {e}")
+        return plan
+
+
+def plan_campaign(states: Sequence[Path], jobs: int = 0, chunksize: int = 16) -> List[ProtocolPlan]:
+    """
+    Plans protocols stored in `states` by a process pool
+
+    :param jobs: number of processes, 0 means all cores, 1 disables the pool
+    :return: plans in order of `states`
+    """
+    states = [str(Path(state).absolute()) for state in states]
+    if jobs == 1 or len(states) < 2:
+        cwd = os.getcwd()
+        try:
+            return [_plan_state(state) for state in states]
+        finally:
+            os.chdir(cwd)
+    with ProcessPoolExecutor(max_workers=jobs or None) as pool:
+        return list(pool.map(_plan_state, states, chunksize=chunksize))
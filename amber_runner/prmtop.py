@@ -0,0 +1,147 @@
+"""
+Lazy reader of Amber topology files
+
+Requires optional `numpy` package
+"""
+import mmap
+import re
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+
+_FORMAT = re.compile(rb"%FORMAT\((\d+)([aAiIeEfF])(\d+)")
+
+
+def parse_section(data: bytes, count: int, kind: str, width: int) -> np.ndarray:
+    """ Parses fixed-width fields of a section body, `kind` is Fortran edit descriptor letter (a, I, E) """
+    data = data.replace(b"\r", b"")
+    line_width = count * width
+    newlines = data[line_width::line_width + 1]
+    if newlines.count(b"\n") == len(newlines):  # only the last line is short, as written by tleap and parmed
+        stream = data.replace(b"\n", b"")
+    else:
+        stream = b"".join(line.ljust(-(-len(line.rstrip()) // width) * width) for line in data.split(b"\n"))
+    stream = stream.rstrip()
+    n = -(-len(stream) // width)
+    fields = np.frombuffer(stream.ljust(n * width), dtype=f"S{width}", count=n)
+    if kind in "aA":
+        return fields
+    if kind in "iI":
+        return fields.astype(np.int64)
+    return fields.astype(np.float64)
+
+
+class Prmtop:
+    """
+    Amber topology with sections parsed on first access
+
+    File is memory-mapped and only positions of ``%FLAG`` records are scanned on open.
+    String sections are kept as fixed-width byte arrays (``S4``), see `names()` for fast matching.
+    Use as context manager or call `close()` to unmap the file, already parsed sections stay available
+    """
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._sections: Dict[str, Tuple[int, int]] = {}
+        self._cache: Dict[str, np.ndarray] = {}
+        position = self._data.find(b"%FLAG")
+        while position != -1:
+            end = self._data.find(b"\n", position)
+            name = self._data[position + 5:end].strip().decode()
+            position = self._data.find(b"%FLAG", end)
+            self._sections[name] = (end + 1, len(self._data) if position == -1 else position)
+
+    def close(self):
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self):
+        return dict(path=self.path)
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    @property
+    def flags(self) -> List[str]:
+        return list(self._sections)
+
+    def section(self, flag: str) -> np.ndarray:
+        if flag not in self._cache:
+            if flag not in self._sections:
+                raise KeyError(f"No {flag} section in {self.path}")
+            if self._data.closed:
+                raise ValueError(f"{self.path} is closed, {flag} section was not read before")
+            start, end = self._sections[flag]
+            header = _FORMAT.match(self._data, start)
+            if header is None:
+                raise ValueError(f"No %FORMAT line of {flag} section in {self.path}")
+            count, kind, width = int(header.group(1)), header.group(2).decode(), int(header.group(3))
+            body = self._data.find(b"\n", start) + 1
+            self._cache[flag] = parse_section(self._data[body:end], count, kind, width)
+        return self._cache[flag]
+
+    def names(self, flag: str) -> Tuple[List[str], np.ndarray]:
+        """ Distinct stripped values of a string section and index of every entry in that list """
+        key = f"{flag}#names"
+        if key not in self._cache:
+            fields = self.section(flag)
+            if fields.dtype.itemsize == 4:  # sorting integers is several times faster than sorting strings
+                unique, inverse = np.unique(fields.view(np.uint32), return_inverse=True)
+                unique = unique.view(fields.dtype)
+            else:
+                unique, inverse = np.unique(fields, return_inverse=True)
+            self._cache[key] = ([value.decode().strip() for value in unique], inverse.reshape(-1))
+        return self._cache[key]
+
+    @property
+    def n_atoms(self) -> int:
+        return int(self.section("POINTERS")[0])
+
+    @property
+    def n_residues(self) -> int:
+        return int(self.section("POINTERS")[11])
+
+    @property
+    def atom_names(self) -> np.ndarray:
+        return np.char.strip(self.section("ATOM_NAME").astype(str))
+
+    @property
+    def atom_types(self) -> np.ndarray:
+        return np.char.strip(self.section("AMBER_ATOM_TYPE").astype(str))
+
+    @property
+    def residue_labels(self) -> np.ndarray:
+        return np.char.strip(self.section("RESIDUE_LABEL").astype(str))
+
+    @property
+    def residue_pointers(self) -> np.ndarray:
+        """ 0-based index of the first atom of every residue """
+        return self.section("RESIDUE_POINTER") - 1
+
+    @property
+    def residue_index(self) -> np.ndarray:
+        """ 0-based residue index of every atom """
+        if "#residue_index" not in self._cache:
+            pointers = self.residue_pointers
+            sizes = np.diff(np.append(pointers, self.n_atoms))
+            self._cache["#residue_index"] = np.repeat(np.arange(len(pointers)), sizes)
+        return self._cache["#residue_index"]
+
+    @property
+    def masses(self) -> np.ndarray:
+        return self.section("MASS")
+
+    @property
+    def charges(self) -> np.ndarray:
+        """ Partial charges in electron charge units (stored multiplied by 18.2223) """
+        return self.section("CHARGE") / 18.2223
@@ -0,0 +1,59 @@
+import time
+from typing import Any, Dict, List, Sequence
+
+from .database import SqliteTable
+
+
+class ProtocolRegistry(SqliteTable):
+    """
+    Shared SQLite table with one summary row per protocol
+
+    Rows are upserted by `MdProtocol.checkpoint()`, status queries don't need to unpickle protocol states.
+    Database should reside on a local (non-NFS) filesystem, WAL journal is used to allow concurrent readers
+    """
+    table = "protocols"
+    columns = [
+        ("wd", "TEXT PRIMARY KEY"),
+        ("name", "TEXT"),
+        ("status", "TEXT"),
+        ("step", "TEXT"),
+        ("step_index", "INTEGER"),
+        ("n_steps", "INTEGER"),
+        ("segment", "INTEGER"),
+        ("n_segments", "INTEGER"),
+        ("simulated_ns", "REAL"),
+        ("total_ns", "REAL"),
+        ("ns_per_day", "REAL"),
+        ("started", "REAL"),
+        ("updated", "REAL"),
+        ("last_interval", "REAL"),
+    ]
+
+    def upsert(self, summary: Dict[str, Any]):
+        summary = dict(summary, wd=str(summary["wd"]))
+        summary.setdefault("updated", time.time())
+        previous = self.get(summary["wd"])
+        if previous is None:
+            summary.setdefault("started", summary["updated"])
+        else:
+            summary["last_interval"] = summary["updated"] - previous["updated"]
+        names = [name for name, _ in self.columns if name in summary]
+        sql = (f"INSERT INTO protocols ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)}) "
+               f"ON CONFLICT(wd) DO UPDATE SET {', '.join(f'{name}=excluded.{name}' for name in names)}")
+        self._retry(lambda connection: connection.execute(sql, [summary[name] for name in names]))
+
+    def get(self, wd) -> Dict[str, Any]:
+        rows = self.select("wd = ?", (str(wd),))
+        return rows[0] if rows else None
+
+    def select(self, where: str = None, params: Sequence = ()) -> List[Dict[str, Any]]:
+        """
+        Returns matching rows, e.g.
+
+            registry.select("step = ? AND segment < ?", ("production", 100))
+        """
+        return self._execute("SELECT * FROM protocols" + (f" WHERE {where}" if where else "") + " ORDER BY wd", params)
+
+    def stuck(self, seconds: float) -> List[Dict[str, Any]]:
+        """ Protocols marked as running but not updated for `seconds` """
+        return self.select("status = 'running' AND updated < ?", (time.time() - seconds,))
@@ -0,0 +1,370 @@
+import mmap
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+
+_NC_DIMENSION = 10
+_NC_VARIABLE = 11
+_NC_ATTRIBUTE = 12
+
+_NC_TYPES = {
+    1: np.dtype(">i1"),
+    2: np.dtype("S1"),
+    3: np.dtype(">i2"),
+    4: np.dtype(">i4"),
+    5: np.dtype(">f4"),
+    6: np.dtype(">f8"),
+}
+
+# Amber internal velocity unit is angstrom/(1/20.455 ps)
+VELOCITY_SCALE_FACTOR = 20.455
+
+
+class Restart:
+    """
+    Coordinates, velocities and periodic box of an Amber restart
+
+    Arrays are views on parsed text buffer (rst7) or on memory-mapped file (ncrst), no copies are made.
+    Velocities are kept in Amber internal units in both formats.
+    `box` holds (a, b, c, alpha, beta, gamma), `cell_lengths` and `cell_angles` are views of its halves.
+    ncrst stores them as separate variables, so there `box` is a copy and only `cell_lengths` and
+    `cell_angles` are memory-mapped
+    """
+
+    def __init__(self,
+                 coordinates: np.ndarray,
+                 velocities: Optional[np.ndarray] = None,
+                 box: Optional[np.ndarray] = None,
+                 time: float = 0.0,
+                 title: str = "Generated by amber_runner"):
+        self.coordinates = coordinates
+        self.velocities = velocities
+        self.box = box
+        self.cell_lengths = None if box is None else box[:3]
+        self.cell_angles = None if box is None else box[3:]
+        self.time = time
+        self.title = title
+
+    @property
+    def n_atoms(self) -> int:
+        return len(self.coordinates)
+
+    @staticmethod
+    def read(filename: PathLike, mode="r") -> 'Restart':
+        """
+        Reads restart, format is detected by file content
+
+        :param mode: memory mapping mode of ncrst arrays, use "r+" to modify file in place
+        """
+        with open(filename, "rb") as f:
+            magic = f.read(3)
+        if magic == b"CDF":
+            return read_ncrst(filename, mode=mode)
+        return read_rst7(filename)
+
+    def write(self, filename: PathLike, extension: str = None):
+        """
+        Writes restart in format defined by `extension`, e.g. `SanderCommand.restrt_extension`.
+        Defaults to `filename` suffix
+        """
+        if extension is None:
+            extension = Path(filename).suffix[1:]
+        if extension not in WRITERS:
+            raise RuntimeError(f"Unknown restart format `{extension}`, expected one of {sorted(WRITERS)}")
+        WRITERS[extension](self, filename)
+
+
+def read_rst7(filename: PathLike) -> Restart:
+    with open(filename, "rb") as f:
+        title = f.readline().decode().rstrip()
+        header = f.readline().split()
+        body = f.read()
+
+    n_atoms = int(header[0])
+    time = float(header[1]) if len(header) > 1 else 0.0
+
+    # fixed width 6F12.7 records, fields never span lines
+    body = body.replace(b"\r", b"").replace(b"\n", b"")
+    values = np.frombuffer(body, dtype="S12", count=len(body) // 12).astype(float)
+
+    n = 3 * n_atoms
+    coordinates = values[:n].reshape(n_atoms, 3)
+    velocities = None
+    box = None
+    if len(values) in (2 * n, 2 * n + 6):
+        velocities = values[n:2 * n].reshape(n_atoms, 3)
+    if len(values) in (n + 6, 2 * n + 6):
+        box = values[-6:]
+    if len(values) not in (n, n + 6, 2 * n, 2 * n + 6):
+        raise RuntimeError(f"{filename}: unexpected number of values {len(values)} for {n_atoms} atoms")
+    return Restart(coordinates=coordinates, velocities=velocities, box=box, time=time, title=title)
+
+
+def write_rst7(restart: Restart, filename: PathLike):
+    def format_block(values: np.ndarray):
+        flat = np.asarray(values, dtype=float).ravel()
+        full = len(flat) // 6
+        text = (("%12.7f" * 6 + "\n") * full) % tuple(flat[:full * 6])
+        if len(flat) % 6:
+            text += ("%12.7f" * (len(flat) % 6) + "\n") % tuple(flat[full * 6:])
+        return text
+
+    with open(filename, "w") as out:
+        out.write(f"{restart.title[:80]}\n")
+        out.write(f"{restart.n_atoms:5d}{restart.time:15.7e}\n")
+        out.write(format_block(restart.coordinates))
+        if restart.velocities is not None:
+            out.write(format_block(restart.velocities))
+        if restart.box is not None:
+            out.write(format_block(restart.box))
+
+
+class _Netcdf3Header:
+    def __init__(self, data):
+        assert data[:3] == b"CDF", "Not a NetCDF3 file"
+        self.version = data[3]
+        if self.version not in (1, 2):
+            raise RuntimeError(f"Unsupported NetCDF format version {self.version}")
+        self.data = data
+        self.pos = 8  # magic + numrecs
+        self.dimensions: Dict[str, int] = {}
+        self.attributes: Dict[str, object] = {}
+        # name -> (dtype, shape, offset, attributes)
+        self.variables: Dict[str, Tuple[np.dtype, Tuple[int, ...], int, Dict]] = {}
+
+    def parse(self):
+        dims = self._list(_NC_DIMENSION, self._dimension)
+        self.dimensions = dict(dims)
+        dim_lengths = [length for _, length in dims]
+        self.attributes = dict(self._list(_NC_ATTRIBUTE, self._attribute))
+        for name, dimids, attributes, nc_type, begin in self._list(_NC_VARIABLE, self._variable):
+            shape = tuple(dim_lengths[i] for i in dimids)
+            if 0 in shape:
+                raise RuntimeError(f"Record variables are not supported in restart files (`{name}`)")
+            self.variables[name] = (_NC_TYPES[nc_type], shape, begin, attributes)
+        return self
+
+    def _int(self):
+        value, = struct.unpack_from(">i", self.data, self.pos)
+        self.pos += 4
+        return value
+
+    def _offset(self):
+        fmt = ">i" if self.version == 1 else ">q"
+        value, = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def _name(self):
+        n = self._int()
+        name = self.data[self.pos:self.pos + n].decode()
+        self.pos += _padded(n)
+        return name
+
+    def _list(self, tag, read_item):
+        found_tag = self._int()
+        n = self._int()
+        if found_tag == 0:
+            assert n == 0
+            return []
+        assert found_tag == tag, f"Malformed NetCDF header: expected tag {tag}, found {found_tag}"
+        return [read_item() for _ in range(n)]
+
+    def _dimension(self):
+        return self._name(), self._int()
+
+    def _attribute(self):
+        name = self._name()
+        dtype = _NC_TYPES[self._int()]
+        n = self._int()
+        raw = self.data[self.pos:self.pos + n * dtype.itemsize]
+        self.pos += _padded(n * dtype.itemsize)
+        if dtype.kind == "S":
+            return name, raw.decode()
+        values = np.frombuffer(raw, dtype=dtype)
+        return name, values[0] if n == 1 else values
+
+    def _variable(self):
+        name = self._name()
+        dimids = [self._int() for _ in range(self._int())]
+        attributes = dict(self._list(_NC_ATTRIBUTE, self._attribute))
+        nc_type = self._int()
+        self._int()  # vsize
+        begin = self._offset()
+        return name, dimids, attributes, nc_type, begin
+
+
+def _padded(n: int) -> int:
+    return (n + 3) // 4 * 4
+
+
+def read_ncrst(filename: PathLike, mode="r") -> Restart:
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        header = _Netcdf3Header(data).parse()
+
+    def variable(name):
+        if name not in header.variables:
+            return None
+        dtype, shape, begin, _ = header.variables[name]
+        return np.memmap(filename, dtype=dtype, mode=mode, offset=begin, shape=shape)
+
+    box = None
+    lengths, angles = variable("cell_lengths"), variable("cell_angles")
+    if lengths is not None and angles is not None:
+        box = np.concatenate([lengths, angles])
+    time = variable("time")
+    restart = Restart(coordinates=variable("coordinates"),
+                      velocities=variable("velocities"),
+                      box=box,
+                      time=float(time[()]) if time is not None else 0.0,
+                      title=str(header.attributes.get("title", "")))
+    if box is not None:
+        restart.cell_lengths, restart.cell_angles = lengths, angles
+    return restart
+
+
+def write_netcdf3(filename: PathLike, dimensions: List[Tuple[str, Optional[int]]], attributes: Dict,
+                  variables: List[Tuple[str, int, List[str], Dict, np.ndarray]]):
+    """
+    Writes NetCDF3 64-bit offset file
+
+    :param dimensions: (name, length) pairs, length `None` marks record dimension
+    :param variables: (name, nc_type, dimensions, attributes, data) tuples,
+                      data of record variables has leading record axis
+    """
+
+    def name(s: str):
+        raw = s.encode()
+        return struct.pack(">i", len(raw)) + raw + b"\0" * (_padded(len(raw)) - len(raw))
+
+    def attribute(key: str, value):
+        if isinstance(value, str):
+            raw, nc_type, n = value.encode(), 2, len(value.encode())
+        else:
+            raw, nc_type, n = struct.pack(">d", value), 6, 1
+        return name(key) + struct.pack(">ii", nc_type, n) + raw + b"\0" * (_padded(len(raw)) - len(raw))
+
+    def attribute_list(attributes: Dict):
+        if not attributes:
+            return struct.pack(">ii", 0, 0)
+        return struct.pack(">ii", _NC_ATTRIBUTE, len(attributes)) + b"".join(
+            attribute(k, v) for k, v in attributes.items())
+
+    dimension_ids = {dim: i for i, (dim, _) in enumerate(dimensions)}
+    record_dimension = next((dim for dim, length in dimensions if length is None), None)
+
+    def is_record(dims):
+        return len(dims) > 0 and dims[0] == record_dimension
+
+    fixed = [(var, np.ascontiguousarray(data, dtype=_NC_TYPES[nc_type]).tobytes())
+             for var, nc_type, dims, _, data in variables if not is_record(dims)]
+    records = [(var, np.ascontiguousarray(data, dtype=_NC_TYPES[nc_type]))
+               for var, nc_type, dims, _, data in variables if is_record(dims)]
+    n_records = len(records[0][1]) if records else 0
+    vsize = {var: _padded(len(raw)) for var, raw in fixed}
+    vsize.update({var: _padded(data[0].nbytes if n_records else 0) for var, data in records})
+
+    def header(begins):
+        result = b"CDF\x02" + struct.pack(">i", n_records)
+        result += struct.pack(">ii", _NC_DIMENSION, len(dimensions))
+        result += b"".join(name(dim) + struct.pack(">i", length or 0) for dim, length in dimensions)
+        result += attribute_list(attributes)
+        result += struct.pack(">ii", _NC_VARIABLE, len(variables))
+        for var, nc_type, dims, var_attributes, _ in variables:
+            result += name(var) + struct.pack(">i", len(dims))
+            result += b"".join(struct.pack(">i", dimension_ids[dim]) for dim in dims)
+            result += attribute_list(var_attributes)
+            result += struct.pack(">iiq", nc_type, vsize[var], begins.get(var, 0))
+        return result
+
+    begins = {}
+    position = len(header({}))
+    for var, _ in fixed + records:
+        begins[var] = position
+        position += vsize[var]
+
+    with open(filename, "wb") as out:
+        out.write(header(begins))
+        for var, raw in fixed:
+            out.write(raw + b"\0" * (vsize[var] - len(raw)))
+        for i in range(n_records):
+            for var, data in records:
+                raw = data[i:i + 1].tobytes()
+                out.write(raw + b"\0" * (vsize[var] - len(raw)))
+
+
+def _box_variables(record_dimension: List[str], lengths: np.ndarray, angles: np.ndarray):
+    return [
+        ("cell_spatial", 2, ["cell_spatial"], {}, np.array([b"a", b"b", b"c"])),
+        ("cell_angular", 2, ["cell_angular", "label"], {},
+         np.array([list(b"alpha"), list(b"beta\0"), list(b"gamma")], dtype=np.uint8).view("S1")),
+        ("cell_lengths", 6, record_dimension + ["cell_spatial"], {"units": "angstrom"}, lengths),
+        ("cell_angles", 6, record_dimension + ["cell_angular"], {"units": "degree"}, angles),
+    ]
+
+
+_BOX_DIMENSIONS = [("cell_spatial", 3), ("cell_angular", 3), ("label", 5)]
+
+
+def _global_attributes(title: str, conventions: str):
+    return {
+        "title": title,
+        "application": "AMBER",
+        "program": "amber_runner",
+        "programVersion": "1.0",
+        "Conventions": conventions,
+        "ConventionVersion": "1.0",
+    }
+
+
+def write_ncrst(restart: Restart, filename: PathLike):
+    """ Writes NetCDF3 64-bit offset file following AMBER restart conventions """
+    dimensions = [("spatial", 3), ("atom", restart.n_atoms)]
+    variables = [
+        ("spatial", 2, ["spatial"], {}, np.array([b"x", b"y", b"z"])),
+        ("time", 6, [], {"units": "picosecond"}, np.array(restart.time)),
+        ("coordinates", 6, ["atom", "spatial"], {"units": "angstrom"}, restart.coordinates),
+    ]
+    if restart.velocities is not None:
+        variables.append(("velocities", 6, ["atom", "spatial"],
+                          {"units": "angstrom/picosecond", "scale_factor": VELOCITY_SCALE_FACTOR},
+                          restart.velocities))
+    if restart.box is not None:
+        box = np.asarray(restart.box, dtype=float)
+        dimensions += _BOX_DIMENSIONS
+        variables += _box_variables([], box[:3], box[3:])
+
+    write_netcdf3(filename, dimensions, _global_attributes(restart.title, "AMBERRESTART"), variables)
+
+
+def write_nctraj(filename: PathLike, coordinates: np.ndarray, time: np.ndarray, box: Optional[np.ndarray] = None,
+                 title: str = "Generated by amber_runner"):
+    """
+    Writes NetCDF3 trajectory following AMBER conventions
+
+    :param coordinates: (frames, atoms, 3) array
+    :param time: (frames,) array
+    :param box: (frames, 6) array
+    """
+    dimensions = [("frame", None), ("spatial", 3), ("atom", coordinates.shape[1])]
+    variables = [
+        ("spatial", 2, ["spatial"], {}, np.array([b"x", b"y", b"z"])),
+        ("time", 5, ["frame"], {"units": "picosecond"}, time),
+        ("coordinates", 5, ["frame", "atom", "spatial"], {"units": "angstrom"}, coordinates),
+    ]
+    if box is not None:
+        box = np.asarray(box, dtype=float)
+        dimensions += _BOX_DIMENSIONS
+        variables += _box_variables(["frame"], box[:, :3], box[:, 3:])
+
+    write_netcdf3(filename, dimensions, _global_attributes(title, "AMBER"), variables)
+
+
+WRITERS = {
+    "rst7": write_rst7,
+    "ncrst": write_ncrst,
+}
@@ -0,0 +1,125 @@
+import gzip
+import os
+import queue
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+from .utility import self_logger as _logger
+
+
+class RetentionPolicy:
+    """
+    Declarative clean-up of finished segment outputs (``{segment_prefix}.{extension}`` files)
+
+    - restarts (`rst7`, `ncrst`) are kept for every `restart_every`-th segment only (all if None)
+    - files with `compress` extensions are gzipped in place (``.out`` -> ``.out.gz``, mtime preserved)
+    - files with `delete` extensions are removed (e.g. ``mdinfo`` if `PmemdCommand.mdinfo` is set per segment)
+
+    The last `keep_last` segments and `protected` files are never touched.
+    Policy is applied in a background thread after checkpoints.
+    """
+    RESTART_EXTENSIONS = ("rst7", "ncrst")
+
+    def __init__(self,
+                 restart_every: Optional[int] = None,
+                 keep_last: int = 2,
+                 compress: Iterable[str] = ("out",),
+                 delete: Iterable[str] = (),
+                 complevel: int = 6):
+        assert restart_every is None or restart_every > 0
+        assert keep_last >= 1
+        self.restart_every = restart_every
+        self.keep_last = keep_last
+        self.compress = tuple(compress)
+        self.delete = tuple(delete)
+        self.complevel = complevel
+        self._worker: Optional[threading.Thread] = None
+        self._jobs: 'queue.Queue' = None
+        self._error: Optional[Exception] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_worker"] = None
+        state["_jobs"] = None
+        state["_error"] = None
+        return state
+
+    def submit(self, segments: List[Tuple[int, Path]], protected: Set[Path],
+               on_change: Optional[Callable[[int, List[Path], List[Path]], None]] = None):
+        """
+        Applies policy to `segments` in background
+
+        :param segments: (segment number, segment prefix) of finished segments, not including the last `keep_last`
+        :param protected: files referenced by protocol state
+        :param on_change: called from background thread with segment number, removed and created files
+                          (absolute paths) after policy is applied to a segment
+        """
+        if self._worker is None:
+            self._jobs = queue.Queue()
+            self._worker = threading.Thread(target=self._process_jobs, daemon=True)
+            self._worker.start()
+        self._jobs.put(([(i, Path(prefix).absolute()) for i, prefix in segments],
+                        {Path(path).absolute() for path in protected},
+                        on_change))
+
+    def wait(self):
+        """ Blocks until all submitted jobs are done, re-raises background error if any """
+        if self._worker is not None:
+            self._jobs.put(None)
+            self._worker.join()
+            self._worker = None
+            self._jobs = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _process_jobs(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if self._error is not None:
+                continue
+            segments, protected, on_change = job
+            try:
+                for i, prefix in segments:
+                    removed, created = self.apply(i, prefix, protected)
+                    if on_change is not None and (removed or created):
+                        on_change(i, removed, created)
+            except Exception as e:
+                _logger(self).error(f"Retention policy failed: {e}")
+                self._error = e
+
+    def keeps_restart(self, segment: int) -> bool:
+        return self.restart_every is None or (segment + 1) % self.restart_every == 0
+
+    def apply(self, segment: int, prefix: Path, protected: Set[Path]) -> Tuple[List[Path], List[Path]]:
+        """ Returns removed and created files """
+        removed, created = [], []
+        for path in sorted(prefix.parent.glob(f"{prefix.name}.*")):
+            if path in protected:
+                continue
+            extension = path.name[len(prefix.name) + 1:]
+            if extension in self.delete:
+                path.unlink()
+            elif extension in self.RESTART_EXTENSIONS and not self.keeps_restart(segment):
+                path.unlink()
+            elif extension in self.compress:
+                created.append(self.gzip(path))
+            else:
+                continue
+            removed.append(path)
+        return removed, created
+
+    def gzip(self, path: Path) -> Path:
+        target = Path(f"{path}.gz")
+        tmp = Path(f"{target}.bak")
+        with path.open("rb") as src, gzip.open(str(tmp), "wb", compresslevel=self.complevel) as dst:
+            shutil.copyfileobj(src, dst)
+        stat = path.stat()
+        os.utime(str(tmp), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        tmp.rename(target)
+        path.unlink()
+        return target
@@ -0,0 +1,174 @@
+"""
+Time-dependent restraints compiled into the fewest engine runs:
+
+    md.pull = ScheduledSanderCall("pull", nstlim=500000)
+    md.pull.input.cntrl(imin=0, irest=1, ntx=5, dt=0.002, ntr=1, restraintmask=":1-50@CA", restraint_wt=5.0)
+    md.pull.schedule.distance(12, 240, {0: FlatWelledParabola(0, 5, 5, 99, 10, 10),
+                                        500000: FlatWelledParabola(0, 25, 25, 99, 10, 10)})
+    md.pull.schedule.scale({0: 0.0, 50000: 1.0})  # `&wt type='REST'` weight of all NMR restraints
+    md.pull.schedule.restraint_weight(250000, 0.0)  # positional restraints off in the second half
+
+Keyframes map step to value, values are interpolated linearly between keyframes and held outside of them.
+Amber varies NMR restraints (`nstep1`/`nstep2` with `r1a`..`rk3a` in DISANG) and their weight (`&wt`)
+within a single run, so the schedule is split only where `cntrl.restraint_wt` changes or
+`max_run_steps` is reached
+"""
+from typing import Callable, Dict, List, Mapping, Optional, Tuple, TypeVar
+
+from .inputs import AmberInput, AmberNMRRestraints, FlatWelledParabola, RampedFlatWelledParabola
+
+Value = TypeVar("Value")
+
+
+def interpolate_penalty(a: FlatWelledParabola, b: FlatWelledParabola, fraction: float) -> FlatWelledParabola:
+    return FlatWelledParabola(*(x + (y - x) * fraction for x, y in zip(
+        (a.r1, a.r2, a.r3, a.r4, a.k2, a.k3), (b.r1, b.r2, b.r3, b.r4, b.k2, b.k3))))
+
+
+def piecewise_linear(keyframes: Mapping[int, Value], first: int, last: int,
+                     interpolate: Callable[[Value, Value, float], Value]) -> List[Tuple[int, int, Value, Value]]:
+    """
+    Linear pieces (start, stop, value at start, value at stop) covering steps `first`..`last` inclusively,
+    steps are relative to `first`. Pieces don't overlap, every one but the first starts after previous stop
+    """
+    steps = sorted(keyframes)
+
+    def value(step: int) -> Value:
+        if step in keyframes:
+            return keyframes[step]
+        if step <= steps[0]:
+            return keyframes[steps[0]]
+        if step >= steps[-1]:
+            return keyframes[steps[-1]]
+        right = next(i for i, s in enumerate(steps) if s >= step)
+        left = steps[right - 1]
+        return interpolate(keyframes[left], keyframes[steps[right]], (step - left) / (steps[right] - left))
+
+    breaks = [first] + [step for step in steps if first < step < last] + [last]
+    pieces = []
+    for i, (begin, end) in enumerate(zip(breaks, breaks[1:])):
+        start = begin if i == 0 else begin + 1
+        if start <= end:
+            pieces.append((start - first, end - first, value(start), value(end)))
+    return pieces
+
+
+class ScheduledRestraints(AmberNMRRestraints):
+    """ NMR restraints with keyframes instead of fixed penalties, see `RestraintSchedule` """
+
+    def add(self, atoms, keyframes: Mapping[int, FlatWelledParabola]):
+        if not keyframes:
+            raise ValueError(f"No keyframes for restraint {atoms}")
+        super().add(atoms, dict(keyframes))
+
+    def write(self, output):
+        raise TypeError("Scheduled restraints are written by runs of `RestraintSchedule.compile()`")
+
+
+class ScheduledRun:
+    """ Single engine call of compiled `RestraintSchedule`, steps of restraints and weights are run-relative """
+
+    def __init__(self, first_step: int, nstlim: int, restraints: AmberNMRRestraints, wts: List[Dict],
+                 restraint_wt: Optional[float]):
+        self.first_step = first_step
+        self.nstlim = nstlim
+        self.restraints = restraints
+        self.wts = wts
+        self.restraint_wt = restraint_wt
+
+    def input(self, base: AmberInput, continuation: bool) -> AmberInput:
+        """ Copy of `base` with this run's length, restraints and weights, `nmropt` is enabled if needed """
+        import copy
+
+        inp = copy.deepcopy(base)
+        inp.cntrl(nstlim=self.nstlim)
+        if continuation:
+            inp.cntrl(irest=1, ntx=5)
+        if self.restraint_wt is not None:
+            inp.cntrl(restraint_wt=self.restraint_wt)
+        for atoms, penalties in self.restraints.items():
+            for penalty in penalties:
+                inp.restraints.add(atoms, penalty)
+        for wt in self.wts:
+            inp.varying_conditions.add(**wt)
+        if (self.restraints or self.wts) and inp.cntrl.get("nmropt", 0) == 0:
+            inp.cntrl(nmropt=1)
+        return inp
+
+
+class RestraintSchedule:
+    """
+    Restraints changing over `nstlim` steps, see module docstring
+
+    :param max_run_steps: optional upper limit of a single engine run, e.g. to get restart files regularly
+    """
+
+    def __init__(self, nstlim: int, max_run_steps: Optional[int] = None):
+        self.nstlim = nstlim
+        self.max_run_steps = max_run_steps
+        self.restraints = ScheduledRestraints()
+        self.scaling: Dict[int, float] = {}
+        self.restraint_weights: Dict[int, float] = {}
+
+    def distance(self, id1, id2, keyframes: Mapping[int, FlatWelledParabola]):
+        self.restraints.distance(id1, id2, keyframes)
+        return self
+
+    def angle(self, id1, id2, id3, keyframes: Mapping[int, FlatWelledParabola]):
+        self.restraints.angle(id1, id2, id3, keyframes)
+        return self
+
+    def dihedral(self, id1, id2, id3, id4, keyframes: Mapping[int, FlatWelledParabola]):
+        self.restraints.dihedral(id1, id2, id3, id4, keyframes)
+        return self
+
+    def scale(self, keyframes: Mapping[int, float]):
+        """ Weight of all NMR restraints (`&wt type='REST'`) """
+        self.scaling = dict(keyframes)
+        return self
+
+    def restraint_weight(self, step: int, weight: float):
+        """ Sets positional restraint weight (`cntrl.restraint_wt`) from `step` on, which requires a new run """
+        self.restraint_weights[step] = weight
+        return self
+
+    def validate(self):
+        keyframes = [step for penalties in self.restraints.values() for frames in penalties for step in frames]
+        keyframes += list(self.scaling) + list(self.restraint_weights)
+        for step in keyframes:
+            if not 0 <= step <= self.nstlim:
+                raise ValueError(f"Keyframe step {step} is outside of 0..{self.nstlim}")
+        if self.max_run_steps is not None and self.max_run_steps <= 0:
+            raise ValueError(f"max_run_steps={self.max_run_steps} must be positive")
+
+    def boundaries(self) -> List[int]:
+        """ Steps where engine has to be restarted, including 0 and `nstlim` """
+        result = {0, self.nstlim}
+        result.update(step for step in self.restraint_weights if 0 < step < self.nstlim)
+        if self.max_run_steps is not None:
+            result.update(range(self.max_run_steps, self.nstlim, self.max_run_steps))
+        return sorted(result)
+
+    def compile(self) -> List[ScheduledRun]:
+        self.validate()
+        runs = []
+        boundaries = self.boundaries()
+        for first, last in zip(boundaries, boundaries[1:]):
+            restraints = AmberNMRRestraints()
+            for atoms, penalties in self.restraints.items():
+                for frames in penalties:
+                    pieces = piecewise_linear(frames, first, last, interpolate_penalty)
+                    if all(vars(a) == vars(b) for _, _, a, b in pieces) and \
+                            all(vars(piece[2]) == vars(pieces[0][2]) for piece in pieces):
+                        restraints.add(atoms, pieces[0][2])  # constant during the whole run
+                        continue
+                    for start, stop, a, b in pieces:
+                        restraints.add(atoms, RampedFlatWelledParabola(a, b, start, stop))
+            wts = []
+            if self.scaling:
+                for start, stop, a, b in piecewise_linear(self.scaling, first, last, lambda x, y, f: x + (y - x) * f):
+                    wts.append(dict(type="REST", istep1=start, istep2=stop, value1=a, value2=b))
+            weights = [step for step in self.restraint_weights if step <= first]
+            restraint_wt = self.restraint_weights[max(weights)] if weights else None
+            runs.append(ScheduledRun(first, last - first, restraints, wts, restraint_wt))
+        return runs
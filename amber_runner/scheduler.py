@@ -0,0 +1,185 @@
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from remote_runner import Task
+from remote_runner.errors import StopCalculationError
+from remote_runner.utility import ChangeDirectory
+
+from .database import SqliteTable
+from .utility import self_logger as _logger
+
+
+class SegmentQueue(SqliteTable):
+    """
+    Shared SQLite queue of runnable units, one row per protocol
+
+    A row holds the next unit of its protocol (step and segment, see `MdProtocol.next_unit()`), so units of
+    the same protocol are executed strictly in order while different protocols are spread over workers.
+    Ready units with more remaining work are handed out first (longest chain first reduces makespan).
+    Workers refresh `heartbeat` of running units, see `requeue_stale()`.
+    Database should reside on a local (non-NFS) filesystem
+    """
+    table = "units"
+    columns = [
+        ("state", "TEXT PRIMARY KEY"),
+        ("step", "TEXT"),
+        ("segment", "INTEGER"),
+        ("remaining", "INTEGER"),
+        ("status", "TEXT"),  # ready, running, done, failed
+        ("worker", "TEXT"),
+        ("error", "TEXT"),
+        ("updated", "REAL"),
+        ("heartbeat", "REAL"),  # last sign of life of the worker running the unit
+    ]
+
+    def add(self, state: Path):
+        """ Enqueues next unit of protocol stored in `state` """
+        state = Path(state).absolute()
+        with ChangeDirectory(state.parent):
+            unit = Task.load(state).next_unit()
+        self._set(str(state), unit)
+
+    @staticmethod
+    def _unit_values(unit: Optional[Dict]) -> tuple:
+        if unit is None:
+            return None, None, 0, "done"
+        return unit["step"], unit["segment"], unit["remaining"], "ready"
+
+    def _set(self, state: str, unit: Optional[Dict]):
+        self._execute("INSERT INTO units (state, step, segment, remaining, status, worker, error, updated) "
+                      "VALUES (?, ?, ?, ?, ?, NULL, NULL, ?) ON CONFLICT(state) DO UPDATE SET "
+                      "step=excluded.step, segment=excluded.segment, remaining=excluded.remaining, "
+                      "status=excluded.status, worker=NULL, error=NULL, updated=excluded.updated, heartbeat=NULL",
+                      (state,) + self._unit_values(unit) + (time.time(),))
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """ Takes the ready unit with most remaining work, returns None if no unit is ready """
+        while True:
+            rows = self._execute("SELECT * FROM units WHERE status = 'ready' ORDER BY remaining DESC, state LIMIT 1")
+            if not rows:
+                return None
+            now = time.time()
+            claimed = self._retry(lambda connection: connection.execute(
+                "UPDATE units SET status = 'running', worker = ?, updated = ?, heartbeat = ? "
+                "WHERE state = ? AND status = 'ready'", (worker, now, now, rows[0]["state"])).rowcount)
+            if claimed:  # otherwise taken by another worker meanwhile
+                return dict(rows[0], status="running", worker=worker)
+
+    def complete(self, state: str, worker: str, next_unit: Optional[Dict]) -> bool:
+        """
+        Replaces unit of `state` run by `worker` with `next_unit`.
+        Returns False if the unit was requeued meanwhile (see `requeue_stale()`), the row is left intact then
+        """
+        return self._retry(lambda connection: connection.execute(
+            "UPDATE units SET step = ?, segment = ?, remaining = ?, status = ?, worker = NULL, error = NULL, "
+            "updated = ?, heartbeat = NULL WHERE state = ? AND worker = ? AND status = 'running'",
+            self._unit_values(next_unit) + (time.time(), state, worker)).rowcount) > 0
+
+    def fail(self, state: str, worker: str, error: str) -> bool:
+        """ Marks unit of `state` run by `worker` as failed, returns False if the unit was requeued meanwhile """
+        return self._retry(lambda connection: connection.execute(
+            "UPDATE units SET status = 'failed', error = ?, updated = ? "
+            "WHERE state = ? AND worker = ? AND status = 'running'",
+            (error, time.time(), state, worker)).rowcount) > 0
+
+    def beat(self, state: str, worker: str):
+        """ Marks unit of `state` as still running by `worker` """
+        self._execute("UPDATE units SET heartbeat = ? WHERE state = ? AND worker = ? AND status = 'running'",
+                      (time.time(), state, worker))
+
+    def requeue_stale(self, seconds: float) -> int:
+        """ Returns running units without worker heartbeat for `seconds` back to ready state """
+        return self._retry(lambda connection: connection.execute(
+            "UPDATE units SET status = 'ready', worker = NULL, heartbeat = NULL "
+            "WHERE status = 'running' AND COALESCE(heartbeat, updated) < ?", (time.time() - seconds,)).rowcount)
+
+    def counts(self) -> Dict[str, int]:
+        return {row["status"]: row["n"] for row in
+                self._execute("SELECT status, COUNT(*) AS n FROM units GROUP BY status")}
+
+    def units(self) -> List[Dict[str, Any]]:
+        return self._execute("SELECT * FROM units ORDER BY state")
+
+
+class SegmentWorker:
+    """
+    Takes units from `SegmentQueue` one by one until no ready or running units remain
+
+    Each unit is run by loading protocol from its state file, protocol checkpoints after the unit.
+    While a unit runs, a background thread refreshes its heartbeat every `heartbeat_interval` seconds
+    """
+
+    def __init__(self, queue: SegmentQueue, name: Optional[str] = None, poll_interval: float = 1.0,
+                 heartbeat_interval: float = 30.0):
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+
+    @contextmanager
+    def heartbeat(self, state: str):
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.heartbeat_interval):
+                try:
+                    self.queue.beat(state, self.name)
+                except Exception as e:
+                    _logger(self).warning(f"Heartbeat of {state} failed: {e}")
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def run(self) -> int:
+        """ Returns number of executed units """
+        executed = 0
+        while True:
+            unit = self.queue.claim(self.name)
+            if unit is None:
+                if self.queue.counts().get("running", 0) == 0:
+                    return executed
+                time.sleep(self.poll_interval)  # running units may enqueue their successors
+                continue
+            state = Path(unit["state"])
+            try:
+                with self.heartbeat(unit["state"]), ChangeDirectory(state.parent):
+                    md = Task.load(state)
+                    md.run_unit()
+                    next_unit = md.next_unit()
+            except StopCalculationError:
+                self.queue.complete(unit["state"], self.name, dict(unit, status="ready"))
+                raise
+            except Exception as e:
+                _logger(self).error(f"{state}: {e}")
+                if not self.queue.fail(unit["state"], self.name, f"{e.__class__.__name__}: {e}"):
+                    _logger(self).warning(f"{state}: unit was requeued to another worker, failure is not recorded")
+                continue
+            if not self.queue.complete(unit["state"], self.name, next_unit):
+                _logger(self).warning(f"{state}: unit was requeued to another worker, result is not recorded")
+                continue
+            executed += 1
+
+
+def _run_worker(path: str, name: str, poll_interval: float):
+    SegmentWorker(SegmentQueue(Path(path)), name, poll_interval).run()
+
+
+def run_local_workers(queue: SegmentQueue, n_workers: int, poll_interval: float = 0.2):
+    """ Runs `n_workers` local worker processes until the queue is drained """
+    workers = [multiprocessing.Process(target=_run_worker, args=(str(queue.path), f"local-{i}", poll_interval))
+               for i in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
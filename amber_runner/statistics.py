@@ -0,0 +1,64 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def block_average(values: np.ndarray, n_blocks: int = 5) -> Tuple[float, float]:
+    """
+    Mean and its standard error estimated from means of `n_blocks` consecutive blocks
+
+    Trailing values which don't fill the last block are dropped from the error estimate
+    """
+    values = np.asarray(values, dtype=float)
+    n_blocks = min(n_blocks, len(values))
+    if n_blocks < 2:
+        return float(values.mean()) if len(values) else float("nan"), float("nan")
+    size = len(values) // n_blocks
+    blocks = values[:size * n_blocks].reshape(n_blocks, size).mean(axis=1)
+    return float(values.mean()), float(blocks.std(ddof=1) / np.sqrt(n_blocks))
+
+
+def statistical_inefficiency(values: np.ndarray, min_lag: int = 3) -> float:
+    """
+    Statistical inefficiency g = 1 + 2 * sum_t (1 - t/N) C(t), number of steps per uncorrelated sample
+
+    Normalized autocorrelation C(t) is computed by FFT and summed until its first non-positive value
+    after `min_lag` (Chodera et al., JCTC 3, 26 (2007))
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n < 2:
+        return 1.0
+    delta = values - values.mean()
+    variance = float(np.mean(delta ** 2))
+    if variance == 0:
+        return 1.0
+    spectrum = np.fft.rfft(delta, n=2 * n)
+    correlation = np.fft.irfft(spectrum * np.conjugate(spectrum))[1:n - 1]
+    lags = np.arange(1, n - 1)
+    correlation = correlation / (n - lags) / variance
+    stop = np.flatnonzero((correlation <= 0) & (lags > min_lag))
+    if len(stop):
+        lags, correlation = lags[:stop[0]], correlation[:stop[0]]
+    return max(1.0, 1.0 + 2.0 * float(np.sum(correlation * (1.0 - lags / n))))
+
+
+def detect_equilibration(values: np.ndarray, n_origins: int = 100) -> Tuple[int, float, float]:
+    """
+    Equilibration time t0 maximizing number of uncorrelated samples in values[t0:]
+    (Chodera, JCTC 12, 1799 (2016))
+
+    :param n_origins: number of evenly spaced candidate t0 values
+    :return: t0, statistical inefficiency of values[t0:], effective number of samples
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n < 2 or values.std() == 0:
+        return 0, 1.0, float(n)
+    best = (0, 1.0, 0.0)
+    for t0 in range(0, n - 1, max(1, (n - 1) // n_origins)):
+        g = statistical_inefficiency(values[t0:])
+        n_effective = (n - t0) / g
+        if n_effective > best[2]:
+            best = (t0, g, n_effective)
+    return best
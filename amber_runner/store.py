@@ -0,0 +1,81 @@
+"""
+Content-addressed store of rendered engine inputs shared by protocols of a campaign:
+
+    class Campaign(MdProtocol):
+        input_store = InputStore(Path("campaign/.inputs").absolute())
+
+Every distinct input (mdin, DISANG, ...) is written once as ``root/<sha1[:2]>/<sha1>``, segment files are
+hardlinks to it (symlinks across filesystems). Rendered content is memoized by a digest of the pickled input
+object, so unchanged inputs are neither rendered nor written again within a process. Stored files are
+read-only, rewrite linked input files only through the store
+"""
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, Tuple
+
+from .inputs import InputWriter
+
+
+class InputStore:
+    max_cached = 4096  # rendered inputs memoized per process
+
+    # fingerprint of input object -> stored input text and auxiliary files by name, shared by all stores
+    _rendered: Dict[Tuple[str, str], Tuple[Path, Dict[str, Path]]] = {}
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, content: str) -> Path:
+        """ Stores `content` unless it is already stored, returns the stored file """
+        data = content.encode()
+        path = self.path(hashlib.sha1(data).hexdigest())
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            tmp.chmod(0o444)
+            os.replace(tmp, path)
+        return path
+
+    @staticmethod
+    def link(stored: Path, destination: Path):
+        """ Makes `destination` refer to `stored`, nothing is done if it already does """
+        try:
+            if os.path.samefile(stored, destination):
+                return
+            os.unlink(destination)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(stored, destination)
+        except OSError:
+            os.symlink(stored.absolute(), destination)
+
+    def fingerprint(self, inp: InputWriter) -> Tuple[str, str]:
+        return str(self.root), hashlib.sha1(pickle.dumps(inp, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+    def write(self, inp: InputWriter, filename: Path) -> Dict[str, Path]:
+        """
+        Renders `inp` as `filename` (and its auxiliary files) unless identical input was rendered before,
+        links files to the store and returns stored file of every written name
+        """
+        key = self.fingerprint(inp)
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            text, files = inp.render(str(filename))
+            rendered = self.put(text), {name: self.put(content) for name, content in files.items()}
+            if len(self._rendered) >= self.max_cached:
+                self._rendered.clear()
+            # rendering may fill defaults derived from `filename` (e.g. DISANG name), in which case the content
+            # is valid only for the updated input and not for other inputs equal to it before rendering
+            self._rendered[self.fingerprint(inp)] = rendered
+        stored, files = rendered
+        result = {str(filename): stored, **files}
+        for name, path in result.items():
+            self.link(path, Path(name))
+        return result
@@ -0,0 +1,288 @@
+import json
+import queue
+import struct
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .utility import self_logger as _logger
+
+
+def count_frames(trajectory: Path) -> int:
+    """ Number of frames in NetCDF trajectory, NetCDF3 files are counted without `netCDF4` """
+    with open(trajectory, "rb") as f:
+        header = f.read(8)
+    if header[:3] == b"CDF":
+        numrecs, = struct.unpack(">i", header[4:8])
+        if numrecs >= 0:  # -1 means streaming (unknown)
+            return numrecs
+    return TrajectoryCompaction.count_frames(trajectory)
+
+
+class FrameIndex:
+    """
+    Maps trajectory segments to the files holding their frames
+
+    Each segment record stores `file` (relative to index location), frame `offset` within the file,
+    number of stored `frames` and `stride` applied to the original segment frames.
+    Index is stored as JSON lines, `save()` appends records added since the last save and the last record
+    of a segment wins. Unreadable (partially written) lines and JSON list format are rewritten on save
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.segments: Dict[int, Dict] = {}
+        self._unsaved: List[int] = []
+        self._rewrite = False
+        if self.path.is_file():
+            text = self.path.read_text()
+            if text.lstrip().startswith("["):
+                records = json.loads(text)
+                self._rewrite = True
+            else:
+                records = []
+                for line in text.splitlines():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        self._rewrite = True
+            for record in records:
+                self.segments[record["segment"]] = record
+
+    def add(self, segment: int, filename: str, offset: int = 0, frames: int = None, stride: int = 1,
+            archived: bool = False):
+        self.segments[segment] = dict(segment=segment, file=str(filename), offset=offset, frames=frames,
+                                      stride=stride, archived=archived)
+        self._unsaved.append(segment)
+
+    def files(self) -> List[str]:
+        return sorted(set(record["file"] for record in self.segments.values()))
+
+    def save(self):
+        if self._rewrite:
+            tmp = Path(f"{self.path}.bak")
+            with tmp.open("w") as out:
+                out.write("".join(json.dumps(self.segments[k]) + "\n" for k in sorted(self.segments)))
+            tmp.rename(self.path)
+            self._rewrite = False
+        elif self._unsaved:
+            with self.path.open("a") as out:
+                out.write("".join(json.dumps(self.segments[k]) + "\n" for k in self._unsaved))
+        self._unsaved = []
+
+    def __contains__(self, segment: int):
+        return segment in self.segments
+
+    def __getitem__(self, segment: int) -> Dict:
+        return self.segments[segment]
+
+
+def segment_frame_ranges(index_path: Path, segments: List[Path]) -> List[tuple]:
+    """
+    (trajectory, first frame, number of frames) of finished segments in order,
+    segments registered in frame index are taken from their (possibly archived) files
+    """
+    index = FrameIndex(index_path) if Path(index_path).is_file() else None
+    result = []
+    for i, trajectory in enumerate(segments):
+        if index is not None and i in index:
+            record = index[i]
+            result.append((Path(index_path).parent / record["file"], record["offset"], record["frames"]))
+        elif Path(trajectory).is_file():
+            result.append((Path(trajectory), 0, count_frames(trajectory)))
+    return result
+
+
+class TrajectoryCompaction:
+    """
+    Merges finished per-segment NetCDF trajectories into chunked compressed NetCDF4 archives
+
+    Compaction runs in a background thread while simulation continues.
+    Originals are removed only after archive is re-read and compared against them.
+
+    Requires optional `netCDF4` and `numpy` packages
+    """
+
+    def __init__(self,
+                 segments_per_archive: int = 100,
+                 stride: int = 1,
+                 precision: Optional[int] = 3,
+                 complevel: int = 4,
+                 frames_per_chunk: int = 100,
+                 remove_originals: bool = True):
+        assert segments_per_archive > 0
+        assert stride > 0
+        self.segments_per_archive = segments_per_archive
+        self.stride = stride
+        self.precision = precision
+        self.complevel = complevel
+        self.frames_per_chunk = frames_per_chunk
+        self.remove_originals = remove_originals
+        self._worker: Optional[threading.Thread] = None
+        self._jobs: 'queue.Queue' = None
+        self._error: Optional[Exception] = None
+        self._indices: Dict[Path, FrameIndex] = {}  # loaded once per background worker
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_worker"] = None
+        state["_jobs"] = None
+        state["_error"] = None
+        state["_indices"] = {}
+        return state
+
+    def submit(self, index_path: Path, segments: List[Tuple[int, Path]], archive_prefix: str, flush=False,
+               on_change: Optional[Callable[[Optional[int], List[Path], List[Path]], None]] = None):
+        """
+        Registers finished `segments` in the frame index and compacts full groups in background
+
+        :param index_path: frame index location
+        :param segments: (segment number, trajectory path) of newly finished segments, registered ones are skipped
+        :param archive_prefix: archive filename prefix, segment range and `.nc` suffix are appended
+        :param flush: also compact trailing incomplete group
+        :param on_change: called from background thread with None, removed originals and created archive
+                          (absolute paths) after every archive is written
+        """
+        if self._worker is None:
+            self._jobs = queue.Queue()
+            self._worker = threading.Thread(target=self._process_jobs, daemon=True)
+            self._worker.start()
+        self._jobs.put((Path(index_path).absolute(),
+                        [(i, Path(trajectory).absolute()) for i, trajectory in segments],
+                        archive_prefix,
+                        flush,
+                        on_change))
+
+    def wait(self):
+        """ Blocks until all submitted compactions are done, re-raises background error if any """
+        if self._worker is not None:
+            self._jobs.put(None)
+            self._worker.join()
+            self._worker = None
+            self._jobs = None
+            self._indices = {}
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _process_jobs(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                self.compact_pending(*job)
+            except Exception as e:
+                _logger(self).error(f"Trajectory compaction failed: {e}")
+                self._error = e
+
+    def compact_pending(self, index_path: Path, segments: List[Tuple[int, Path]], archive_prefix: str,
+                        flush=False, on_change=None):
+        if index_path not in self._indices:
+            self._indices[index_path] = FrameIndex(index_path)
+        index = self._indices[index_path]
+        root = index_path.parent
+        for i, trajectory in segments:
+            if i not in index and trajectory.is_file():
+                index.add(i, trajectory.relative_to(root), frames=self.count_frames(trajectory))
+        index.save()
+
+        pending = sorted(i for i, record in index.segments.items() if not record["archived"])
+
+        group: List[int] = []
+        for i in pending:
+            if group and i != group[-1] + 1:
+                group = []
+            group.append(i)
+            if len(group) == self.segments_per_archive:
+                self.compact(index, group, root / f"{archive_prefix}.{group[0]:05d}-{group[-1]:05d}.nc", on_change)
+                group = []
+        if flush and group:
+            self.compact(index, group, root / f"{archive_prefix}.{group[0]:05d}-{group[-1]:05d}.nc", on_change)
+
+    @staticmethod
+    def count_frames(trajectory: Path) -> int:
+        import netCDF4
+        with netCDF4.Dataset(str(trajectory)) as nc:
+            return len(nc.dimensions["frame"])
+
+    def compact(self, index: FrameIndex, group: List[int], archive: Path, on_change=None):
+        import netCDF4
+
+        root = index.path.parent
+        sources = [root / index[i]["file"] for i in group]
+        tmp = Path(f"{archive}.tmp")
+
+        offsets = []
+        with netCDF4.Dataset(str(sources[0])) as first, netCDF4.Dataset(str(tmp), "w", format="NETCDF4") as out:
+            out.setncatts({k: first.getncattr(k) for k in first.ncattrs()})
+            out.setncattr("program", "amber_runner")
+            for name, dim in first.dimensions.items():
+                out.createDimension(name, None if dim.isunlimited() else len(dim))
+            frame_variables = []
+            for name, var in first.variables.items():
+                kwargs = {}
+                if var.dimensions[:1] == ("frame",):
+                    frame_variables.append(name)
+                    kwargs = dict(zlib=self.complevel > 0, complevel=max(self.complevel, 1),
+                                  chunksizes=(self.frames_per_chunk,) + var.shape[1:])
+                    if self.precision is not None and var.dtype.kind == "f" and name != "time":
+                        kwargs["least_significant_digit"] = self.precision
+                copy = out.createVariable(name, var.dtype, var.dimensions, **kwargs)
+                copy.setncatts({k: var.getncattr(k) for k in var.ncattrs()})
+                if var.dimensions[:1] != ("frame",):
+                    copy[:] = var[:]
+
+            n = 0
+            for source in sources:
+                with netCDF4.Dataset(str(source)) as nc:
+                    m = len(range(0, len(nc.dimensions["frame"]), self.stride))
+                    for name in frame_variables:
+                        out.variables[name][n:n + m] = nc.variables[name][::self.stride]
+                offsets.append((n, m))
+                n += m
+
+        self.verify(tmp, sources, offsets)
+        tmp.rename(archive)
+
+        for i, (offset, m) in zip(group, offsets):
+            index.add(i, archive.relative_to(root), offset=offset, frames=m, stride=self.stride, archived=True)
+        index.save()
+        _logger(self).info(f"{len(sources)} segments compacted into {archive}")
+
+        if self.remove_originals:
+            for source in sources:
+                source.unlink()
+        if on_change is not None:
+            on_change(None, sources if self.remove_originals else [], [archive])
+
+    def verify(self, archive: Path, sources: List[Path], offsets: List[Tuple[int, int]]):
+        """
+        Compares every variable of `archive` with `sources` it was compacted from
+
+        Float frame variables except `time` may differ within `precision`, everything else must match exactly
+        """
+        import netCDF4
+        import numpy as np
+
+        tolerance = 0.0 if self.precision is None else 10.0 ** -self.precision
+        with netCDF4.Dataset(str(archive)) as out:
+            for source, (offset, m) in zip(sources, offsets):
+                with netCDF4.Dataset(str(source)) as nc:
+                    for name, var in nc.variables.items():
+                        frame = var.dimensions[:1] == ("frame",)
+                        if not frame and source != sources[0]:
+                            continue  # copied from the first source only
+                        original = var[::self.stride] if frame else var[:]
+                        stored = out.variables[name][offset:offset + m] if frame else out.variables[name][:]
+                        if original.shape != stored.shape:
+                            same = False
+                        elif var.dtype.kind == "f":
+                            atol = tolerance if frame and name != "time" else 0.0
+                            same = np.allclose(original, stored, rtol=0, atol=atol)
+                        else:
+                            same = np.array_equal(original, stored)
+                        if not same:
+                            raise RuntimeError(f"Verification of {archive} failed for `{name}` of {source}")
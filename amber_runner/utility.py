@@ -0,0 +1,7 @@
+import logging
+
+
+def self_logger(self_or_class) -> logging.Logger:
+    """ Same as `remote_runner.utility.self_logger`, doesn't pull remote_runner (and paramiko) on import """
+    klass = self_or_class if isinstance(self_or_class, type) else self_or_class.__class__
+    return logging.getLogger(f"{klass.__module__}.{klass.__name__}")
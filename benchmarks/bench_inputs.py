@@ -0,0 +1,100 @@
+"""
+Micro-benchmarks of input rendering and command construction
+
+Requires `pytest-benchmark`. Run from repository root:
+
+    python -m pytest benchmarks
+
+Results are saved as JSON to `.benchmarks/` (see `benchmarks/pytest.ini`), compare versions with
+
+    pytest-benchmark compare --group-by=name
+"""
+import io
+
+import pytest
+
+from amber_runner.executables import PmemdCommand
+from amber_runner.inputs import AmberInput, AmberNMRRestraints, FlatWelledParabola
+from amber_runner.MD import MdProtocol, SingleSanderCall
+
+
+def rounds(n: int, budget: int = 10 ** 6):
+    return max(1, budget // n)
+
+
+@pytest.mark.parametrize("n_wt", [10, 100, 1000])
+def test_amber_input_write(benchmark, n_wt):
+    inp = AmberInput()
+    inp.cntrl(**{f"key{i}": float(i) for i in range(100)})
+    for i in range(n_wt):
+        inp.varying_conditions.add(type="TEMP0", istep1=i * 100, istep2=(i + 1) * 100, value1=300.0, value2=310.0)
+
+    def write():
+        with io.StringIO() as out:
+            inp.write(out)
+
+    benchmark.pedantic(write, rounds=rounds(n_wt, 10 ** 4), warmup_rounds=1)
+
+
+@pytest.mark.parametrize("n_restraints", [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+def test_nmr_restraints_write(benchmark, n_restraints):
+    restraints = AmberNMRRestraints()
+    for i in range(n_restraints):
+        restraints.distance(i + 1, i + 2, FlatWelledParabola(0.0, 1.0, 2.0, 3.0, 10.0, 10.0))
+
+    def write():
+        with io.StringIO() as out:
+            restraints.write(out)
+
+    benchmark.pedantic(write, rounds=rounds(n_restraints), warmup_rounds=0)
+
+
+@pytest.mark.parametrize("width", [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+def test_group_selection_validate(benchmark, width):
+    selection = AmberInput.GroupSelection(
+        title="wide",
+        weight=10.0,
+        atom_id_ranges=[(i * width + 1, (i + 1) * width) for i in range(10)],
+        residue_id_ranges=[(i * width + 1, (i + 1) * width) for i in range(10)],
+    )
+    benchmark.pedantic(selection.validate, rounds=rounds(width), warmup_rounds=0)
+
+
+def test_pmemd_command_cmd(benchmark):
+    pmemd = PmemdCommand()
+    pmemd.prmtop = "frame.prmtop"
+    pmemd.inpcrd = "frame.rst7"
+    benchmark(lambda: pmemd.cmd)
+
+
+def test_scope_args(benchmark):
+    pmemd = PmemdCommand()
+
+    def scope():
+        with pmemd.scope_args(output_prefix="prod00001", refc="ref.rst7"):
+            pass
+
+    benchmark(scope)
+
+
+class BenchmarkProtocol(MdProtocol):
+    def __init__(self, wd, n_steps: int):
+        super().__init__(name="benchmark", wd=wd)
+        for i in range(n_steps):
+            step = SingleSanderCall(f"step{i}")
+            step.input.cntrl(imin=0, nstlim=1000, dt=0.002, nmropt=1)
+            step.input.restraints.distance(1, i + 2, FlatWelledParabola(0.0, 1.0, 2.0, 3.0, 10.0, 10.0))
+            setattr(self, f"step{i}", step)
+
+
+@pytest.mark.parametrize("n_steps", [10, 100, 1000])
+def test_protocol_save(benchmark, tmp_path, n_steps):
+    md = BenchmarkProtocol(tmp_path, n_steps)
+    benchmark.pedantic(md.save, args=(tmp_path / "state.dill",), rounds=rounds(n_steps, 10 ** 3))
+
+
+@pytest.mark.parametrize("n_steps", [10, 100, 1000])
+def test_protocol_load(benchmark, tmp_path, n_steps):
+    md = BenchmarkProtocol(tmp_path, n_steps)
+    md.save(tmp_path / "state.dill")
+    benchmark.pedantic(MdProtocol.load, args=(tmp_path / "state.dill",), rounds=rounds(n_steps, 10 ** 3))
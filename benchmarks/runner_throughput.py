@@ -0,0 +1,118 @@
+"""
+Measures amber_runner overhead with fake engine (see amber_runner.fake_engine)
+
+Reports per-segment runner overhead (time between engine exit and next engine start),
+checkpoint cost and produced I/O volume for protocols of different length:
+
+    python benchmarks/runner_throughput.py --segments 10 100 1000 10000 --output throughput.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from remote_runner.utility import ChangeDirectory
+
+from amber_runner.executables import PmemdCommand
+from amber_runner.fake_engine import fake_executable
+from amber_runner.MD import Build, MdProtocol, RepeatedSanderCall
+
+checkpoint_durations = []
+
+
+class ThroughputProtocol(MdProtocol):
+    def __init__(self, wd: Path, segments: int, atoms: int, runtime: float, timeline: Path):
+        super().__init__(name="throughput", wd=wd)
+        self.sander = PmemdCommand()
+        self.sander.executable = fake_executable("pmemd", runtime=runtime, timeline=timeline)
+
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=atoms)
+        self.build.tleap.input.source("leaprc.water.tip3p")
+        self.build.tleap.input.add_command(f"{self.build.tleap.input.frame} = sequence {{ WAT }}")
+        self.build.tleap.input.solvate_oct("TIP3PBOX", 10.0)
+
+        self.production = RepeatedSanderCall("prod", segments)
+        self.production.input.cntrl(imin=0, ntx=5, irest=1, nstlim=1000, dt=0.002, ntpr=100, ntwx=100,
+                                    ntb=2, ntp=1, ntt=3, gamma_ln=2.0, cut=8.0)
+
+    def checkpoint(self):
+        start = time.perf_counter()
+        super().checkpoint()
+        checkpoint_durations.append(time.perf_counter() - start)
+
+
+def interpreter_startup(repeat=5):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", "import amber_runner.fake_engine"])
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def summary(values):
+    if not values:
+        return {}
+    return {"mean": statistics.mean(values), "median": statistics.median(values), "max": max(values)}
+
+
+def benchmark(segments: int, atoms: int, runtime: float):
+    del checkpoint_durations[:]
+    with tempfile.TemporaryDirectory() as tmp:
+        wd = Path(tmp)
+        timeline = wd / "timeline.txt"
+        md = ThroughputProtocol(wd, segments, atoms, runtime, timeline)
+        start = time.perf_counter()
+        with ChangeDirectory(wd):
+            md.run()
+        total = time.perf_counter() - start
+
+        events = [line.split() for line in timeline.read_text().splitlines()]
+        starts = [float(t) for event, t in events if event == "start"]
+        ends = [float(t) for event, t in events if event == "end"]
+        gaps = [next_start - end for end, next_start in zip(ends, starts[1:])]
+
+        files = [f for f in wd.rglob("*") if f.is_file() and f != timeline]
+        return {
+            "segments": segments,
+            "atoms": atoms,
+            "engine_runtime": runtime,
+            "total_time": total,
+            "engine_time": sum(end - begin for begin, end in zip(starts, ends)),
+            "segment_gap": summary(gaps),
+            "checkpoint": summary(checkpoint_durations),
+            "state_size": (wd / md.state_filename).stat().st_size,
+            "io_bytes": sum(f.stat().st_size for f in files),
+            "file_count": len(files),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--atoms", type=int, default=3000)
+    parser.add_argument("--runtime", type=float, default=0.0, help="fake engine wall time per segment, seconds")
+    parser.add_argument("--output", type=Path, default=None, help="JSON file to store results")
+    args = parser.parse_args()
+
+    startup = interpreter_startup()
+    results = []
+    for segments in args.segments:
+        result = benchmark(segments, args.atoms, args.runtime)
+        result["engine_startup"] = startup
+        result["runner_overhead_per_segment"] = max(0.0, result["segment_gap"]["median"] - startup)
+        results.append(result)
+        print(json.dumps(result), flush=True)
+
+    if args.output is not None:
+        with args.output.open("w") as out:
+            json.dump(results, out, indent=1)
+
+
+if __name__ == "__main__":
+    main()
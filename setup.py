@@ -13,10 +13,20 @@ setup(
         'remote-runner~=0.2',
         'f90nml'
     ],
+    extras_require={
+        'numpy': ['numpy'],
+        'netcdf': ['numpy', 'netCDF4'],
+        'benchmark': ['pytest-benchmark'],
+    },
     tests_require=[
         'pytest'
     ],
     packages=[
         'amber_runner'
-    ]
+    ],
+    entry_points={
+        'console_scripts': [
+            'amber-runner=amber_runner.cli:main',
+        ],
+    }
 )
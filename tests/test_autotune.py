@@ -0,0 +1,81 @@
+import json
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+pytest.importorskip("numpy")
+
+from amber_runner.autotune import RankAutotuner, read_atom_count, read_ns_per_day  # noqa: E402
+from amber_runner.engines import EngineSelector  # noqa: E402
+from amber_runner.executables import PmemdCommand  # noqa: E402
+from amber_runner.fake_engine import fake_executable  # noqa: E402
+from amber_runner.MD import Build, MdProtocol, RepeatedSanderCall  # noqa: E402
+
+# wall time of fake engine by number of ranks, 4 ranks are the fastest
+RUNTIME = {1: 0.2, 2: 0.1, 4: 0.05, 8: 0.08}
+
+
+class FakeMpiAutotuner(RankAutotuner):
+    def launcher(self, ranks: int, executable):
+        self.engines = getattr(self, "engines", set()) | {tuple(executable)}
+        return fake_executable("pmemd", runtime=RUNTIME[ranks])
+
+
+class TunedProtocol(MdProtocol):
+    def __init__(self, wd: Path, cache: Path):
+        super().__init__(name="tuned", wd=wd)
+        self.sander = PmemdCommand()
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+        self.production = RepeatedSanderCall("prod", 2)
+        self.production.input.cntrl(imin=0, nstlim=100, dt=0.002, cut=9.0)
+        self.production.autotune = FakeMpiAutotuner(ranks=[1, 2, 4, 8], benchmark_steps=10, cache_path=cache)
+
+
+def test_autotune_picks_fastest_and_caches(monkeypatch):
+    monkeypatch.setenv("AMBER_RUNNER_NODE_TYPE", "test-node")
+    with ChangeToTemporaryDirectory():
+        md = TunedProtocol(Path.cwd(), Path("cache/ranks.json").absolute())
+        md.run()
+        assert md.production.tuned_executable == fake_executable("pmemd", runtime=0.05)
+        assert read_ns_per_day(Path("1_prod/prod.autotune.np4.out")) > read_ns_per_day(
+            Path("1_prod/prod.autotune.np8.out"))
+        assert read_atom_count(Path("0_build/frame.prmtop")) == 30
+        with open("cache/ranks.json") as f:
+            assert json.load(f)["test-node|pmemd.MPI|30|9"]["ranks"] == 4
+
+        tuner = md.production.autotune
+        tuner.ranks = []  # cached result is reused without benchmarks
+        md.production.tuned_executable = None
+        assert tuner.tune(md, md.production) == fake_executable("pmemd", runtime=0.05)
+
+
+def test_autotune_follows_selected_engine(monkeypatch):
+    monkeypatch.setenv("AMBER_RUNNER_NODE_TYPE", "test-node")
+    with ChangeToTemporaryDirectory():
+        md = TunedProtocol(Path.cwd(), Path("ranks.json").absolute())
+        with ChangeDirectory(md.wd):
+            md.mkdir(md.build.step_dir)
+            md.build.run(md)
+            md.mkdir(md.production.step_dir)
+            tuner = md.production.autotune
+
+            md.engine_selector = EngineSelector(mpi_ranks=2, which=lambda name: f"/opt/amber/bin/{name}" if name in (
+                "mpirun", "sander.MPI") else None)
+            assert tuner.tune(md, md.production) == fake_executable("pmemd", runtime=0.05)
+            assert tuner.engines == {("/opt/amber/bin/sander.MPI",)}
+            with open("ranks.json") as f:
+                assert list(json.load(f)) == ["test-node|sander.MPI|30|9"]
+
+            md.engine_selector = EngineSelector(mpi_ranks=2, which=lambda name: f"/opt/amber/bin/{name}" if name in (
+                "mpirun", "pmemd.MPI", "pmemd.cuda") else None)
+            assert tuner.tune(md, md.production) is None  # pmemd.cuda is preferred and is not MPI-capable
+
+
+def test_read_ns_per_day():
+    with ChangeToTemporaryDirectory():
+        Path("md.out").write_text("|         ns/day =      12.50   seconds/ns =    6912.00\n"
+                                  "|         ns/day =      11.00   seconds/ns =    7854.55\n")
+        assert read_ns_per_day(Path("md.out")) == 11.0
+        assert read_ns_per_day(Path("missing.out")) is None
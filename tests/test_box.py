@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+np = pytest.importorskip("numpy")
+
+from amber_runner.box import box_options  # noqa: E402
+from amber_runner.fake_engine import fake_executable  # noqa: E402
+from amber_runner.MD import BoxOptimization, Build, MdProtocol  # noqa: E402
+
+
+def rod(length: float, n: int = 200):
+    """ Randomly rotated straight chain of atoms """
+    points = np.zeros((n, 3))
+    points[:, 0] = np.linspace(0, length, n)
+    rotation, _ = np.linalg.qr(np.random.RandomState(0).normal(size=(3, 3)))
+    return points @ rotation
+
+
+def test_box_options():
+    options = {option.shape: option for option in box_options(rod(50.0), min_image_distance=20.0)}
+    assert options["rectangular"].dimensions == pytest.approx([70.0, 20.0, 20.0], abs=1e-6)
+    assert options["cube"].dimensions[0] == pytest.approx(70.0)
+    # truncated octahedron is ~77% of the cube, images are min_image_distance apart
+    assert options["octahedron"].volume / options["cube"].volume == pytest.approx(0.7698, abs=1e-3)
+    assert options["octahedron"].dimensions[0] * 3 ** 0.5 / 2 - 50.0 == pytest.approx(20.0)
+    # buffers between the rod ends and the nearest faces, as tleap measures them
+    assert options["cube"].buffer == pytest.approx(10.0)
+    assert options["octahedron"].buffer == pytest.approx(10.0)
+    ordered = box_options(rod(50.0), min_image_distance=20.0)
+    assert [option.shape for option in ordered] == ["rectangular", "octahedron", "cube"]
+    assert ordered[0].relative_cost == 1.0
+    assert ordered[2].predicted_atoms > ordered[1].predicted_atoms
+
+
+class BoxProtocol(MdProtocol):
+    def __init__(self, wd: Path):
+        super().__init__(name="box", wd=wd)
+        self.box = BoxOptimization("box", Path("solute.pdb").absolute(), min_image_distance=20.0)
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+        self.build.tleap.input.load_pdb("solute.pdb")
+        self.build.tleap.input.add_ions("Na+")
+
+
+def test_box_optimization_step():
+    with ChangeToTemporaryDirectory():
+        Path("solute.pdb").write_text("".join(
+            f"ATOM  {i + 1:5d}  CA  ALA {i + 1:5d}    {x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00\n"
+            for i, (x, y, z) in enumerate(rod(30.0, 20))))
+        md = BoxProtocol(Path.cwd())
+        md.run()
+        assert md.box.selected["shape"] == "octahedron"
+        assert len(json.loads(Path("0_box/box.json").read_text())) == 3
+        commands = md.build.tleap.input.commands
+        assert commands[1] == "alignaxes frame"
+        assert commands[2].startswith("solvateoct frame TIP3PBOX ") and commands[2].endswith(" iso")
+        assert commands[3] == "addions frame Na+ 0"  # ions are added to the solvated system
+
+        md = BoxProtocol(Path.cwd())
+        md.build.tleap.input.solvate_oct("TIP3PBOX", 10.0)
+        with pytest.raises(RuntimeError, match="already contains solvation"):
+            md.box.run(md)
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+from amber_runner.bulk import create_protocols
+from amber_runner.MD import Build, MdProtocol, SingleSanderCall
+
+
+class SweepProtocol(MdProtocol):
+    def __init__(self, name: str, temp0: float):
+        wd = Path(name).absolute()
+        wd.mkdir()
+        super().__init__(name=name, wd=wd)
+        self.build = Build("build")
+        self.build.tleap.input.source("leaprc.protein.ff14SB")
+        self.minimize = SingleSanderCall("minimize")
+        self.minimize.input.cntrl(imin=1, maxcyc=100)
+        self.production = SingleSanderCall("production")
+        self.production.input.cntrl(imin=0, nstlim=1000, temp0=temp0)
+
+
+def test_create_protocols():
+    with ChangeToTemporaryDirectory():
+        table = [dict(name=f"P{i}", temp0=300.0 + i % 2) for i in range(10)]
+        protocols = create_protocols(SweepProtocol, table, jobs=2, chunksize=3)
+
+        assert [md.name for md in protocols] == [row["name"] for row in table]
+        for md, row in zip(protocols, table):
+            loaded = MdProtocol.load(md.wd / md.state_filename)
+            assert loaded.name == row["name"]
+            assert loaded.production.input.cntrl["temp0"] == row["temp0"]
+
+        p0, p1 = protocols[:2]
+        p0.minimize.input.cntrl(maxcyc=10)  # in-place edits stay private
+        p0.build.tleap.input.source("leaprc.water.tip3p")
+        assert p1.minimize.input.cntrl["maxcyc"] == 100
+        assert p1.build.tleap.input.commands == ["source leaprc.protein.ff14SB"]
+
+
+def test_create_protocols_without_pool():
+    with ChangeToTemporaryDirectory():
+        protocols = create_protocols(SweepProtocol, [dict(name="A", temp0=300.0)], jobs=1)
+        assert (protocols[0].wd / "state.dill").is_file()
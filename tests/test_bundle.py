@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner.bundle import TaskBundle
+from amber_runner.MD import MdProtocol, Step
+
+
+class Noop(Step):
+    def run(self, md: 'MdProtocol'):
+        Path(self.step_dir / "done.txt").write_text(md.name)
+
+
+class Fail(Step):
+    def run(self, md: 'MdProtocol'):
+        raise ValueError("broken input")
+
+
+class Member(MdProtocol):
+    def __init__(self, wd: Path, fail: bool):
+        wd.mkdir(parents=True)
+        super().__init__(name=wd.name, wd=wd)
+        self.first = Noop("first")
+        if fail:
+            self.second = Fail("second")
+
+
+def test_bundle_runs_members_concurrently():
+    with ChangeToTemporaryDirectory():
+        root = Path("bundle").absolute()
+        root.mkdir()
+        members = [Member(root / f"M{i}", fail=i == 2) for i in range(4)]
+        bundle = TaskBundle(root, members, slots=2)
+
+        with ChangeDirectory(root), pytest.raises(RuntimeError, match="1 of 4 members"):
+            bundle.run()
+
+        statuses = json.loads((root / "bundle_status.json").read_text())
+        assert {member: status["status"] for member, status in statuses.items()} == {
+            "M0/state.dill": "complete", "M1/state.dill": "complete",
+            "M2/state.dill": "failed", "M3/state.dill": "complete",
+        }
+        assert "broken input" in statuses["M2/state.dill"]["error"]
+        assert (root / "M3/0_first/done.txt").read_text() == "M3"
+        m2 = MdProtocol.load(root / "M2/state.dill")
+        assert m2.summary()["step"] == "second"  # member checkpointed independently
+
+        loaded = TaskBundle.load(root / "state.dill")
+        assert loaded.statuses == statuses
+        (root / "M0/0_first/done.txt").unlink()
+        with ChangeDirectory(root), pytest.raises(RuntimeError):
+            loaded.run()
+        assert not (root / "M0/0_first/done.txt").exists()  # completed members are not rerun
@@ -0,0 +1,83 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+from amber_runner import cli
+from amber_runner.MD import MdProtocol, RepeatedSanderCall
+
+
+class Production(MdProtocol):
+    def __init__(self, wd: Path, done: int):
+        wd.mkdir(parents=True)
+        super().__init__(name=wd.name, wd=wd)
+        self.production = RepeatedSanderCall("prod", 10)
+        self.production.input.cntrl(nstlim=50000, dt=0.002)
+        self.production.current_step = done
+        self.save(wd / self.state_filename)
+
+
+def test_status(capsys):
+    with ChangeToTemporaryDirectory():
+        Production(Path("campaign/P0").absolute(), 10)
+        Production(Path("campaign/P1").absolute(), 4)
+        assert cli.main(["status", "campaign", "--cache", "cache.json", "-j", "2"]) == 0
+        out = capsys.readouterr().out.splitlines()
+        assert out[0].split()[:2] == ["complete", "P0"]
+        assert out[1].split()[:4] == ["running", "P1", "prod", "4/10"]
+        assert out[2] == "total: complete=1, running=1 (2)"
+
+        cli.main(["progress", "campaign", "--no-cache"])
+        assert capsys.readouterr().out.splitlines()[-1] == "total: 1.4 / 2.0 ns (70.0%)"
+
+
+def test_status_lists_bundle_members(capsys):
+    from amber_runner.bundle import TaskBundle
+
+    with ChangeToTemporaryDirectory():
+        root = Path("campaign/bundle").absolute()
+        members = [Production(root / f"M{i}", i) for i in range(2)]
+        TaskBundle(root, members).save(root / "state.dill")
+        Production(Path("campaign/P0").absolute(), 10)
+
+        states = cli.find_states([Path("campaign")])
+        assert [str(state.relative_to(Path.cwd())) for state in states] == [
+            str(Path(path)) for path in ["campaign/P0/state.dill", "campaign/bundle/M0/state.dill",
+                                         "campaign/bundle/M1/state.dill", "campaign/bundle/state.dill"]]
+        assert cli.main(["status", "campaign", "--no-cache"]) == 0
+        out = capsys.readouterr().out.splitlines()
+        assert [line.split()[1] for line in out if line.startswith("running")] == ["M0", "M1"]
+
+
+def test_summaries_are_cached(monkeypatch):
+    with ChangeToTemporaryDirectory():
+        p0 = Production(Path("P0").absolute(), 1)
+        Production(Path("P1").absolute(), 2)
+        cache = cli.SummaryCache(Path("cache.json"))
+        states = cli.find_states([Path(".")])
+        assert len(cli.collect(states, cache, jobs=1)) == 2
+
+        loaded = []
+        monkeypatch.setattr(cli, "load_summary", lambda state: loaded.append(state) or {"status": "x"})
+        cache = cli.SummaryCache(Path("cache.json"))
+        assert [s["segment"] for s in cli.collect(states, cache, jobs=1)] == [1, 2]
+        assert loaded == []
+
+        p0.production.current_step = 3
+        p0.save(p0.wd / p0.state_filename)
+        cli.collect(states, cli.SummaryCache(Path("cache.json")), jobs=1)
+        assert loaded == [str(states[0])]
+
+
+def test_eta():
+    assert cli.eta_days(dict(status="running", ns_per_day=10.0, simulated_ns=20.0, total_ns=100.0)) == 8.0
+    assert cli.eta_days(dict(status="running", ns_per_day=None, simulated_ns=20.0, total_ns=100.0)) is None
+    assert cli.eta_days(dict(status="complete")) == 0.0
+
+
+def test_import_is_lightweight():
+    modules = subprocess.check_output([sys.executable, "-c", "import sys, amber_runner.cli; "
+                                                             "print(' '.join(sys.modules))"]).decode().split()
+    for heavy in ["dill", "f90nml", "remote_runner", "paramiko", "numpy"]:
+        assert heavy not in modules
@@ -0,0 +1,164 @@
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+np = pytest.importorskip("numpy")
+
+from amber_runner.convergence import (ConvergenceMonitor, EquilibrationCriterion, StandardErrorCriterion,  # noqa: E402
+                                      read_mdout_records)
+from amber_runner.executables import PmemdCommand  # noqa: E402
+from amber_runner.fake_engine import fake_executable, mdout_record  # noqa: E402
+from amber_runner.MD import Build, MdProtocol, RepeatedSanderCall, SingleSanderCall  # noqa: E402
+from amber_runner.statistics import detect_equilibration, statistical_inefficiency  # noqa: E402
+
+
+def ar1(n: int, phi: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.RandomState(seed)
+    noise = rng.normal(size=n)
+    values = np.zeros(n)
+    for i in range(1, n):
+        values[i] = phi * values[i - 1] + noise[i]
+    return values
+
+
+def test_statistical_inefficiency():
+    assert statistical_inefficiency(np.random.RandomState(0).normal(size=5000)) == pytest.approx(1.0, abs=0.2)
+    assert statistical_inefficiency(ar1(50000, 0.8)) == pytest.approx((1 + 0.8) / (1 - 0.8), rel=0.2)
+    assert statistical_inefficiency(np.ones(10)) == 1.0
+
+
+def test_detect_equilibration():
+    values = 10 * np.exp(-np.arange(2000) / 50.0) + ar1(2000, 0.5)
+    t0, g, n_effective = detect_equilibration(values)
+    assert 100 < t0 < 500
+    assert n_effective == pytest.approx((2000 - t0) / g)
+    assert detect_equilibration(np.ones(5)) == (0, 1.0, 5.0)
+
+
+def test_read_mdout_records():
+    with ChangeToTemporaryDirectory():
+        rng = np.random.RandomState(0)
+        Path("md.out").write_text(
+            "header\n ------\n" + mdout_record(10, 0.02, rng) + mdout_record(20, 0.04, rng) +
+            "\n      A V E R A G E S   O V E R       2 S T E P S\n" + mdout_record(20, 0.04, rng) +
+            "\n      R M S  F L U C T U A T I O N S\n" + mdout_record(20, 0.04, rng) +
+            mdout_record(30, 0.06, rng).replace("VOLUME     = ", "VOLUME     = ******** ")
+        )
+        records = list(read_mdout_records(Path("md.out")))
+        assert [record["NSTEP"] for record in records] == [10, 20, 30]
+        assert set(records[0]) >= {"TIME(PS)", "TEMP(K)", "Etot", "1-4 NB", "Density", "VOLUME"}
+        assert np.isnan(records[2]["VOLUME"])
+
+
+class Relaxing(RepeatedSanderCall):
+    """ Density relaxes from 0.9 to 1.0 g/cm^3 within the first segment """
+
+    def run_segment(self, md: 'MdProtocol'):
+        rng = np.random.RandomState(self.current_step)
+        steps = np.arange(100) + 100 * self.current_step
+        density = 1.0 - 0.1 * np.exp(-steps / 20.0) + rng.normal(scale=0.002, size=100)
+        with open(f"{self.segment_prefix(self.current_step)}.out", "w") as out:
+            for step, value in zip(steps, density):
+                out.write(f" NSTEP = {step:8d}   TIME(PS) = {step * 0.002:11.3f}\n"
+                          f"                                                    Density    = {value:14.4f}\n"
+                          f" ------------------------------------------------------------------------------\n")
+
+
+class ConvergingProtocol(MdProtocol):
+    def __init__(self, wd: Path):
+        wd.mkdir()
+        super().__init__(name=wd.name, wd=wd)
+        self.production = Relaxing("prod", 50)
+        self.production.convergence = ConvergenceMonitor([
+            EquilibrationCriterion("Density", min_samples=50),
+            StandardErrorCriterion("Density", target=0.0003),
+        ], min_segments=2)
+
+
+def test_repeated_step_ends_when_converged():
+    with ChangeToTemporaryDirectory():
+        md = ConvergingProtocol(Path("P").absolute())
+        with ChangeDirectory(md.wd):
+            md.run()
+        assert 2 <= md.production.current_step < 50
+        assert md.production.number_of_steps == md.production.current_step
+        assert md.production.is_complete
+        assert len(md.production.convergence.series["Density"]) == 100 * md.production.current_step
+        equilibration, error = md.production.convergence.last_report
+        assert equilibration["met"] and equilibration["t0"] > 0
+        assert error["met"] and error["mean"] == pytest.approx(1.0, abs=0.001)
+
+        loaded = MdProtocol.load(md.wd / "state.dill")
+        assert loaded.next_unit() is None
+
+
+class EquilibrationProtocol(MdProtocol):
+    def __init__(self, wd: Path, target: float):
+        wd.mkdir()
+        super().__init__(name=wd.name, wd=wd)
+        self.sander = PmemdCommand()
+        self.sander.executable = fake_executable("pmemd")
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+        self.equilibration = SingleSanderCall("equil")
+        self.equilibration.input.cntrl(imin=0, irest=0, ntx=1, nstlim=1000, dt=0.002, ntpr=10)
+        self.equilibration.convergence = ConvergenceMonitor([StandardErrorCriterion("Etot", target=target)])
+
+
+def test_single_call_stops_before_nstlim():
+    with ChangeToTemporaryDirectory():
+        md = EquilibrationProtocol(Path("P").absolute(), target=2.0)
+        with ChangeDirectory(md.wd):
+            md.run()
+        step_dir = md.wd / md.equilibration.step_dir
+        chunks = sorted(path.name for path in step_dir.glob("equil.*.out"))
+        assert 2 <= len(chunks) < 10
+        assert md.sander.inpcrd == str(md.equilibration.step_dir / f"equil.{len(chunks) - 1:03d}.ncrst")
+        first, last = [(step_dir / chunks[i].replace(".out", ".in")).read_text() for i in (0, -1)]
+        assert "nstlim=100" in first.replace(" ", "") and "irest=0" in first.replace(" ", "")
+        assert "irest=1" in last.replace(" ", "") and "ntx=5" in last.replace(" ", "")
+        assert md.equilibration.input.namelist["cntrl"]["nstlim"] == 1000  # chunk settings are scoped
+
+        md = EquilibrationProtocol(Path("Q").absolute(), target=0.01)  # never met, full nstlim is run
+        with ChangeDirectory(md.wd):
+            md.run()
+        assert len(list((md.wd / md.equilibration.step_dir).glob("equil.*.out"))) == 10
+
+
+def test_single_call_resumes_from_checkpointed_chunk(monkeypatch):
+    from amber_runner import MD
+
+    run = MD.CommandWithInput.run
+    calls = []
+
+    def interrupted_run(self):
+        if len(calls) == 3:
+            raise RuntimeError("interrupted")
+        calls.append(self)
+        run(self)
+
+    with ChangeToTemporaryDirectory():
+        md = EquilibrationProtocol(Path("P").absolute(), target=0.01)
+        monkeypatch.setattr(MD.CommandWithInput, "run", interrupted_run)
+        with ChangeDirectory(md.wd), pytest.raises(RuntimeError, match="interrupted"):
+            md.run()
+        monkeypatch.setattr(MD.CommandWithInput, "run", run)
+
+        resumed = MdProtocol.load(md.wd / md.state_filename)
+        assert resumed.equilibration.current_chunk == 2  # build and two chunks
+        assert resumed.sander.inpcrd == str(md.equilibration.step_dir / "equil.001.ncrst")
+        first = (md.wd / md.equilibration.step_dir / "equil.000.out").stat().st_mtime_ns
+        with ChangeDirectory(resumed.wd):
+            resumed.run()
+        assert (md.wd / md.equilibration.step_dir / "equil.000.out").stat().st_mtime_ns == first
+        assert resumed.equilibration.current_chunk == 10
+        assert len(resumed.equilibration.convergence.series["Etot"]) == 1000 // 10
+
+
+def test_single_call_convergence_requires_divisible_nstlim():
+    with ChangeToTemporaryDirectory():
+        md = EquilibrationProtocol(Path("P").absolute(), target=2.0)
+        md.equilibration.input.cntrl(nstlim=1001)
+        with ChangeDirectory(md.wd), pytest.raises(ValueError, match="not divisible"):
+            md.run()
@@ -0,0 +1,70 @@
+import io
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+np = pytest.importorskip("numpy")
+
+from amber_runner.cpptraj import merge_data_files  # noqa: E402
+from amber_runner.executables import PmemdCommand  # noqa: E402
+from amber_runner.fake_engine import fake_executable  # noqa: E402
+from amber_runner.inputs import CpptrajInput  # noqa: E402
+from amber_runner.MD import Build, CpptrajAnalysis, MdProtocol, RepeatedSanderCall  # noqa: E402
+
+
+def test_cpptraj_input():
+    inp = CpptrajInput()
+    inp.distance("end2end", ":1@CA", ":10@CA", out="dist.dat")
+    inp.rms("rmsd", "@CA", out="rmsd.dat")
+    inp.radgyr("rog", "@CA", out="dist.dat")
+    inp.run()
+    with io.StringIO() as out:
+        inp.write(out)
+        assert out.getvalue().splitlines() == [
+            "distance end2end :1@CA :10@CA out dist.dat",
+            "rms rmsd @CA first out rmsd.dat",
+            "radgyr rog @CA out dist.dat",
+            "run",
+        ]
+    assert inp.data_files == ["dist.dat", "rmsd.dat"]
+
+
+def test_merge_data_files():
+    with ChangeToTemporaryDirectory():
+        Path("a.dat").write_text("#Frame        d1\n       1    1.0000\n       2    2.0000\n")
+        Path("b.dat").write_text("#Frame        d1\n       1    3.0000\n")
+        merge_data_files([Path("a.dat"), Path("b.dat")], Path("ab.dat"))
+        assert Path("ab.dat").read_text() == "#Frame        d1\n       1    1.0000\n       2    2.0000\n" \
+                                             "       3    3.0000\n"
+
+
+class AnalysisProtocol(MdProtocol):
+    def __init__(self, wd: Path, max_concurrency: int):
+        super().__init__(name="analysis", wd=wd)
+        self.sander = PmemdCommand()
+        self.sander.executable = fake_executable("pmemd")
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+        self.production = RepeatedSanderCall("prod", 4)
+        self.production.input.cntrl(imin=0, nstlim=100, dt=0.002, ntpr=50, ntwx=20)
+        self.analysis = CpptrajAnalysis("analysis", "production", max_concurrency=max_concurrency)
+        self.analysis.cpptraj.exe.executable = fake_executable("cpptraj")
+        self.analysis.cpptraj.input.distance("d1", ":1", ":2", out="dist.dat")
+        self.analysis.cpptraj.input.radgyr("rog", ":1-10", out="dist.dat")
+
+
+def test_segments_are_analysed_and_merged():
+    with ChangeToTemporaryDirectory():
+        for name, concurrency in [("parallel", 4), ("serial", 1)]:
+            Path(name).mkdir()
+            md = AnalysisProtocol(Path(name).absolute(), concurrency)
+            with ChangeDirectory(md.wd):
+                md.run()
+        merged = Path("parallel/2_analysis/dist.dat").read_text()
+        assert merged == Path("serial/2_analysis/dist.dat").read_text()
+        data = np.loadtxt("parallel/2_analysis/dist.dat")
+        assert data.shape == (20, 3)
+        assert data[:, 0].tolist() == list(range(1, 21))
+        assert Path("parallel/2_analysis/segment00003/cpptraj.in").read_text().startswith(
+            f"trajin {Path('parallel/1_prod/prod00003.nc').absolute()} 1 5 1\n")
@@ -0,0 +1,82 @@
+import functools
+import os
+import shutil
+import stat
+import sys
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+from amber_runner.engines import EngineSelector, NoCompatibleEngineError
+from amber_runner.executables import PmemdCommand
+from amber_runner.inputs import AmberInput
+from amber_runner.MD import MdProtocol, SingleSanderCall
+
+
+def fake_which(*names):
+    return lambda name: f"/opt/amber/bin/{name}" if name in names else None
+
+
+def test_selection_falls_back_to_sander():
+    selector = EngineSelector(mpi_ranks=8, which=fake_which("mpirun", "pmemd.MPI", "pmemd", "sander"))
+    md = AmberInput()
+    md.cntrl(imin=0, nmropt=1)
+    md.varying_conditions.add(type="TEMP0", istep1=0, istep2=100, value1=0.0, value2=300.0)
+    assert selector.select(md).name == "pmemd.MPI"
+    assert selector.executable(selector.select(md)) == ["mpirun", "-np", "8", "/opt/amber/bin/pmemd.MPI"]
+
+    gb = AmberInput()
+    gb.cntrl(imin=0, igb=6)
+    assert selector.select(gb).name == "sander"
+
+    qmmm = AmberInput()
+    qmmm.cntrl(imin=0, ifqnt=1)
+    qmmm.qmmm(qmmask=":1")
+    assert selector.select(qmmm).name == "sander"
+
+    no_mpi = EngineSelector(which=fake_which("mpirun", "pmemd.MPI", "pmemd"))
+    assert no_mpi.select(md).name == "pmemd"
+    with pytest.raises(NoCompatibleEngineError, match="pmemd \\(igb=6\\)"):
+        no_mpi.select(gb)
+
+
+def test_scope_drops_pmemd_only_arguments():
+    selector = EngineSelector(which=fake_which("sander"))
+    pmemd = PmemdCommand()
+    pmemd.allow_small_box = True
+    with selector.scope(pmemd, selector.engines[-1]) as exe:
+        assert exe.cmd[0] == "/opt/amber/bin/sander"
+        assert "-AllowSmallBox" not in exe.cmd
+    assert pmemd.allow_small_box is True
+    assert pmemd.cmd[0] == "pmemd"
+
+
+class SelectingProtocol(MdProtocol):
+    def __init__(self, wd: Path):
+        super().__init__(name="select", wd=wd)
+        self.engine_selector = EngineSelector(which=fake_which())
+        self.minimize = SingleSanderCall("minimize")
+        self.minimize.input.cntrl(imin=1, maxcyc=10, igb=6)
+        self.heat = SingleSanderCall("heat")
+        self.heat.input.cntrl(imin=0, nstlim=10, dt=0.002)
+
+
+def test_protocol_records_selected_engines():
+    pytest.importorskip("numpy")
+    with ChangeToTemporaryDirectory():
+        Path("bin").mkdir()
+        for engine in ["pmemd", "sander"]:
+            script = Path("bin") / engine
+            script.write_text(f"#!/bin/sh\nexec {sys.executable} -m amber_runner.fake_engine {engine} -- \"$@\"\n")
+            script.chmod(script.stat().st_mode | stat.S_IEXEC)
+        path = f"{Path('bin').absolute()}{os.pathsep}{os.environ['PATH']}"
+        md = SelectingProtocol(Path.cwd())
+        md.engine_selector.which = functools.partial(shutil.which, path=path)
+        md.sander.prmtop = "frame.prmtop"
+        md.sander.inpcrd = "frame.rst7"
+        Path("frame.prmtop").touch()
+        Path("frame.rst7").write_text("title\n    1\n   0.0000000   0.0000000   0.0000000\n")
+        md.run()
+        assert (md.minimize.engine, md.heat.engine) == ("sander", "pmemd")
+        assert md.summary()["status"] == "complete"
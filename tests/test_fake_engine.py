@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+np = pytest.importorskip("numpy")
+
+from amber_runner.executables import PmemdCommand  # noqa: E402
+from amber_runner.fake_engine import fake_executable  # noqa: E402
+from amber_runner.health import SegmentHealthCheck, SegmentHealthError  # noqa: E402
+from amber_runner.MD import Build, MdProtocol, RepeatedSanderCall  # noqa: E402
+from amber_runner.restart import Restart  # noqa: E402
+
+
+class FakeProtocol(MdProtocol):
+    def __init__(self, wd: Path, segments: int, **engine_options):
+        super().__init__(name="fake", wd=wd)
+        self.sander = PmemdCommand()
+        self.sander.executable = fake_executable("pmemd", **engine_options)
+
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=300)
+        self.build.tleap.input.add_command(f"{self.build.tleap.input.frame} = sequence {{ WAT }}")
+        self.build.tleap.input.solvate_oct("TIP3PBOX", 10.0)
+
+        self.production = RepeatedSanderCall("prod", segments)
+        self.production.input.cntrl(imin=0, nstlim=100, dt=0.002, ntpr=10, ntwx=20)
+
+
+def test_fake_protocol():
+    with ChangeToTemporaryDirectory():
+        md = FakeProtocol(Path.cwd(), 3, timeline="timeline.txt")
+        md.run()
+
+        assert Path("0_build/frame.prmtop").read_text().count("WAT") == 100
+        initial = Restart.read(Path("0_build/frame.rst7"))
+        assert initial.n_atoms == 300
+        assert initial.box is not None
+
+        for i in range(3):
+            assert "Total wall time" in Path(f"1_prod/prod{i:05d}.out").read_text()
+            assert Path(f"1_prod/prod{i:05d}.nc").is_file()
+        final = Restart.read(Path(md.sander.inpcrd))
+        assert md.sander.inpcrd == "1_prod/prod00002.ncrst"
+        assert final.time == pytest.approx(0.6)
+        assert final.velocities.shape == (300, 3)
+
+        assert Path("timeline.txt").read_text().split()[::2] == ["start", "end"] * 3
+
+
+def test_fake_trajectory_is_readable():
+    netCDF4 = pytest.importorskip("netCDF4")
+    with ChangeToTemporaryDirectory():
+        md = FakeProtocol(Path.cwd(), 1)
+        md.run()
+        with netCDF4.Dataset("1_prod/prod00000.nc") as nc:
+            assert nc.variables["coordinates"].shape == (5, 300, 3)
+            assert np.allclose(nc.variables["time"][:], [0.04, 0.08, 0.12, 0.16, 0.2])
+
+
+@pytest.mark.parametrize("failure", ["exit", "vlimit", "nan", "truncate"])
+def test_failure_injection(failure):
+    with ChangeToTemporaryDirectory():
+        md = FakeProtocol(Path.cwd(), 1, failure=failure, failure_rate=1.0)
+        md.production.health_check = SegmentHealthCheck(max_retries=1)
+        with pytest.raises(SegmentHealthError):
+            md.run()
+        assert Path(md.sander.inpcrd) == Path("0_build/frame.rst7")
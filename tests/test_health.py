@@ -0,0 +1,109 @@
+import sys
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+from amber_runner.executables import PmemdCommand
+from amber_runner.health import ScopeNamelistValues, SegmentHealthCheck, SegmentHealthError
+from amber_runner.inputs import AmberInput
+from amber_runner.MD import RepeatedSanderCall
+
+GOOD_MDOUT = """
+   NSTEP =     1000   TIME(PS) =       2.000  TEMP(K) =   300.12  PRESS =     0.0
+ Etot   =    -12345.6789  EKtot   =      2345.6789  EPtot      =    -14691.3578
+|  Total wall time:          12    seconds     0.00 hours
+"""
+
+FAKE_ENGINE = """
+import sys, shutil
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+mdin = open(args["-i"]).read()
+with open(args["-o"], "w") as out:
+    if "dt = 0.002" in mdin:
+        out.write("vlimit exceeded for step 10; vmax = 21.3\\n")
+    out.write("|  Total wall time:          12    seconds     0.00 hours\\n")
+shutil.copy(args["-c"], args["-r"])
+"""
+
+
+class FakeEngine(PmemdCommand):
+    executable = [sys.executable, "-c", FAKE_ENGINE]
+
+
+def test_check_mdout():
+    check = SegmentHealthCheck(tail_size=256)
+    with ChangeToTemporaryDirectory():
+        Path("good.out").write_text("x" * 10000 + GOOD_MDOUT)
+        assert check.check_mdout(Path("good.out")) == []
+
+        Path("bad.out").write_text(GOOD_MDOUT.replace("-12345.6789", "NaN"))
+        assert check.check_mdout(Path("bad.out")) == ["bad.out: `NaN` found"]
+
+        Path("truncated.out").write_text(GOOD_MDOUT.splitlines()[1])
+        assert check.check_mdout(Path("truncated.out")) == ["truncated.out: `Total wall time` not found"]
+
+        # only tail is scanned
+        Path("old.out").write_text("vlimit exceeded\n" + "x" * 1000 + GOOD_MDOUT)
+        assert check.check_mdout(Path("old.out")) == []
+
+        assert check.check_mdout(Path("missing.out")) == ["missing.out is missing"]
+
+
+def test_check_restrt():
+    np = pytest.importorskip("numpy")
+    from amber_runner.restart import Restart
+
+    check = SegmentHealthCheck(max_box_change=1.1)
+    box = np.array([30.0, 30.0, 30.0, 90.0, 90.0, 90.0])
+    with ChangeToTemporaryDirectory():
+        Restart(np.zeros((3, 3)), box=box).write("good.ncrst")
+        Restart(np.zeros((3, 3)), box=box * [1.5, 1.5, 1.5, 1, 1, 1]).write("exploded.ncrst")
+        Restart(np.full((3, 3), np.nan), box=box).write("nan.rst7")
+
+        assert check.check_restrt(Path("good.ncrst"), Path("good.ncrst")) == []
+        assert check.check_restrt(Path("nan.rst7")) == ["nan.rst7: non-finite coordinates"]
+        assert "box changed" in check.check_restrt(Path("exploded.ncrst"), Path("good.ncrst"))[0]
+
+
+def test_scope_namelist_values():
+    inp = AmberInput()
+    inp.cntrl(dt=0.002)
+    with ScopeNamelistValues(inp, {"cntrl": {"dt": 0.001, "nstlim": 10}}):
+        assert inp.cntrl["dt"] == 0.001
+        assert inp.cntrl["nstlim"] == 10
+    assert inp.cntrl["dt"] == 0.002
+    assert "nstlim" not in inp.cntrl
+
+
+def make_step(retry_settings):
+    step = RepeatedSanderCall("prod", 1)
+    step.step_dir = Path(".")
+    step.health_check = SegmentHealthCheck(check_restart=False, retry_settings=retry_settings)
+    step.input.cntrl(dt=0.002)
+    return step
+
+
+class FakeProtocol:
+    input_store = None
+
+    def __init__(self):
+        self.sander = FakeEngine()
+        self.sander.inpcrd = "initial.rst7"
+
+
+def test_retry_with_alternative_settings():
+    with ChangeToTemporaryDirectory():
+        Path("initial.rst7").write_text("")
+        md = FakeProtocol()
+        make_step([{"cntrl": {"dt": 0.001}}]).run_segment(md)
+        assert md.sander.inpcrd == "prod00000.ncrst"
+
+
+def test_retry_limit():
+    with ChangeToTemporaryDirectory():
+        Path("initial.rst7").write_text("")
+        md = FakeProtocol()
+        with pytest.raises(SegmentHealthError, match="vlimit exceeded"):
+            make_step([{}, {}]).run_segment(md)
+        assert md.sander.inpcrd == "initial.rst7"
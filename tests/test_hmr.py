@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+pytest.importorskip("numpy")
+
+from amber_runner.executables import PmemdCommand  # noqa: E402
+from amber_runner.fake_engine import fake_executable  # noqa: E402
+from amber_runner.inputs import AmberInput  # noqa: E402
+from amber_runner.MD import Build, HydrogenMassRepartition, MdProtocol, SingleSanderCall  # noqa: E402
+
+
+class HmrProtocol(MdProtocol):
+    def __init__(self, wd: Path):
+        super().__init__(name="hmr", wd=wd)
+        self.sander = PmemdCommand()
+        self.sander.executable = fake_executable("pmemd")
+
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+        self.hmr = HydrogenMassRepartition("hmr")
+        self.hmr.parmed.exe.executable = fake_executable("parmed")
+        self.production = SingleSanderCall("prod")
+        self.production.input.cntrl(imin=0, nstlim=1000, dt=0.002, ntc=2, ntf=2, ntpr=100, ntwx=500)
+        HydrogenMassRepartition.rescale_timestep(self.production.input)
+
+
+def test_hmr_step_swaps_topology():
+    with ChangeToTemporaryDirectory():
+        md = HmrProtocol(Path.cwd())
+        md.run()
+        assert md.sander.prmtop == Path("1_hmr/frame.hmr.prmtop")
+        assert "-O" in md.hmr.parmed.exe.args and "--override" not in md.hmr.parmed.exe.args  # ParmEd --overwrite
+        assert Path("1_hmr/parmed.in").read_text().splitlines() == [
+            "HMassRepartition 3.024000", "outparm 1_hmr/frame.hmr.prmtop"
+        ]
+        assert Path("2_prod/prod.out").is_file()
+        assert dict(md.production.input.cntrl) == dict(imin=0, nstlim=500, dt=0.004, ntc=2, ntf=2, ntpr=50, ntwx=250)
+
+
+def test_rescale_timestep():
+    heat, minimize = AmberInput(), AmberInput()
+    heat.cntrl(imin=0, nstlim=10000, dt=0.002, ntc=2, ntpr=100, ntwx=0)
+    heat.varying_conditions.add(type="TEMP0", istep1=0, istep2=9000, value1=0.0, value2=300.0)
+    heat.varying_conditions.add(type="TEMP0", istep1=9001, istep2=10000, value1=300.0, value2=300.0)
+    minimize.cntrl(imin=1, maxcyc=100)
+
+    HydrogenMassRepartition.rescale_timestep(heat, minimize)
+    assert (heat.cntrl["nstlim"], heat.cntrl["dt"], heat.cntrl["ntpr"], heat.cntrl["ntwx"]) == (5000, 0.004, 50, 0)
+    assert [(wt["istep1"], wt["istep2"]) for wt in heat.varying_conditions.wts] == [(0, 4500), (4501, 5000)]
+    assert dict(minimize.cntrl) == dict(imin=1, maxcyc=100)
+
+    with pytest.raises(RuntimeError, match="exceeds"):
+        HydrogenMassRepartition.rescale_timestep(heat)
+    no_shake = AmberInput()
+    no_shake.cntrl(imin=0, nstlim=100, dt=0.002)
+    with pytest.raises(RuntimeError, match="SHAKE"):
+        HydrogenMassRepartition.rescale_timestep(no_shake)
+    odd = AmberInput()
+    odd.cntrl(imin=0, nstlim=101, dt=0.001, ntc=2)
+    with pytest.raises(RuntimeError, match="nstlim"):
+        HydrogenMassRepartition.rescale_timestep(odd)
+    assert odd.cntrl["dt"] == 0.001
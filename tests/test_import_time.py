@@ -0,0 +1,35 @@
+import subprocess
+import sys
+from typing import Dict
+
+# Budgets are generous to tolerate slow CI filesystems, regressions from heavy imports are an order of magnitude
+LIGHTWEIGHT_MODULES_BUDGET_US = 150_000
+HEAVY = ["remote_runner", "paramiko", "dill", "numpy", "netCDF4"]
+
+
+def import_times(statement: str) -> Dict[str, int]:
+    """ Cumulative import time (us) per module reported by `python -X importtime` """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", statement],
+                            stderr=subprocess.PIPE, check=True).stderr.decode()
+    result = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        result[name.strip()] = int(cumulative)
+    return result
+
+
+def test_lightweight_modules_import_time():
+    modules = ["amber_runner.inputs", "amber_runner.executables", "amber_runner.health",
+               "amber_runner.registry", "amber_runner.trajectory", "amber_runner.cli"]
+    times = import_times("import " + ", ".join(modules))
+    for heavy in HEAVY:
+        assert heavy not in times
+    assert sum(times[module] for module in modules) < LIGHTWEIGHT_MODULES_BUDGET_US
+
+
+def test_md_import_defers_numerics():
+    times = import_times("import amber_runner.MD")
+    for heavy in ["numpy", "netCDF4"]:
+        assert heavy not in times
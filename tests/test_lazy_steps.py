@@ -0,0 +1,73 @@
+from pathlib import Path
+
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner.MD import MdProtocol, RepeatedSanderCall, Step, StepReference
+
+
+class Noop(Step):
+    def run(self, md: 'MdProtocol'):
+        pass
+
+
+class Segments(RepeatedSanderCall):
+    def run_segment(self, md: 'MdProtocol'):
+        pass
+
+
+class LazyProtocol(MdProtocol):
+    lazy_steps = True
+
+    def __init__(self, wd: Path, n_steps: int):
+        wd.mkdir()
+        super().__init__(name=wd.name, wd=wd)
+        for i in range(n_steps):
+            setattr(self, f"prepare{i}", Noop(f"prepare{i}"))
+        self.production = Segments("production", 5)
+        self.production.input.cntrl(nstlim=500000, dt=0.002)
+
+
+def steps_of(md: MdProtocol):
+    return md._MdProtocol__steps
+
+
+def test_steps_are_loaded_on_access():
+    with ChangeToTemporaryDirectory():
+        md = LazyProtocol(Path("P0").absolute(), 3)
+        md.save(md.wd / md.state_filename)
+        assert (md.wd / "3_production" / "step.dill").is_file()
+
+        loaded = MdProtocol.load(md.wd / md.state_filename)
+        assert all(isinstance(step, StepReference) for step in steps_of(loaded).values())
+        assert loaded.summary()["step"] == "prepare0"
+        assert not isinstance(steps_of(loaded)["prepare0"], StepReference)
+        assert isinstance(steps_of(loaded)["production"], StepReference)
+        assert loaded.summary()["total_ns"] == 5.0
+
+        assert loaded.production.input.namelist["cntrl"]["nstlim"] == 500000
+        assert loaded.production.step_dir == Path("3_production")
+
+
+def test_only_modified_steps_are_rewritten():
+    with ChangeToTemporaryDirectory():
+        md = LazyProtocol(Path("P0").absolute(), 3)
+        with ChangeDirectory(md.wd):
+            md.run()
+        mtimes = {path: path.stat().st_mtime_ns for path in md.wd.glob("*/step.dill")}
+        assert len(mtimes) == 4
+
+        loaded = MdProtocol.load(md.wd / md.state_filename)
+        assert loaded.summary()["status"] == "complete"
+        assert all(isinstance(step, StepReference) for step in steps_of(loaded).values())
+
+        loaded.production.number_of_steps = 7
+        with ChangeDirectory(loaded.wd):
+            loaded.checkpoint()
+        changed = [path.parent.name for path in md.wd.glob("*/step.dill") if path.stat().st_mtime_ns != mtimes[path]]
+        assert changed == ["3_production"]
+
+        resumed = MdProtocol.load(md.wd / md.state_filename)
+        assert (resumed.summary()["segment"], resumed.summary()["n_segments"]) == (5, 7)
+        with ChangeDirectory(resumed.wd):
+            resumed.run()
+        assert MdProtocol.load(md.wd / md.state_filename).summary()["simulated_ns"] == 7.0
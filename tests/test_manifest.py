@@ -0,0 +1,61 @@
+from pathlib import Path
+
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner.manifest import OutputManifest, file_digest
+from amber_runner.MD import MdProtocol, RepeatedSanderCall
+
+
+def test_changed_since_position():
+    with ChangeToTemporaryDirectory():
+        Path("out").mkdir()
+        Path("out/a.txt").write_text("a")
+        Path("out/b.txt").write_text("b")
+        manifest = OutputManifest(Path("manifest.jsonl"))
+        assert manifest.changed_since(0) == ([], 0)
+
+        manifest.record(Path("."), [Path("out/a.txt")], "step", segment=0)
+        records, position = manifest.changed_since(0)
+        assert [r["path"] for r in records] == [str(Path("out/a.txt"))]
+        assert records[0]["sha1"] == file_digest(Path("out/a.txt"))
+
+        Path("out/b.txt").write_text("bb")
+        manifest.record(Path("."), [Path("out/a.txt"), Path("out/b.txt")], "step", immutable=False)
+        records, position2 = manifest.changed_since(position)
+        assert [(r["path"], r["size"]) for r in records] == [(str(Path("out/b.txt")), 2)]
+        assert manifest.changed_since(position2) == ([], position2)
+
+        Path("out/a.txt").write_text("changed immutable file is not rescanned")
+        Path("out/a.txt").unlink()
+        records = OutputManifest(Path("manifest.jsonl")).scan(Path("."), Path("out"), "step")
+        assert [(r["path"], r.get("deleted", False), r["immutable"]) for r in records] == \
+               [(str(Path("out/a.txt")), True, True), (str(Path("out/b.txt")), False, True)]
+
+
+class Segments(RepeatedSanderCall):
+    def run_segment(self, md: 'MdProtocol'):
+        prefix = self.segment_prefix(self.current_step)
+        for extension in ["out", "nc", "rst7"]:
+            Path(f"{prefix}.{extension}").write_text(f"{self.current_step}")
+
+
+class ManifestProtocol(MdProtocol):
+    manifest_filename = "outputs.jsonl"
+
+    def __init__(self, wd: Path):
+        wd.mkdir()
+        super().__init__(name=wd.name, wd=wd)
+        self.production = Segments("production", 3)
+
+
+def test_protocol_records_segments():
+    with ChangeToTemporaryDirectory():
+        md = ManifestProtocol(Path("P0").absolute())
+        with ChangeDirectory(md.wd):
+            md.run()
+        manifest = OutputManifest(md.wd / "outputs.jsonl")
+        records, _ = manifest.read()
+        assert [(r["segment"], Path(r["path"]).name) for r in records] == [
+            (i, f"production{i:05d}.{extension}") for i in range(3) for extension in ["nc", "out", "rst7"]
+        ]
+        assert all(r["immutable"] for r in records)
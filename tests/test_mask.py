@@ -0,0 +1,155 @@
+import io
+import time
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+np = pytest.importorskip("numpy")
+
+from amber_runner.fake_engine import write_prmtop  # noqa: E402
+from amber_runner.inputs import AmberInput  # noqa: E402
+from amber_runner.mask import AtomSelector, MaskSyntaxError, index_ranges, mask_string, within  # noqa: E402
+from amber_runner.prmtop import Prmtop, parse_section  # noqa: E402
+
+RESIDUES = [
+    ("ALA", ["N", "H", "CA", "CB", "C", "O"], ["N", "H", "CX", "CT", "C", "O"]),
+    ("GLY", ["N", "H", "CA", "C", "O"], ["N", "H", "CX", "C", "O"]),
+    ("WAT", ["O", "H1", "H2"], ["OW", "HW", "HW"]),
+    ("WAT", ["O", "H1", "H2"], ["OW", "HW", "HW"]),
+    ("Na+", ["Na+"], ["Na+"]),
+]
+
+
+def write_topology(filename: Path):
+    names = [name for _, atoms, _ in RESIDUES for name in atoms]
+    types = [kind for _, _, kinds in RESIDUES for kind in kinds]
+    pointers = np.cumsum([1] + [len(atoms) for _, atoms, _ in RESIDUES[:-1]])
+
+    def section(flag, fmt, values, width, per_line):
+        lines = ["".join(values[i:i + per_line]) for i in range(0, len(values), per_line)]
+        return f"%FLAG {flag}\n%FORMAT({fmt})\n" + "\n".join(lines) + "\n"
+
+    text = "%VERSION  VERSION_STAMP = V0001.000\n"
+    text += section("POINTERS", "10I8", [f"{v:8d}" for v in [len(names)] + [0] * 10 + [len(RESIDUES)]], 8, 10)
+    text += section("ATOM_NAME", "20a4", [f"{v:<4}" for v in names], 4, 20)
+    text += section("CHARGE", "5E16.8", [f"{v * 18.2223:16.8E}" for v in np.linspace(-1, 1, len(names))], 16, 5)
+    text += section("RESIDUE_LABEL", "20a4", [f"{v:<4}" for v, _, _ in RESIDUES], 4, 20)
+    text += section("RESIDUE_POINTER", "10I8", [f"{v:8d}" for v in pointers], 8, 10)
+    text += section("AMBER_ATOM_TYPE", "20a4", [f"{v:<4}" for v in types], 4, 20)
+    filename.write_text(text)
+
+
+def test_parse_section():
+    assert parse_section(b"   1   2   3\n   4\n", 3, "I", 4).tolist() == [1, 2, 3, 4]
+    assert parse_section(b"   1   2\n   3   4\n", 3, "I", 4).tolist() == [1, 2, 3, 4]  # short lines
+    assert parse_section(b"-1.00000000E+00 2.50000000E-01\n", 5, "E", 16).tolist() == [-1.0, 0.25]
+    assert parse_section(b"CA  H1  O\n", 20, "a", 4).tolist() == [b"CA  ", b"H1  ", b"O   "]
+    assert parse_section(b"\n", 10, "I", 8).tolist() == []
+
+
+def test_prmtop_sections_are_parsed_lazily():
+    with ChangeToTemporaryDirectory():
+        write_topology(Path("system.prmtop"))
+        with Prmtop(Path("system.prmtop")) as top:
+            assert top.flags == ["POINTERS", "ATOM_NAME", "CHARGE", "RESIDUE_LABEL", "RESIDUE_POINTER",
+                                 "AMBER_ATOM_TYPE"]
+            assert top._cache == {}
+            assert top.n_atoms == 18 and top.n_residues == 5
+            assert top.atom_names[:3].tolist() == ["N", "H", "CA"]
+            assert top.residue_labels.tolist() == ["ALA", "GLY", "WAT", "WAT", "Na+"]
+            assert top.residue_index.tolist() == [0] * 6 + [1] * 5 + [2] * 3 + [3] * 3 + [4]
+            assert top.charges[[0, -1]] == pytest.approx([-1, 1])
+            assert set(top._cache) >= {"POINTERS", "ATOM_NAME", "RESIDUE_POINTER", "CHARGE"}
+            with pytest.raises(KeyError):
+                top.section("MASS")
+        assert top._data.closed
+        assert top.n_atoms == 18  # parsed sections outlive the mapping
+        with pytest.raises(ValueError, match="is closed"):
+            top.section("AMBER_ATOM_TYPE")
+
+
+@pytest.mark.parametrize("mask, expected", [
+    ("*", list(range(18))),
+    (":1-2@CA", [2, 8]),
+    (":ALA,GLY&@C*", [2, 3, 4, 8, 9]),
+    ("@CA,O", [2, 5, 8, 10, 11, 14]),
+    ("@1-3,18", [0, 1, 2, 17]),
+    ("@%HW", [12, 13, 15, 16]),
+    ("@%C?", [2, 3, 8]),
+    (":WAT@O", [11, 14]),
+    ("!:WAT", list(range(11)) + [17]),
+    ("!(:WAT|:1)", list(range(6, 11)) + [17]),
+    (":Na+", [17]),
+    ("@H*&!:WAT", [1, 7]),
+    (":3-4 & @H1 | :5", [12, 15, 17]),
+])
+def test_mask_selection(mask, expected):
+    with ChangeToTemporaryDirectory():
+        write_topology(Path("system.prmtop"))
+        assert AtomSelector(Prmtop(Path("system.prmtop"))).indices(mask).tolist() == expected
+
+
+@pytest.mark.parametrize("mask", ["", ":1&", "(:1", ":1)", "@CA & | :1", ":1,,2", "<@3.0"])
+def test_mask_syntax_errors(mask):
+    with ChangeToTemporaryDirectory():
+        write_topology(Path("system.prmtop"))
+        with pytest.raises(MaskSyntaxError):
+            AtomSelector(Prmtop(Path("system.prmtop"))).indices(mask)
+
+
+def test_distance_operators():
+    with ChangeToTemporaryDirectory():
+        write_topology(Path("system.prmtop"))
+        coordinates = np.zeros((18, 3))
+        coordinates[:, 0] = np.arange(18) * 1.5  # atoms on a line, 1.5 A apart
+        selector = AtomSelector(Prmtop(Path("system.prmtop")), coordinates)
+        assert selector.indices("@3<@3.0").tolist() == [0, 1, 2, 3, 4]
+        assert selector.indices("@3>@3.0").tolist() == list(range(5, 18))
+        assert selector.indices(":2@O<:2.0").tolist() == list(range(6, 14))  # GLY and first WAT
+        assert selector.indices("(:WAT<:1.6)&!:WAT").tolist() == list(range(6, 11)) + [17]
+        with pytest.raises(ValueError, match="requires coordinates"):
+            AtomSelector(selector.topology).indices("@1<@3.0")
+
+
+def test_within_matches_brute_force():
+    rng = np.random.RandomState(0)
+    coordinates = rng.uniform(0, 60, size=(5000, 3))
+    reference = coordinates[rng.choice(5000, 300, replace=False)]
+    distances = np.sqrt(((coordinates[:, None, :] - reference[None, :, :]) ** 2).sum(axis=2))
+    assert (within(coordinates, reference, 4.5) == (distances <= 4.5).any(axis=1)).all()
+    assert not within(coordinates, reference[:0], 4.5).any()
+
+
+def test_selection_feeds_group_selection_and_restraints():
+    with ChangeToTemporaryDirectory():
+        write_topology(Path("system.prmtop"))
+        selector = AtomSelector(Prmtop(Path("system.prmtop")))
+        indices = selector.indices("!:WAT")
+        assert index_ranges(indices) == [(1, 11), (18, 18)]
+        assert mask_string(indices) == "@1-11,18"
+        assert selector.atom_id(":2@CA") == 9
+        with pytest.raises(ValueError, match="selects 2 atoms"):
+            selector.atom_id("@CA")
+
+        inp = AmberInput()
+        inp.pin(AmberInput.GroupSelection.from_atoms("Solute", indices, weight=5.0))
+        with io.StringIO() as out:
+            inp.group_selections.write(out)
+            assert out.getvalue() == "Solute\n5.0\nATOM 1 11\nATOM 18 18\nEND\nEND\n"
+
+
+def test_million_atoms():
+    with ChangeToTemporaryDirectory():
+        write_prmtop(Path("water.prmtop"), 999_999, box=True)
+        coordinates = np.random.RandomState(0).uniform(0, 220, size=(999_999, 3))
+        selector = AtomSelector(Prmtop(Path("water.prmtop")), coordinates)
+        selector.indices(":1")  # parse sections
+
+        start = time.perf_counter()
+        oxygens = selector.indices(":1-100000@O | @%HW & :333333")
+        solvation_shell = selector.indices(":1-10<:5.0")
+        elapsed = time.perf_counter() - start
+        assert len(oxygens) == 100_002
+        assert len(solvation_shell) > 30 and len(solvation_shell) % 3 == 0
+        assert elapsed < 1.0  # a few tens of milliseconds in practice
@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+np = pytest.importorskip("numpy")
+
+from amber_runner.executables import PmemdCommand  # noqa: E402
+from amber_runner.fake_engine import fake_executable  # noqa: E402
+from amber_runner.MD import Build, MdProtocol, ParallelMMPBSA, RepeatedSanderCall  # noqa: E402
+from amber_runner.statistics import block_average  # noqa: E402
+
+
+class BindingProtocol(MdProtocol):
+    def __init__(self, wd: Path, chunk_frames: int):
+        super().__init__(name="binding", wd=wd)
+        self.sander = PmemdCommand()
+        self.sander.executable = fake_executable("pmemd")
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+        self.production = RepeatedSanderCall("prod", 3)
+        self.production.input.cntrl(imin=0, nstlim=100, dt=0.002, ntpr=50, ntwx=10)
+        self.mmpbsa = ParallelMMPBSA("mmpbsa", "production", chunk_frames=chunk_frames, max_concurrency=3)
+        self.mmpbsa.mmpbsa.exe.executable = fake_executable("mmpbsa")
+        self.mmpbsa.mmpbsa.exe.complex_prmtop = "0_build/frame.prmtop"
+        self.mmpbsa.mmpbsa.input.gb(igb=5, saltcon=0.1)
+
+
+def test_chunked_mmpbsa_matches_serial():
+    with ChangeToTemporaryDirectory():
+        Path("chunked").mkdir()
+        Path("serial").mkdir()
+        chunked = BindingProtocol(Path("chunked").absolute(), chunk_frames=4)
+        serial = BindingProtocol(Path("serial").absolute(), chunk_frames=1000)
+        for md in [chunked, serial]:
+            with ChangeDirectory(md.wd):
+                md.run()
+
+        deltas = np.load("chunked/2_mmpbsa/deltas.npy")
+        assert deltas.shape == (30, 1)
+        assert np.array_equal(deltas, np.load("serial/2_mmpbsa/deltas.npy"))
+        assert len(list(Path("chunked/2_mmpbsa").glob("chunk*/done"))) == 9  # 3 segments x (4 + 4 + 2 frames)
+
+        results = json.loads(Path("chunked/2_mmpbsa/mmpbsa.json").read_text())
+        assert results["gb"]["frames"] == 30
+        assert (results["gb"]["mean"], results["gb"]["sem"]) == pytest.approx(block_average(deltas[:, 0]))
+
+
+def test_finished_chunks_are_not_recomputed():
+    with ChangeToTemporaryDirectory():
+        md = BindingProtocol(Path.cwd(), chunk_frames=4)
+        md.run()
+        outputs = sorted(Path("2_mmpbsa").glob("chunk*/per_frame.csv"))
+        mtimes = [path.stat().st_mtime_ns for path in outputs]
+        Path("2_mmpbsa/chunk00004/done").unlink()
+        Path("2_mmpbsa/chunk00004/per_frame.csv").unlink()
+        md.mmpbsa.is_complete = False
+        md.run()
+        changed = [path.parent.name for path, mtime in zip(outputs, mtimes) if path.stat().st_mtime_ns != mtime]
+        assert changed == ["chunk00004"]
+        assert not np.isnan(np.load("2_mmpbsa/deltas.npy")).any()
+
+
+def test_block_average():
+    values = np.repeat([1.0, 2.0, 3.0, 4.0, 5.0], 10)
+    mean, sem = block_average(values, n_blocks=5)
+    assert mean == 3.0
+    assert sem == pytest.approx(np.std([1, 2, 3, 4, 5], ddof=1) / np.sqrt(5))
@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner import cli
+from amber_runner.engines import EngineSelector
+from amber_runner.executables import PmemdCommand
+from amber_runner.fake_engine import fake_executable
+from amber_runner.inputs import FlatWelledParabola
+from amber_runner.MD import Build, MdProtocol, RepeatedSanderCall, SingleSanderCall, Step
+
+
+class Noop(Step):
+    def run(self, md: 'MdProtocol'):
+        pass
+
+
+class Campaign(MdProtocol):
+    def __init__(self, wd: Path, broken: bool = False):
+        wd.mkdir(parents=True)
+        super().__init__(name=wd.name, wd=wd)
+        self.sander = PmemdCommand()
+        self.sander.executable = fake_executable("pmemd")
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+        self.build.tleap.input.load_pdb("input.pdb")
+        self.heat = SingleSanderCall("heat")
+        self.heat.input.cntrl(imin=0, nstlim=5000, dt=0.002, ntpr=500, nmropt=0 if broken else 1)
+        self.heat.input.restraints.distance(1, 2, FlatWelledParabola(0, 1, 2, 3, 10, 10))
+        self.analysis = Noop("analysis")
+        self.production = RepeatedSanderCall("prod", 3)
+        self.production.input.cntrl(imin=0, nstlim=50000, dt=0.002, ntpr=5000, ntwx=5000)
+        self.save(wd / self.state_filename)
+
+
+def test_plan_renders_steps_and_segments():
+    with ChangeToTemporaryDirectory():
+        md = Campaign(Path("P").absolute())
+        plan = md.plan()
+
+        assert plan.errors == []
+        assert [(call.step, call.segment) for call in plan.calls] == [
+            ("build", None), ("heat", None), ("analysis", None), ("prod", 0), ("prod", 1), ("prod", 2)]
+        assert plan.as_dict()["unplanned"] == ["analysis"]
+        heat, prod1 = plan.calls[1], plan.calls[4]
+        assert heat.cmd[heat.cmd.index("-i") + 1] == "1_heat/heat.in"
+        assert prod1.cmd[prod1.cmd.index("-c") + 1] == "3_prod/prod00000.ncrst"
+        assert prod1.cmd[prod1.cmd.index("-p") + 1] == "0_build/frame.prmtop"
+        assert "saveamberparm frame 0_build/frame.prmtop" in plan.files[plan.calls[0].files["0_build/tleap.in"]]
+        assert "DISANG=1_heat/heat.in.disang" in plan.files[heat.files["1_heat/heat.in"]]
+        assert "iat=1,2" in plan.files[heat.files["1_heat/heat.in.disang"]]
+        assert len({call.files["3_prod/prod0000{}.in".format(call.segment)] for call in plan.calls[3:]}) == 1
+        assert plan.simulated_ns == pytest.approx(0.01 + 3 * 0.1)
+        assert plan.atoms is None
+
+        # protocol and its directory are untouched
+        assert md.sander.prmtop is None
+        assert sorted(path.name for path in md.wd.iterdir()) == ["state.dill"]
+        assert "DISANG" not in md.heat.input.file_redirections
+
+
+def test_plan_reports_errors():
+    with ChangeToTemporaryDirectory():
+        md = Campaign(Path("P").absolute(), broken=True)
+        md.sander.refc = "reference.rst7"
+        plan = md.plan()
+        assert plan.errors == [
+            "heat: missing input file reference.rst7",
+            "heat: RuntimeError: cntrl.nmropt>0 is required to use NMR restraints",
+        ] + [f"prod[{i}]: missing input file reference.rst7" for i in range(3)]
+
+        md.engine_selector = EngineSelector(which=lambda name: None)
+        assert md.plan().errors[0].startswith("heat: NoCompatibleEngineError")
+
+
+def test_plan_estimates_output_size_from_existing_topology():
+    with ChangeToTemporaryDirectory():
+        md = Campaign(Path("P").absolute())
+        md.build.tleap.input.commands.clear()
+        with ChangeDirectory(md.wd):
+            md.mkdir(md.build.step_dir)
+            md.build.run(md)
+            md.build.is_complete = True
+        plan = md.plan()
+        assert plan.atoms == 30
+        trajectory = 10 * (30 * 3 * 4 + 64)
+        assert plan.calls[-1].output_bytes == 8 * 1024 + 10 * 720 + 30 * 3 * 8 * 2 + trajectory
+
+
+def test_plan_campaign_cli(capsys):
+    with ChangeToTemporaryDirectory():
+        for i in range(3):
+            Campaign(Path(f"campaign/P{i}").absolute(), broken=i == 1)
+        assert cli.main(["plan", "campaign", "-j", "2"]) == 1
+        out = capsys.readouterr().out.splitlines()
+        assert [line.split()[:2] for line in out if not line.startswith(" ")][:3] == [
+            ["ok", "P0"], ["error", "P1"], ["ok", "P2"]]
+        assert out[2].strip() == "heat: RuntimeError: cntrl.nmropt>0 is required to use NMR restraints"
+        assert out[-1] == "total: 0.9 ns, 0.00 GB, 1 of 3 with errors"
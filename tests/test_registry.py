@@ -0,0 +1,94 @@
+import time
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner.MD import MdProtocol, RepeatedSanderCall, Step
+from amber_runner.registry import ProtocolRegistry
+
+
+class Noop(Step):
+    def run(self, md: 'MdProtocol'):
+        pass
+
+
+class Fail(Step):
+    def run(self, md: 'MdProtocol'):
+        raise RuntimeError("failed")
+
+
+class Segments(RepeatedSanderCall):
+    def run_segment(self, md: 'MdProtocol'):
+        pass
+
+
+class RegisteredProtocol(MdProtocol):
+    def __init__(self, wd: Path, registry: ProtocolRegistry, n_segments: int):
+        wd.mkdir()
+        super().__init__(name=wd.name, wd=wd)
+        self.registry = registry
+        self.prepare = Noop("prepare")
+        self.production = Segments("production", n_segments)
+
+
+def test_registry_upsert_and_select():
+    with ChangeToTemporaryDirectory():
+        registry = ProtocolRegistry(Path("registry.sqlite"))
+        registry.upsert(dict(wd="/a", name="a", status="running", step="production", segment=10, n_segments=500))
+        registry.upsert(dict(wd="/b", name="b", status="running", step="production", segment=200, n_segments=500))
+        registry.upsert(dict(wd="/c", name="c", status="running", step="heat", segment=None, n_segments=None))
+
+        assert [row["name"] for row in registry.select("step = ? AND segment < ?", ("production", 100))] == ["a"]
+
+        started = registry.get("/a")["started"]
+        registry.upsert(dict(wd="/a", name="a", status="complete", step=None))
+        row = registry.get("/a")
+        assert row["status"] == "complete"
+        assert row["started"] == started
+        assert row["last_interval"] >= 0
+
+        assert [row["name"] for row in registry.stuck(seconds=0)] == ["b", "c"]
+        assert registry.stuck(seconds=3600) == []
+
+
+def test_protocol_checkpoint_updates_registry():
+    with ChangeToTemporaryDirectory():
+        registry = ProtocolRegistry(Path("registry.sqlite"))
+        md = RegisteredProtocol(Path("P0").absolute(), registry, 3)
+        with ChangeDirectory(md.wd):
+            md.run()
+        row = registry.get(md.wd)
+        assert row["status"] == "complete"
+        assert row["n_steps"] == 2
+
+        md.production.number_of_steps = 5
+        with ChangeDirectory(md.wd):
+            md.checkpoint()
+        row = registry.get(md.wd)
+        assert (row["status"], row["step"], row["step_index"], row["segment"]) == ("running", "production", 1, 3)
+        assert MdProtocol.load(md.wd / md.state_filename).registry.path == registry.path
+
+
+def test_failed_protocol_is_marked():
+    with ChangeToTemporaryDirectory():
+        registry = ProtocolRegistry(Path("registry.sqlite"))
+        md = RegisteredProtocol(Path("P0").absolute(), registry, 3)
+        md.fail = Fail("fail")
+        with pytest.raises(RuntimeError), ChangeDirectory(md.wd):
+            md.run()
+        row = registry.get(md.wd)
+        assert (row["status"], row["step"]) == ("failed", "fail")
+
+
+def test_select_is_fast():
+    with ChangeToTemporaryDirectory():
+        registry = ProtocolRegistry(Path("registry.sqlite"))
+        with registry.connect() as connection:
+            connection.executemany(
+                "INSERT INTO protocols (wd, name, status, step, segment, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                [(f"/p{i}", f"p{i}", "running", "production", i % 1000, time.time()) for i in range(5000)])
+        start = time.perf_counter()
+        rows = registry.select("step = ? AND segment < ?", ("production", 100))
+        assert len(rows) == 500
+        assert time.perf_counter() - start < 1.0
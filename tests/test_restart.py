@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+np = pytest.importorskip("numpy")
+
+from amber_runner.executables import PmemdCommand  # noqa: E402
+from amber_runner.restart import Restart  # noqa: E402
+
+
+def make_restart(n_atoms=7, velocities=True, box=True):
+    rng = np.random.RandomState(0)
+    return Restart(coordinates=rng.uniform(-50, 50, size=(n_atoms, 3)),
+                   velocities=rng.normal(size=(n_atoms, 3)) if velocities else None,
+                   box=np.array([30.0, 31.0, 32.0, 109.47, 109.47, 109.47]) if box else None,
+                   time=12.5)
+
+
+@pytest.mark.parametrize("extension", ["rst7", "ncrst"])
+@pytest.mark.parametrize("velocities", [True, False])
+@pytest.mark.parametrize("box", [True, False])
+def test_round_trip(extension, velocities, box):
+    restart = make_restart(velocities=velocities, box=box)
+    with ChangeToTemporaryDirectory():
+        restart.write(Path(f"test.{extension}"))
+        loaded = Restart.read(Path(f"test.{extension}"))
+
+        assert loaded.n_atoms == restart.n_atoms
+        assert loaded.time == pytest.approx(restart.time)
+        assert np.allclose(loaded.coordinates, restart.coordinates, atol=1e-7)
+        if velocities:
+            assert np.allclose(loaded.velocities, restart.velocities, atol=1e-7)
+        else:
+            assert loaded.velocities is None
+        if box:
+            assert np.allclose(loaded.box, restart.box)
+        else:
+            assert loaded.box is None
+
+
+def test_rst7_arrays_are_views():
+    with ChangeToTemporaryDirectory():
+        make_restart().write("test.rst7")
+        loaded = Restart.read("test.rst7")
+        assert loaded.coordinates.base is loaded.velocities.base
+
+
+def test_ncrst_modify_in_place():
+    with ChangeToTemporaryDirectory():
+        make_restart().write("test.ncrst")
+        loaded = Restart.read("test.ncrst", mode="r+")
+        assert isinstance(loaded.coordinates, np.memmap)
+        loaded.velocities *= 0.5
+        loaded.coordinates.flush()
+        loaded.velocities.flush()
+        del loaded
+
+        assert np.allclose(Restart.read("test.ncrst").velocities, make_restart().velocities * 0.5)
+
+
+def test_ncrst_box_views():
+    with ChangeToTemporaryDirectory():
+        make_restart().write("test.ncrst")
+        loaded = Restart.read("test.ncrst", mode="r+")
+        assert isinstance(loaded.cell_lengths, np.memmap) and isinstance(loaded.cell_angles, np.memmap)
+        loaded.box[:3] = 0.0  # box is a copy
+        loaded.cell_lengths[:] = [40.0, 41.0, 42.0]
+        loaded.cell_lengths.flush()
+        del loaded
+
+        assert np.allclose(Restart.read("test.ncrst").box, [40.0, 41.0, 42.0, 109.47, 109.47, 109.47])
+
+
+def test_writer_follows_restrt_extension():
+    sander = PmemdCommand()
+    with ChangeToTemporaryDirectory():
+        with open(sander.input, "w") as f:
+            f.write("&cntrl\n    ioutfm = 0\n/\n")
+        restart = make_restart()
+        restart.write(sander.restrt, sander.restrt_extension)
+        assert sander.restrt == "run.rst7"
+        assert Path("run.rst7").read_bytes()[:3] != b"CDF"
+
+    with pytest.raises(RuntimeError, match="Unknown restart format"):
+        restart.write("test.xyz")
@@ -0,0 +1,76 @@
+import gzip
+from pathlib import Path
+
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner.manifest import OutputManifest
+from amber_runner.MD import MdProtocol, RepeatedSanderCall
+from amber_runner.retention import RetentionPolicy
+
+
+class Segments(RepeatedSanderCall):
+    retention = RetentionPolicy(restart_every=3, keep_last=2, delete=("mdinfo",))
+
+    def run_segment(self, md: 'MdProtocol'):
+        prefix = self.segment_prefix(self.current_step)
+        for extension in ["in", "out", "mdinfo", "rst7"]:
+            Path(f"{prefix}.{extension}").write_text(f"{extension} {self.current_step}\n")
+        md.sander.inpcrd = f"{prefix}.rst7"
+
+
+class RetentionProtocol(MdProtocol):
+    def __init__(self, wd: Path):
+        wd.mkdir()
+        super().__init__(name=wd.name, wd=wd)
+        self.production = Segments("prod", 7)
+        self.sander.refc = str(self.production.segment_prefix(1)) + ".rst7"
+
+
+def test_retention_policy():
+    with ChangeToTemporaryDirectory():
+        md = RetentionProtocol(Path("P0").absolute())
+        with ChangeDirectory(md.wd):
+            md.run()
+        files = sorted(path.name for path in (md.wd / md.production.step_dir).iterdir())
+
+        def segment(i):
+            return [name for name in files if name.startswith(f"prod{i:05d}.")]
+
+        assert segment(0) == ["prod00000.in", "prod00000.out.gz"]
+        assert segment(1) == ["prod00001.in", "prod00001.out.gz", "prod00001.rst7"]  # reference coordinates
+        assert segment(2) == ["prod00002.in", "prod00002.out.gz", "prod00002.rst7"]  # every 3rd
+        assert segment(4) == ["prod00004.in", "prod00004.out.gz"]
+        assert segment(6) == ["prod00006.in", "prod00006.mdinfo", "prod00006.out", "prod00006.rst7"]
+        assert md.production.retention_position == 5
+
+        with gzip.open(str(md.wd / md.production.step_dir / "prod00004.out.gz"), "rt") as f:
+            assert f.read() == "out 4\n"
+        assert md.production._mdout_mtime(md.wd, 0) <= md.production._mdout_mtime(md.wd, 6)
+
+
+class ManifestSegments(Segments):
+    def run_segment(self, md: 'MdProtocol'):
+        super().run_segment(md)
+        if self.current_step == 5:
+            self.retention.wait()
+            self.snapshot = OutputManifest(md.wd / md.manifest_filename).changed_since(0)[0]
+
+
+class ManifestRetentionProtocol(RetentionProtocol):
+    manifest_filename = "outputs.jsonl"
+
+    def __init__(self, wd: Path):
+        super().__init__(wd)
+        self.production = ManifestSegments("prod", 7)
+
+
+def test_retention_is_recorded_to_manifest_during_step():
+    with ChangeToTemporaryDirectory():
+        md = ManifestRetentionProtocol(Path("P0").absolute())
+        with ChangeDirectory(md.wd):
+            md.run()
+        latest = {Path(record["path"]).name: record for record in md.production.snapshot}
+        assert latest["prod00000.out"]["deleted"] and latest["prod00000.rst7"]["deleted"]
+        assert latest["prod00000.mdinfo"]["deleted"]
+        assert (latest["prod00000.out.gz"]["segment"], latest["prod00000.out.gz"].get("deleted")) == (0, None)
+        assert not latest["prod00002.rst7"].get("deleted")  # every 3rd restart is kept
@@ -0,0 +1,122 @@
+import io
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner.executables import PmemdCommand
+from amber_runner.fake_engine import fake_executable
+from amber_runner.inputs import AmberInput, FlatWelledParabola
+from amber_runner.MD import Build, MdProtocol, ScheduledSanderCall
+from amber_runner.schedule import RestraintSchedule, piecewise_linear
+
+
+def disang(inp: AmberInput) -> str:
+    with io.StringIO() as out:
+        inp.restraints.write(out)
+        return out.getvalue()
+
+
+def test_piecewise_linear():
+    keyframes = {100: 0.0, 200: 10.0}
+    interpolate = lambda a, b, f: a + (b - a) * f  # noqa: E731
+    assert piecewise_linear(keyframes, 0, 300, interpolate) == [
+        (0, 100, 0.0, 0.0), (101, 200, 0.1, 10.0), (201, 300, 10.0, 10.0)]
+    assert piecewise_linear(keyframes, 150, 300, interpolate) == [(0, 50, 5.0, 10.0), (51, 150, 10.0, 10.0)]
+    assert piecewise_linear({0: 1.0}, 0, 10, interpolate) == [(0, 10, 1.0, 1.0)]
+
+
+def test_steered_pull_compiles_into_single_run():
+    schedule = RestraintSchedule(10000)
+    schedule.distance(240, 12, {0: FlatWelledParabola(0, 5, 5, 99, 10, 10),
+                                5000: FlatWelledParabola(0, 15, 15, 99, 10, 10),
+                                10000: FlatWelledParabola(0, 15, 15, 99, 0, 0)})
+    schedule.angle(1, 2, 3, {0: FlatWelledParabola(0, 90, 90, 180, 5, 5)})
+    schedule.scale({0: 0.0, 1000: 1.0})
+    runs = schedule.compile()
+    assert len(runs) == 1
+
+    inp = runs[0].input(AmberInput(), continuation=False)
+    assert inp.cntrl["nstlim"] == 10000 and inp.cntrl["nmropt"] == 1 and "irest" not in inp.cntrl
+    assert disang(inp) == """
+&rst  !
+     iat=12,240, r1=0, r2=5, r3=5, r4=99,
+     rk2=10, rk3=10,
+     nstep1=0, nstep2=5000, ifvari=1,
+     r1a=0, r2a=15, r3a=15, r4a=99, rk2a=10, rk3a=10
+&end
+
+&rst  !
+     iat=12,240, r1=0.0, r2=15.0, r3=15.0, r4=99.0,
+     rk2=9.998, rk3=9.998,
+     nstep1=5001, nstep2=10000, ifvari=1,
+     r1a=0, r2a=15, r3a=15, r4a=99, rk2a=0, rk3a=0
+&end
+
+&rst  !
+     iat=1,2,3, r1=0, r2=90, r3=90, r4=180,
+     rk2=5, rk3=5
+&end
+"""
+    assert [(wt["istep1"], wt["istep2"], wt["value1"], wt["value2"]) for wt in inp.varying_conditions.wts] == [
+        (0, 1000, 0.0, 1.0), (1001, 10000, 1.0, 1.0)]
+
+
+def test_restraint_weight_and_run_limit_split_schedule():
+    schedule = RestraintSchedule(1000, max_run_steps=400)
+    schedule.distance(1, 2, {0: FlatWelledParabola(0, 1, 1, 9, 10, 10), 1000: FlatWelledParabola(0, 3, 3, 9, 10, 10)})
+    schedule.restraint_weight(0, 5.0).restraint_weight(500, 0.0)
+    runs = schedule.compile()
+    assert [(run.first_step, run.nstlim, run.restraint_wt) for run in runs] == [
+        (0, 400, 5.0), (400, 100, 5.0), (500, 300, 0.0), (800, 200, 0.0)]
+
+    base = AmberInput()
+    base.cntrl(imin=0, ntr=1, restraintmask=":1-5")
+    inp = runs[2].input(base, continuation=True)
+    assert (inp.cntrl["irest"], inp.cntrl["ntx"], inp.cntrl["restraint_wt"]) == (1, 5, 0.0)
+    penalty, = inp.restraints[(1, 2)]
+    assert (penalty.nstep1, penalty.nstep2, penalty.r2, penalty.end.r2) == (0, 300, 2.0, 2.6)
+    assert base.restraints == {} and "nstlim" not in base.cntrl
+
+    with pytest.raises(ValueError, match="outside of 0..1000"):
+        schedule.restraint_weight(2000, 1.0).compile()
+
+
+def test_scheduled_sander_call_runs_and_resumes():
+    class Pull(MdProtocol):
+        def __init__(self, wd: Path):
+            wd.mkdir()
+            super().__init__(name=wd.name, wd=wd)
+            self.sander = PmemdCommand()
+            self.sander.executable = fake_executable("pmemd")
+            self.build = Build("build")
+            self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+            self.pull = ScheduledSanderCall("pull", nstlim=1000)
+            self.pull.input.cntrl(imin=0, dt=0.002, ntr=1, restraintmask=":1")
+            self.pull.schedule.distance(1, 2, {0: FlatWelledParabola(0, 1, 1, 9, 10, 10),
+                                               1000: FlatWelledParabola(0, 3, 3, 9, 10, 10)})
+            self.pull.schedule.restraint_weight(0, 5.0).restraint_weight(600, 1.0)
+
+    with ChangeToTemporaryDirectory():
+        md = Pull(Path("P").absolute())
+        plan = md.plan()
+        assert plan.errors == []
+        assert [call.segment for call in plan.calls if call.step == "pull"] == [0, 1]
+
+        with ChangeDirectory(md.wd):
+            md.mkdir(md.build.step_dir)
+            md.build.run(md)
+            md.mkdir(md.pull.step_dir)
+            pull = md.pull
+            pull.run(md)
+            assert pull.current_run == 2
+            second = Path(f"{pull.segment_prefix(1)}.in").read_text()
+            assert "nstlim = 400" in second and "irest = 1" in second and "restraint_wt = 1.0" in second
+            assert "nstep1=0, nstep2=400, ifvari=1" in Path(f"{pull.segment_prefix(1)}.in.disang").read_text()
+            assert md.sander.inpcrd == f"{pull.segment_prefix(1)}.ncrst"
+            pull.run(md)  # nothing left to run
+            assert not Path(f"{pull.segment_prefix(2)}.in").exists()
+
+            pull.input.varying_conditions.add(type="TEMP0", istep1=0, istep2=1000, value1=0.0, value2=300.0)
+            with pytest.raises(ValueError, match="can't be split into 2 runs"):
+                pull.compile()
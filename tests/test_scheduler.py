@@ -0,0 +1,137 @@
+import time
+from pathlib import Path
+
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner.MD import MdProtocol, RepeatedSanderCall, Step
+from amber_runner.scheduler import SegmentQueue, SegmentWorker, run_local_workers
+
+
+class Log(Step):
+    def run(self, md: 'MdProtocol'):
+        with Path(md.wd / "log.txt").open("a") as out:
+            out.write(f"{self.name}\n")
+
+
+class Fail(Step):
+    def run(self, md: 'MdProtocol'):
+        raise ValueError("broken input")
+
+
+class Slow(Step):
+    """ Runs longer than `requeue_stale()` limit and checks the unit is not requeued meanwhile """
+
+    def run(self, md: 'MdProtocol'):
+        time.sleep(0.5)
+        queue = SegmentQueue(Path("../queue.sqlite"))
+        with Path(md.wd / "log.txt").open("a") as out:
+            out.write(f"requeued:{queue.requeue_stale(0.2)}\n")
+
+
+class Segments(RepeatedSanderCall):
+    def run_segment(self, md: 'MdProtocol'):
+        with Path(md.wd / "log.txt").open("a") as out:
+            out.write(f"{self.name}:{self.current_step}\n")
+
+
+class Chain(MdProtocol):
+    def __init__(self, wd: Path, n_segments: int, fail: bool = False):
+        wd.mkdir()
+        super().__init__(name=wd.name, wd=wd)
+        self.prepare = Log("prepare")
+        self.production = Segments("production", n_segments)
+        if fail:
+            self.analysis = Fail("analysis")
+        self.save(wd / self.state_filename)
+
+
+def test_next_unit_and_run_unit():
+    with ChangeToTemporaryDirectory():
+        md = Chain(Path("P").absolute(), 2)
+        assert md.next_unit() == dict(step="prepare", segment=None, remaining=3)
+        with ChangeDirectory(md.wd):
+            md.run_unit()
+            assert md.next_unit() == dict(step="production", segment=0, remaining=2)
+            md.run_unit()
+            md.run_unit()
+            assert md.next_unit() is None
+            md.run_unit()  # no-op for complete protocol
+        assert (md.wd / "log.txt").read_text().split() == ["prepare", "production:0", "production:1"]
+        assert MdProtocol.load(md.wd / "state.dill").next_unit() is None  # checkpointed after each unit
+
+
+def test_queue_claims_longest_chain_first():
+    with ChangeToTemporaryDirectory():
+        queue = SegmentQueue(Path("queue.sqlite"))
+        for name, n in [("A", 1), ("B", 5), ("C", 1)]:
+            md = Chain(Path(name).absolute(), n)
+            if name == "C":
+                with ChangeDirectory(md.wd):
+                    md.run()
+            queue.add(md.wd / "state.dill")
+        assert queue.counts() == {"ready": 2, "done": 1}
+
+        unit = queue.claim("w0")
+        assert Path(unit["state"]).parent.name == "B"
+        assert queue.claim("w1")["step"] == "prepare"
+        assert queue.claim("w2") is None  # one unit per protocol at a time
+
+        queue.complete(unit["state"], "w0", dict(step="production", segment=0, remaining=5))
+        assert queue.counts() == {"ready": 1, "running": 1, "done": 1}
+
+
+def test_local_workers_drain_heterogeneous_ensemble():
+    with ChangeToTemporaryDirectory():
+        queue = SegmentQueue(Path("queue.sqlite"))
+        lengths = [7, 1, 3, 2, 5]
+        protocols = [Chain(Path(f"P{i}").absolute(), n) for i, n in enumerate(lengths)]
+        protocols.append(Chain(Path("F").absolute(), 2, fail=True))
+        for md in protocols:
+            queue.add(md.wd / md.state_filename)
+
+        run_local_workers(queue, 3, poll_interval=0.05)
+
+        statuses = {Path(row["state"]).parent.name: row["status"] for row in queue.units()}
+        assert statuses == {**{f"P{i}": "done" for i in range(len(lengths))}, "F": "failed"}
+        assert "broken input" in next(row["error"] for row in queue.units() if row["status"] == "failed")
+        for md, n in zip(protocols, lengths):
+            assert (md.wd / "log.txt").read_text().split() == ["prepare"] + [f"production:{i}" for i in range(n)]
+            assert MdProtocol.load(md.wd / md.state_filename).next_unit() is None
+        assert MdProtocol.load(protocols[-1].wd / "state.dill").next_unit()["step"] == "analysis"
+
+        assert SegmentWorker(queue, "late").run() == 0  # nothing left
+
+
+def test_heartbeat_keeps_long_unit_from_being_requeued():
+    with ChangeToTemporaryDirectory():
+        queue = SegmentQueue(Path("queue.sqlite"))
+        md = Chain(Path("P").absolute(), 1)
+        md.prepare = Slow("prepare")
+        md.save(md.wd / md.state_filename)
+        queue.add(md.wd / md.state_filename)
+        assert SegmentWorker(queue, "w0", heartbeat_interval=0.05).run() == 2
+        assert (md.wd / "log.txt").read_text().split() == ["requeued:0", "production:0"]
+
+        queue.add(md.wd / md.state_filename)
+        queue._execute("UPDATE units SET status = 'running', worker = 'dead', heartbeat = ?", (time.time() - 10,))
+        assert queue.requeue_stale(5) == 1
+        assert queue.units()[0]["status"] == "ready"
+
+
+def test_stale_worker_cannot_complete_requeued_unit():
+    with ChangeToTemporaryDirectory():
+        queue = SegmentQueue(Path("queue.sqlite"))
+        md = Chain(Path("P").absolute(), 3)
+        queue.add(md.wd / md.state_filename)
+        state = queue.claim("stale")["state"]
+        queue._execute("UPDATE units SET heartbeat = ?", (time.time() - 10,))
+        assert queue.requeue_stale(5) == 1
+        assert queue.claim("w1")["worker"] == "w1"
+
+        assert not queue.complete(state, "stale", dict(step="production", segment=0, remaining=3))
+        assert not queue.fail(state, "stale", "RuntimeError: late")
+        row, = queue.units()
+        assert (row["status"], row["worker"], row["step"], row["error"]) == ("running", "w1", "prepare", None)
+
+        assert queue.complete(state, "w1", dict(step="production", segment=0, remaining=3))
+        assert queue.units()[0]["status"] == "ready"
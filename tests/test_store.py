@@ -0,0 +1,99 @@
+import os
+from pathlib import Path
+
+from remote_runner.utility import ChangeDirectory, ChangeToTemporaryDirectory
+
+from amber_runner.executables import PmemdCommand
+from amber_runner.fake_engine import fake_executable
+from amber_runner.inputs import AmberInput, FlatWelledParabola
+from amber_runner.MD import Build, CommandWithInput, MdProtocol, RepeatedSanderCall
+from amber_runner.store import InputStore
+
+
+def test_put_and_link():
+    with ChangeToTemporaryDirectory():
+        store = InputStore(Path("store"))
+        stored = store.put("text")
+        assert stored == store.put("text") and stored.read_text() == "text"
+        assert stored.parent.parent == Path("store") and stored.stat().st_mode & 0o222 == 0
+        assert len(list(Path("store").rglob("*"))) == 2  # directory and file
+
+        Path("run.in").write_text("old")
+        store.link(stored, Path("run.in"))
+        store.link(stored, Path("run.in"))
+        assert os.path.samefile("run.in", stored) and os.stat(stored).st_nlink == 2
+
+
+def test_unchanged_input_is_rendered_once(monkeypatch):
+    calls = []
+    render = AmberInput.render
+    monkeypatch.setattr(AmberInput, "render", lambda self, filename: calls.append(filename) or render(self, filename))
+    with ChangeToTemporaryDirectory():
+        store = InputStore(Path("store").absolute())
+        inp = AmberInput()
+        inp.cntrl(imin=0, nstlim=1000, nmropt=1)
+        inp.restraints.distance(1, 2, FlatWelledParabola(0, 1, 2, 3, 10, 10))
+        for i in range(3):
+            files = store.write(inp, Path(f"md{i}.in"))
+        assert calls == ["md0.in"]
+        assert sorted(files) == ["md0.in.disang", "md2.in"]
+        assert "DISANG=md0.in.disang" in Path("md2.in").read_text()
+
+        inp.cntrl(nstlim=2000)
+        store.write(inp, Path("md3.in"))
+        assert calls == ["md0.in", "md3.in"]
+        assert len([path for path in Path("store").rglob("*") if path.is_file()]) == 3  # two mdin, one DISANG
+
+
+def test_default_disang_name_follows_input_file():
+    with ChangeToTemporaryDirectory():
+        store = InputStore(Path("store").absolute())
+        for directory in ["A", "B"]:
+            Path(directory).mkdir()
+            inp = AmberInput()
+            inp.cntrl(imin=0, nmropt=1)
+            inp.restraints.distance(1, 2, FlatWelledParabola(0, 1, 2, 3, 10, 10))
+            files = store.write(inp, Path(directory, "md.in"))
+            assert sorted(files) == [f"{directory}/md.in", f"{directory}/md.in.disang"]
+            assert f"DISANG={directory}/md.in.disang" in Path(directory, "md.in").read_text()
+
+        class Exe:
+            input = "B/md.in"
+
+            def run(self):
+                pass
+
+        CommandWithInput(Exe(), inp).run()  # plain write replaces links instead of changing stored files
+        assert not os.path.samefile("B/md.in", files["B/md.in"])
+        assert not os.path.samefile("B/md.in.disang", files["B/md.in.disang"])
+
+
+class Production(MdProtocol):
+    def __init__(self, wd: Path):
+        wd.mkdir()
+        super().__init__(name=wd.name, wd=wd)
+        self.sander = PmemdCommand()
+        self.sander.executable = fake_executable("pmemd")
+        self.build = Build("build")
+        self.build.tleap.exe.executable = fake_executable("tleap", atoms=30)
+        self.production = RepeatedSanderCall("prod", 3)
+        self.production.input.cntrl(imin=0, nstlim=100, dt=0.002, nmropt=1)
+        self.production.input.restraints.distance(1, 2, FlatWelledParabola(0, 1, 2, 3, 10, 10))
+
+
+def test_segments_of_sibling_protocols_share_stored_inputs():
+    with ChangeToTemporaryDirectory():
+        for name in ["A", "B"]:
+            md = Production(Path(name).absolute())
+            md.input_store = InputStore(Path("store").absolute())
+            with ChangeDirectory(md.wd):
+                for step in [md.build, md.production]:
+                    md.mkdir(step.step_dir)
+                    step.run(md)
+                    step.is_complete = True
+
+        inputs = [Path(name, "1_prod", f"prod{i:05d}.in") for name in "AB" for i in range(3)]
+        assert all(os.path.samefile(inputs[0], path) for path in inputs)
+        assert os.path.samefile("A/1_prod/prod00000.in.disang", "B/1_prod/prod00000.in.disang")
+        assert len([path for path in Path("store").rglob("*") if path.is_file()]) == 2
+        assert Path("A/1_prod/prod00002.out").exists()
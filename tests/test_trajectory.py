@@ -0,0 +1,167 @@
+from pathlib import Path
+
+import pytest
+from remote_runner.utility import ChangeToTemporaryDirectory
+
+from amber_runner.trajectory import FrameIndex, TrajectoryCompaction
+
+netCDF4 = pytest.importorskip("netCDF4")
+np = pytest.importorskip("numpy")
+
+
+def write_segment(filename: Path, n_frames: int, n_atoms: int, seed: int):
+    rng = np.random.RandomState(seed)
+    with netCDF4.Dataset(str(filename), "w", format="NETCDF3_64BIT_OFFSET") as nc:
+        nc.Conventions = "AMBER"
+        nc.ConventionVersion = "1.0"
+        nc.createDimension("frame", None)
+        nc.createDimension("spatial", 3)
+        nc.createDimension("atom", n_atoms)
+        nc.createVariable("time", "f4", ("frame",))[:] = np.arange(n_frames, dtype=float) + seed * n_frames
+        nc.createVariable("coordinates", "f4", ("frame", "atom", "spatial"))[:] = \
+            rng.uniform(-50, 50, size=(n_frames, n_atoms, 3))
+    return filename
+
+
+def test_compaction():
+    with ChangeToTemporaryDirectory():
+        segments = [(i, write_segment(Path(f"prod{i:05d}.nc"), 10, 7, i)) for i in range(5)]
+        originals = {i: netCDF4.Dataset(str(path)).variables["coordinates"][:] for i, path in segments}
+
+        compaction = TrajectoryCompaction(segments_per_archive=2, stride=2, precision=2)
+        compaction.submit(Path("prod.frames.json"), segments[:3], archive_prefix="prod")
+        compaction.wait()
+
+        index = FrameIndex(Path("prod.frames.json"))
+        assert index.files() == ["prod.00000-00001.nc", "prod00002.nc"]
+        assert not Path("prod00000.nc").exists()
+        assert Path("prod00002.nc").exists()
+
+        compaction.submit(Path("prod.frames.json"), segments, archive_prefix="prod", flush=True)
+        compaction.wait()
+
+        index = FrameIndex(Path("prod.frames.json"))
+        assert index.files() == ["prod.00000-00001.nc", "prod.00002-00003.nc", "prod.00004-00004.nc"]
+        assert list(Path(".").glob("prod0*.nc")) == []
+
+        for i in range(5):
+            record = index[i]
+            assert record["frames"] == 5
+            assert record["stride"] == 2
+            with netCDF4.Dataset(record["file"]) as nc:
+                stored = nc.variables["coordinates"][record["offset"]:record["offset"] + record["frames"]]
+                assert np.allclose(stored, originals[i][::2], atol=1e-2)
+
+
+def test_compaction_verifies_every_variable():
+    with ChangeToTemporaryDirectory():
+        segments = [(i, write_segment(Path(f"prod{i:05d}.nc"), 10, 7, i)) for i in range(2)]
+        for _, path in segments:
+            with netCDF4.Dataset(str(path), "a") as nc:
+                nc.createDimension("cell_spatial", 3)
+                nc.createVariable("cell_lengths", "f8", ("frame", "cell_spatial"))[:] = np.full((10, 3), 30.0)
+
+        compaction = TrajectoryCompaction(segments_per_archive=2, stride=2, precision=2, remove_originals=False)
+        compaction.submit(Path("prod.frames.json"), segments, archive_prefix="prod")
+        compaction.wait()
+        archive = Path("prod.00000-00001.nc")
+        offsets = [(0, 5), (5, 5)]
+        compaction.verify(archive, [path for _, path in segments], offsets)
+
+        with netCDF4.Dataset("prod00001.nc", "a") as nc:
+            nc.variables["cell_lengths"][4] = 31.0
+        with pytest.raises(RuntimeError, match="`cell_lengths` of prod00001.nc"):
+            compaction.verify(archive, [path for _, path in segments], offsets)
+
+
+def test_compaction_is_not_pickled_with_worker():
+    import dill
+    with ChangeToTemporaryDirectory():
+        segments = [(0, write_segment(Path("run00000.nc"), 3, 2, 0))]
+        compaction = TrajectoryCompaction(segments_per_archive=10)
+        compaction.submit(Path("run.frames.json"), segments, archive_prefix="run")
+        copy = dill.loads(dill.dumps(compaction))
+        compaction.wait()
+        assert copy._worker is None
+        assert FrameIndex(Path("run.frames.json"))[0]["archived"] is False
+
+
+def test_frame_index_appends_records():
+    with ChangeToTemporaryDirectory():
+        path = Path("run.frames.json")
+        path.write_text('[{"segment": 0, "file": "run00000.nc", "offset": 0, "frames": 3, "stride": 1, '
+                        '"archived": false}]')
+        index = FrameIndex(path)
+        index.add(1, "run00001.nc", frames=3)
+        index.save()  # list format is converted to JSON lines
+        assert len(path.read_text().splitlines()) == 2
+
+        index = FrameIndex(path)
+        index.add(1, "run.00000-00001.nc", offset=3, frames=3, archived=True)
+        index.save()
+        assert len(path.read_text().splitlines()) == 3
+        with path.open("a") as f:
+            f.write('{"segment": 2, "fi')  # interrupted append
+        index = FrameIndex(path)
+        assert index.files() == ["run.00000-00001.nc", "run00000.nc"]
+        assert index[1]["offset"] == 3
+        index.save()
+        assert len(path.read_text().splitlines()) == 2
+
+
+def test_repeated_call_submits_only_new_segments():
+    from amber_runner.MD import MdProtocol, RepeatedSanderCall
+
+    submitted = []
+
+    class Recording(TrajectoryCompaction):
+        def submit(self, index_path, segments, archive_prefix, flush=False, on_change=None):
+            submitted.append(([i for i, _ in segments], flush))
+            super().submit(index_path, segments, archive_prefix, flush, on_change)
+
+    class Segments(RepeatedSanderCall):
+        compaction = Recording(segments_per_archive=2)
+
+        def run_segment(self, md: 'MdProtocol'):
+            write_segment(Path(f"{self.segment_prefix(self.current_step)}.nc"), 3, 2, self.current_step)
+
+    class Protocol(MdProtocol):
+        def __init__(self, wd: Path):
+            super().__init__(name="compaction", wd=wd)
+            self.production = Segments("prod", 5)
+
+    with ChangeToTemporaryDirectory():
+        md = Protocol(Path.cwd())
+        md.run()
+        assert submitted == [([0], False), ([1], False), ([2], False), ([3], False), ([4], False), ([], True)]
+        index = FrameIndex(md.production.frame_index_path)
+        assert index.files() == ["prod.00000-00001.nc", "prod.00002-00003.nc", "prod.00004-00004.nc"]
+
+
+def test_compaction_is_recorded_to_manifest_during_step():
+    from amber_runner.manifest import OutputManifest
+    from amber_runner.MD import MdProtocol, RepeatedSanderCall
+
+    class Segments(RepeatedSanderCall):
+        compaction = TrajectoryCompaction(segments_per_archive=2)
+
+        def run_segment(self, md: 'MdProtocol'):
+            if self.current_step == 3:
+                self.compaction.wait()
+                self.snapshot = OutputManifest(md.wd / md.manifest_filename).changed_since(0)[0]
+            write_segment(Path(f"{self.segment_prefix(self.current_step)}.nc"), 3, 2, self.current_step)
+
+    class Protocol(MdProtocol):
+        manifest_filename = "outputs.jsonl"
+
+        def __init__(self, wd: Path):
+            super().__init__(name="compaction", wd=wd)
+            self.production = Segments("prod", 4)
+
+    with ChangeToTemporaryDirectory():
+        md = Protocol(Path.cwd())
+        md.run()
+        latest = {Path(record["path"]).name: record for record in md.production.snapshot}
+        assert latest["prod00000.nc"]["deleted"] and latest["prod00001.nc"]["deleted"]
+        assert not latest["prod.00000-00001.nc"].get("deleted")
+        assert not latest["prod00002.nc"].get("deleted")